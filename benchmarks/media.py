@@ -0,0 +1,36 @@
+"""Geração de vídeos sintéticos para os benchmarks (ffmpeg lavfi: testsrc2 + sine)."""
+import os
+import subprocess
+
+RESOLUTIONS = {
+    '360p': (640, 360),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+
+def generate_source(directory, resolution, duration, fps=30, gop=60):
+    """Gera (ou reaproveita do cache) um clipe com vídeo e áudio sintéticos"""
+    width, height = RESOLUTIONS[resolution]
+    path = os.path.join(directory, f'synthetic_{resolution}_{int(duration)}s.mp4')
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-g', str(gop), '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-shortest', path,
+    ], check=True)
+    return path
+
+
+def generate_matrix(directory, resolutions, durations):
+    """Gera todas as combinações resolução x duração"""
+    return [
+        {'resolution': resolution, 'duration': duration, 'path': generate_source(directory, resolution, duration)}
+        for resolution in resolutions
+        for duration in durations
+    ]
@@ -0,0 +1,262 @@
+"""Suite de benchmarks: processamento de vídeo, API e dispatch de jobs.
+
+Gera mídia sintética com ffmpeg lavfi, popula um banco temporário com volumes
+realistas e grava os resultados em JSON. Com --compare, compara contra um
+resultado anterior e sai com código 1 se alguma métrica piorar além do limite.
+
+    python benchmarks/run.py --output baseline.json
+    python benchmarks/run.py --output atual.json --compare baseline.json
+    python benchmarks/run.py --suite api --jobs 100000 --quick
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from media import generate_matrix  # noqa: E402
+from seed import seed_database  # noqa: E402
+
+SUITES = ('processing', 'api', 'dispatch', 'startup')
+
+
+def percentiles(samples_ms):
+    values = sorted(samples_ms)
+
+    def pick(q):
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+    return {
+        'p50': pick(0.50),
+        'p90': pick(0.90),
+        'p99': pick(0.99),
+        'mean': statistics.mean(values),
+    }
+
+
+def metric(value, unit, better):
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def make_app(work_dir, database_name):
+    from src.main import create_app
+
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(work_dir, database_name)}",
+        'MEDIA_ROOT': os.path.join(work_dir, 'media'),
+        'TRACE_EXPORTER': 'none',
+        'STORAGE_SWEEPER_ENABLED': False,
+        'RENDER_WORKER_ENABLED': False,
+        'TESTING': True,
+    })
+
+
+def bench_processing(args, work_dir):
+    """Throughput e fator de tempo real do process_video_cuts (todas as variantes, sem JIT)"""
+    from src.models.user import db
+    from src.models.schema import ensure_schema
+    from src.models.video import Video
+    from src.routes.videos import process_video_cuts
+
+    durations = [10] if args.quick else [10, 60, 600]
+    resolutions = ['360p'] if args.quick else ['360p', '720p', '1080p']
+    sources = generate_matrix(os.path.join(args.media_cache, 'sources'), resolutions, durations)
+
+    app = make_app(work_dir, 'processing.db')
+    app.config['JIT_RENDERING_ENABLED'] = False
+    metrics = {}
+    with app.app_context():
+        ensure_schema()
+        for source in sources:
+            video = Video(
+                original_filename=os.path.basename(source['path']),
+                file_path=source['path'],
+                cut_vertical=True,
+                cut_square=True,
+                cut_horizontal=True,
+            )
+            db.session.add(video)
+            db.session.commit()
+
+            start = time.perf_counter()
+            ok = process_video_cuts(video.id)
+            elapsed = time.perf_counter() - start
+            if not ok:
+                raise RuntimeError(f"process_video_cuts falhou para {source['path']}")
+
+            key = f"processing.{source['resolution']}_{source['duration']}s"
+            metrics[f'{key}.wall_s'] = metric(elapsed, 's', 'lower')
+            metrics[f'{key}.realtime_factor'] = metric(source['duration'] / elapsed, 'x', 'higher')
+            print(f"  {key}: {elapsed:.2f}s ({source['duration'] / elapsed:.2f}x tempo real)")
+    return metrics
+
+
+def seeded_app(args, work_dir):
+    from src.models.user import db
+    from src.models.schema import ensure_schema
+
+    app = make_app(work_dir, 'seeded.db')
+    with app.app_context():
+        ensure_schema()
+        start = time.perf_counter()
+        seed_database(db, accounts=args.accounts, videos=args.videos, jobs=args.jobs, seed=args.seed)
+        print(f"  banco populado em {time.perf_counter() - start:.1f}s "
+              f"({args.accounts} contas, {args.videos} vídeos, {args.jobs} jobs)")
+    return app
+
+
+def bench_api(args, app):
+    """Percentis de latência dos endpoints de listagem e estatísticas"""
+    client = app.test_client()
+    iterations = 5 if args.quick else args.iterations
+    endpoints = {
+        'jobs': '/api/jobs',
+        'jobs_stats': '/api/jobs/stats',
+        'jobs_queue': '/api/jobs/queue',
+        'videos': '/api/videos',
+    }
+
+    metrics = {}
+    for name, path in endpoints.items():
+        client.get(path)  # aquecimento
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = client.get(path)
+            samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'{path} retornou {response.status_code}')
+        stats = percentiles(samples)
+        for key, value in stats.items():
+            metrics[f'api.{name}.{key}_ms'] = metric(value, 'ms', 'lower')
+        print(f"  {path}: p50={stats['p50']:.1f}ms p90={stats['p90']:.1f}ms p99={stats['p99']:.1f}ms")
+    return metrics
+
+
+def bench_dispatch(args, app):
+    """Taxa de despacho do scheduler (/api/jobs/process) sobre jobs vencidos"""
+    client = app.test_client()
+    rounds = 1 if args.quick else args.dispatch_rounds
+
+    dispatched = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        response = client.post('/api/jobs/process')
+        dispatched += response.get_json().get('total_pending', 0)
+    elapsed = time.perf_counter() - start
+
+    rate = dispatched / elapsed if elapsed else 0
+    print(f"  {dispatched} jobs despachados em {elapsed:.2f}s ({rate:.2f} jobs/s)")
+    return {
+        'dispatch.jobs_per_s': metric(rate, 'jobs/s', 'higher'),
+        'dispatch.round_ms': metric(elapsed * 1000 / rounds, 'ms', 'lower'),
+    }
+
+
+def bench_startup(args):
+    """Reaproveita benchmarks/startup.py (interpretadores novos)"""
+    output = os.path.join(tempfile.gettempdir(), f'startup_{os.getpid()}.json')
+    subprocess.run(
+        [sys.executable, os.path.join(os.path.dirname(__file__), 'startup.py'),
+         '--runs', '3' if args.quick else '10', '--json', output],
+        check=True, stdout=subprocess.DEVNULL
+    )
+    with open(output) as f:
+        result = json.load(f)
+    os.remove(output)
+    return {
+        f'startup.{key}': metric(result[key]['median'], 'ms', 'lower')
+        for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'process_ms')
+    }
+
+
+def compare(current, baseline_path, threshold):
+    """Imprime a variação de cada métrica e retorna as regressões acima do limite"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['metrics']
+
+    regressions = []
+    print(f"\n{'métrica':<45} {'baseline':>12} {'atual':>12} {'variação':>10}")
+    for name, current_metric in sorted(current.items()):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['value'], current_metric['value']
+        change = (new - old) / old * 100 if old else 0.0
+        worse = change > threshold if current_metric['better'] == 'lower' else change < -threshold
+        flag = '  REGRESSÃO' if worse else ''
+        print(f"{name:<45} {old:>12.3f} {new:>12.3f} {change:>+9.1f}%{flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--quick', action='store_true', help='Menos amostras e mídia menor')
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--videos', type=int, default=10000)
+    parser.add_argument('--jobs', type=int, default=1000000)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--dispatch-rounds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--media-cache', default=os.path.join(tempfile.gettempdir(), 'cortes-bench-media'))
+    parser.add_argument('--output', help='Arquivo JSON de saída')
+    parser.add_argument('--compare', help='JSON de baseline para comparação')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Regressão tolerada em %%')
+    args = parser.parse_args()
+
+    metrics = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        if 'processing' in args.suite:
+            print('processing')
+            metrics.update(bench_processing(args, work_dir))
+
+        if 'api' in args.suite or 'dispatch' in args.suite:
+            print('seed')
+            app = seeded_app(args, work_dir)
+            if 'api' in args.suite:
+                print('api')
+                metrics.update(bench_api(args, app))
+            if 'dispatch' in args.suite:
+                print('dispatch')
+                metrics.update(bench_dispatch(args, app))
+
+        if 'startup' in args.suite:
+            print('startup')
+            metrics.update(bench_startup(args))
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'suites': args.suite,
+            'quick': args.quick,
+            'volumes': {'accounts': args.accounts, 'videos': args.videos, 'jobs': args.jobs},
+        },
+        'metrics': metrics,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        regressions = compare(metrics, args.compare, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regressão(ões) acima de {args.threshold}%')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Popula um banco SQLite com volumes realistas para os benchmarks de API e dispatch."""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+CHUNK = 20000
+JOB_STATUSES = ['pending', 'processing', 'completed', 'failed']
+JOB_STATUS_WEIGHTS = [10, 1, 70, 19]
+ERROR_MESSAGES = [
+    'Erro de rede durante upload',
+    'Conta temporariamente limitada',
+    'Formato de vídeo não aceito',
+    'Erro interno do TikTok',
+]
+
+
+def seed_database(db, accounts=1000, videos=10000, jobs=1000000, due_jobs=500, seed=42):
+    """Insere contas, vídeos e jobs em lote via Core (sem instanciar objetos ORM)"""
+    from src.models.tiktok_account import TikTokAccount
+    from src.models.video import Video, PostingJob
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    with db.engine.begin() as conn:
+        conn.execute(insert(TikTokAccount), [{
+            'username': f'bench_account_{i}',
+            # Senha fictícia: os benchmarks nunca descriptografam
+            'encrypted_password': 'benchmark',
+            'status': 'active' if rng.random() < 0.9 else rng.choice(['inactive', 'blocked', 'limited']),
+            'total_posts': rng.randint(0, 500),
+            'created_at': now,
+            'updated_at': now,
+        } for i in range(accounts)])
+
+        for start in range(0, videos, CHUNK):
+            conn.execute(insert(Video), [{
+                'original_filename': f'clip_{i}.mp4',
+                'file_path': f'/bench/originals/clip_{i}.mp4',
+                'file_size': rng.randint(5, 100) * 1024 * 1024,
+                'duration': rng.uniform(10, 600),
+                'resolution': '1920x1080',
+                'format': 'mp4',
+                'cut_vertical': True,
+                'cut_square': True,
+                'cut_horizontal': False,
+                'caption': f'Legenda do clipe {i} ' + 'lorem ipsum ' * rng.randint(1, 20),
+                'hashtags': ' '.join(f'#tag{rng.randint(0, 500)}' for _ in range(rng.randint(1, 8))),
+                'processing_status': 'processed',
+                'processed_files': f'{{"vertical": "/bench/processed/clip_{i}_vertical.mp4"}}',
+                'created_at': now - timedelta(minutes=i),
+                'updated_at': now - timedelta(minutes=i),
+            } for i in range(start, min(start + CHUNK, videos))])
+
+        for start in range(0, jobs, CHUNK):
+            rows = []
+            for i in range(start, min(start + CHUNK, jobs)):
+                status = rng.choices(JOB_STATUSES, JOB_STATUS_WEIGHTS)[0]
+                scheduled = now + timedelta(minutes=rng.randint(-60 * 24 * 90, 60 * 24 * 7))
+                if status == 'pending' and scheduled < now:
+                    # Pendentes ficam no futuro; os vencidos são criados à parte (due_jobs)
+                    status = 'completed'
+                video_id = rng.randint(1, videos)
+                rows.append({
+                    'video_id': video_id,
+                    'tiktok_account_id': rng.randint(1, accounts),
+                    'video_variant': 'vertical',
+                    'video_file_path': f'/bench/processed/clip_{video_id}_vertical.mp4',
+                    'caption': 'Legenda do job',
+                    'status': status,
+                    'scheduled_time': scheduled,
+                    'completed_at': scheduled if status in ('completed', 'failed') else None,
+                    'retry_count': 0,
+                    'max_retries': 3,
+                    'error_message': rng.choice(ERROR_MESSAGES) if status == 'failed' else None,
+                    'created_at': scheduled - timedelta(hours=1),
+                    'updated_at': scheduled,
+                })
+            conn.execute(insert(PostingJob), rows)
+
+        # Jobs já vencidos para o benchmark de dispatch
+        conn.execute(insert(PostingJob), [{
+            'video_id': rng.randint(1, videos),
+            'tiktok_account_id': rng.randint(1, accounts),
+            'video_variant': 'vertical',
+            'video_file_path': '/bench/processed/due.mp4',
+            'status': 'pending',
+            'scheduled_time': now - timedelta(minutes=1),
+            'retry_count': 0,
+            'max_retries': 3,
+            'created_at': now - timedelta(hours=1),
+            'updated_at': now - timedelta(hours=1),
+        } for _ in range(due_jobs)])
@@ -0,0 +1,98 @@
+"""Benchmark de cold start: import do app e primeira requisição.
+
+Cada amostra roda em um interpretador novo, como acontece quando o Fly
+acorda a máquina após scale-to-zero. Uso:
+
+    python benchmarks/startup.py --runs 10
+    python benchmarks/startup.py --runs 10 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, %(root)r)
+from src.main import create_app
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+client = app.test_client()
+response = client.get(%(path)r)
+t3 = time.perf_counter()
+heavy = [name for name in ('ffmpeg', 'cryptography') if name in sys.modules]
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'create_app_ms': (t2 - t1) * 1000,
+    'first_request_ms': (t3 - t2) * 1000,
+    'status': response.status_code,
+    'heavy_modules_loaded': heavy,
+}))
+'''
+
+
+def run_once(env, path):
+    start = os.times().elapsed
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD % {'root': ROOT, 'path': path}],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    sample = json.loads(output.strip().splitlines()[-1])
+    sample['process_ms'] = (os.times().elapsed - start) * 1000
+    return sample
+
+
+def summarize(samples, key):
+    values = sorted(s[key] for s in samples)
+    return {
+        'median': statistics.median(values),
+        'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+        'min': values[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/videos', help='Rota da primeira requisição')
+    parser.add_argument('--json', dest='json_path', help='Grava o resultado em JSON')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        env['MEDIA_ROOT'] = os.path.join(tmp, 'media')
+        env['TRACE_EXPORTER'] = 'none'
+        env['STORAGE_SWEEPER_ENABLED'] = 'false'
+
+        # Primeira execução cria o schema; as demais só conferem o marcador de versão
+        results['fresh_database'] = run_once(env, args.path)
+        samples = [run_once(env, args.path) for _ in range(args.runs)]
+
+    results['runs'] = args.runs
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'process_ms'):
+        results[key] = summarize(samples, key)
+    results['heavy_modules_loaded'] = samples[-1]['heavy_modules_loaded']
+
+    print(f"{'métrica':<20} {'mediana':>10} {'p95':>10} {'mín':>10}")
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'process_ms'):
+        r = results[key]
+        print(f"{key:<20} {r['median']:>10.1f} {r['p95']:>10.1f} {r['min']:>10.1f}")
+    print(f"schema novo: primeira requisição em {results['fresh_database']['first_request_ms']:.1f} ms")
+    print(f"módulos pesados carregados: {results['heavy_modules_loaded'] or 'nenhum'}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
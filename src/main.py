@@ -3,55 +3,257 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
 from src.models.user import db
-from src.routes.user import user_bp
-from src.routes.tiktok_accounts import tiktok_accounts_bp
-from src.routes.videos import videos_bp
-from src.routes.posting_jobs import posting_jobs_bp
-
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
-app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
-
-# Habilitar CORS
-CORS(app)
-
-# Registrar blueprints
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(tiktok_accounts_bp, url_prefix='/api')
-app.register_blueprint(videos_bp, url_prefix='/api')
-app.register_blueprint(posting_jobs_bp, url_prefix='/api')
-
-# uncomment if you need to use database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-
-# Importar todos os modelos para criar as tabelas
-from src.models.tiktok_account import TikTokAccount
-from src.models.video import Video, PostingJob
-
-with app.app_context():
-    db.create_all()
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() == 'true'
+
+
+def create_app(config=None):
+    """Cria e configura a aplicação Flask.
+
+    Nada pesado roda aqui: ffmpeg e cryptography são importados no primeiro uso
+    e o schema do banco é verificado na primeira requisição (ver ensure_schema),
+    para que o cold start após scale-to-zero seja curto.
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+    app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+        'DATABASE_URL',
+        f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+    )
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Profiling de SQL por requisição (header X-SQL-Profile ou ?_profile=1)
+    app.config['SQL_SLOW_QUERY_MS'] = float(os.environ.get('SQL_SLOW_QUERY_MS', 100))
+    app.config['SQL_PROFILER_TOKEN'] = os.environ.get('SQL_PROFILER_TOKEN')
+    app.config['SQL_PROFILER_ALWAYS_ON'] = _env_flag('SQL_PROFILER_ALWAYS_ON', 'false')
+    app.config['SQL_PROFILER_SERVER_TIMING'] = _env_flag('SQL_PROFILER_SERVER_TIMING', 'true')
+
+    # Armazenamento de mídia: layout em shards, retenção e sweeper em background
+    app.config['MEDIA_ROOT'] = os.environ.get('MEDIA_ROOT') or os.path.join(os.path.dirname(__file__), 'uploads')
+    app.config['STORAGE_DELETE_ORIGINALS'] = _env_flag('STORAGE_DELETE_ORIGINALS', 'false')
+    app.config['STORAGE_VARIANT_RETENTION_HOURS'] = float(os.environ.get('STORAGE_VARIANT_RETENTION_HOURS', 24))
+    app.config['STORAGE_QUOTA_MB'] = int(os.environ.get('STORAGE_QUOTA_MB', 0))
+    app.config['STORAGE_CACHE_RETENTION_HOURS'] = float(os.environ.get('STORAGE_CACHE_RETENTION_HOURS', 168))
+    app.config['STORAGE_TEMP_RETENTION_HOURS'] = float(os.environ.get('STORAGE_TEMP_RETENTION_HOURS', 24))
+    app.config['STORAGE_SWEEP_INTERVAL'] = int(os.environ.get('STORAGE_SWEEP_INTERVAL', 600))
+    app.config['STORAGE_SWEEPER_ENABLED'] = _env_flag('STORAGE_SWEEPER_ENABLED', 'true')
+
+    # Backend de mídia (MEDIA_BACKEND=local|s3); no s3, MEDIA_ROOT vira área de trabalho e cache LRU
+    app.config['MEDIA_BACKEND'] = os.environ.get('MEDIA_BACKEND', 'local')
+    app.config['MEDIA_S3_ENDPOINT'] = os.environ.get('MEDIA_S3_ENDPOINT') or os.environ.get('AWS_ENDPOINT_URL_S3')
+    app.config['MEDIA_S3_BUCKET'] = os.environ.get('MEDIA_S3_BUCKET') or os.environ.get('BUCKET_NAME')
+    app.config['MEDIA_S3_REGION'] = os.environ.get('MEDIA_S3_REGION') or os.environ.get('AWS_REGION', 'us-east-1')
+    app.config['MEDIA_S3_ACCESS_KEY'] = os.environ.get('MEDIA_S3_ACCESS_KEY') or os.environ.get('AWS_ACCESS_KEY_ID')
+    app.config['MEDIA_S3_SECRET_KEY'] = os.environ.get('MEDIA_S3_SECRET_KEY') or os.environ.get('AWS_SECRET_ACCESS_KEY')
+    app.config['MEDIA_PART_SIZE_MB'] = int(os.environ.get('MEDIA_PART_SIZE_MB', 8))
+    app.config['MEDIA_CACHE_MB'] = int(os.environ.get('MEDIA_CACHE_MB', 2048))
+    app.config['MEDIA_URL_EXPIRES'] = int(os.environ.get('MEDIA_URL_EXPIRES', 3600))
+
+    # Encode paralelo por segmentos alinhados a keyframes, para fontes longas
+    app.config['SEGMENT_ENCODING_ENABLED'] = _env_flag('SEGMENT_ENCODING_ENABLED', 'false')
+    app.config['SEGMENT_MIN_DURATION'] = float(os.environ.get('SEGMENT_MIN_DURATION', 120))
+    app.config['SEGMENT_MIN_SECONDS'] = float(os.environ.get('SEGMENT_MIN_SECONDS', 10))
+    app.config['SEGMENT_WORKERS'] = int(os.environ.get('SEGMENT_WORKERS', 0)) or os.cpu_count()
+
+    # Variantes renderizadas sob demanda, na ordem dos horários agendados
+    app.config['JIT_RENDERING_ENABLED'] = _env_flag('JIT_RENDERING_ENABLED', 'true')
+    app.config['RENDER_LEAD_MINUTES'] = float(os.environ.get('RENDER_LEAD_MINUTES', 10))
+    app.config['RENDER_WORKER_ENABLED'] = _env_flag('RENDER_WORKER_ENABLED', 'true')
+    app.config['PREVIEW_PROXY_SECONDS'] = float(os.environ.get('PREVIEW_PROXY_SECONDS', 15))
+
+    # Backend de postagem (simulado em processo ou HTTP) e limites do dispatcher
+    app.config['POSTING_BACKEND'] = os.environ.get('POSTING_BACKEND', 'simulated')
+    app.config['POSTING_BACKEND_URL'] = os.environ.get('POSTING_BACKEND_URL', 'http://127.0.0.1:8089')
+    app.config['POSTING_TIMEOUT'] = float(os.environ.get('POSTING_TIMEOUT', 30))
+    app.config['POSTING_SIMULATED_LATENCY'] = float(os.environ.get('POSTING_SIMULATED_LATENCY', 2))
+    app.config['POSTING_SEED'] = os.environ.get('POSTING_SEED') or None
+    app.config['POSTING_BATCH_SIZE'] = int(os.environ.get('POSTING_BATCH_SIZE', 50))
+    app.config['POSTING_MAX_IN_FLIGHT'] = int(os.environ.get('POSTING_MAX_IN_FLIGHT', 20))
+    app.config['POSTING_RETRY_BASE_SECONDS'] = float(os.environ.get('POSTING_RETRY_BASE_SECONDS', 60))
+
+    # Checagem de saúde das contas em lote (ACCOUNT_CHECK_INTERVAL=0 desativa o modo periódico)
+    app.config['ACCOUNT_CHECK_CONCURRENCY'] = int(os.environ.get('ACCOUNT_CHECK_CONCURRENCY', 20))
+    app.config['ACCOUNT_CHECK_INTERVAL'] = int(os.environ.get('ACCOUNT_CHECK_INTERVAL', 0))
+    app.config['ACCOUNT_CHECK_MIN_AGE_MINUTES'] = float(os.environ.get('ACCOUNT_CHECK_MIN_AGE_MINUTES', 60))
+
+    # Detecção de quase duplicados no upload: warn, reject ou off
+    app.config['PHASH_DUPLICATE_POLICY'] = os.environ.get('PHASH_DUPLICATE_POLICY', 'warn')
+    app.config['PHASH_MAX_DISTANCE'] = int(os.environ.get('PHASH_MAX_DISTANCE', 10))
+
+    # Jobs finalizados vão para a tabela de arquivo; stats e histórico leem rollups horários
+    app.config['ARCHIVE_ENABLED'] = _env_flag('ARCHIVE_ENABLED', 'true')
+    app.config['ARCHIVE_AFTER_DAYS'] = float(os.environ.get('ARCHIVE_AFTER_DAYS', 30))
+    app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+    app.config['ARCHIVE_INTERVAL'] = int(os.environ.get('ARCHIVE_INTERVAL', 300))
+
+    # Leases de vídeos, jobs e renderizações; o reaper devolve à fila o que expirou
+    app.config['LEASE_SECONDS'] = int(os.environ.get('LEASE_SECONDS', 120))
+    app.config['LEASE_HEARTBEAT_SECONDS'] = int(os.environ.get('LEASE_HEARTBEAT_SECONDS', 30))
+    app.config['REAPER_ENABLED'] = _env_flag('REAPER_ENABLED', 'true')
+    app.config['REAPER_INTERVAL'] = int(os.environ.get('REAPER_INTERVAL', 60))
+
+    # Scale-to-zero: drain no SIGTERM e próximo vencimento gravado para o waker (src/waker.py)
+    app.config['DRAIN_TIMEOUT_SECONDS'] = float(os.environ.get('DRAIN_TIMEOUT_SECONDS', 100))
+    app.config['WAKE_STATE_ENABLED'] = _env_flag('WAKE_STATE_ENABLED', 'true')
+    app.config['WAKE_STATE_FILE'] = os.environ.get('WAKE_STATE_FILE')
+    app.config['WAKE_REFRESH_SECONDS'] = int(os.environ.get('WAKE_REFRESH_SECONDS', 60))
+    app.config['VIDEO_MAX_ATTEMPTS'] = int(os.environ.get('VIDEO_MAX_ATTEMPTS', 3))
+
+    # ETags das listagens/estatísticas (304 sem rodar a query) e compressão brotli/gzip
+    app.config['HTTP_ETAGS_ENABLED'] = _env_flag('HTTP_ETAGS_ENABLED', 'true')
+    app.config['COMPRESS_ENABLED'] = _env_flag('COMPRESS_ENABLED', 'true')
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+
+    # Idempotency-Key nos POSTs de upload e criação de jobs
+    app.config['IDEMPOTENCY_TTL_HOURS'] = float(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24))
+    app.config['IDEMPOTENCY_WAIT_SECONDS'] = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 60))
+    app.config['IDEMPOTENCY_LOCK_SECONDS'] = float(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 900))
+
+    # Planejador de campanhas: janelas (UTC), espaçamento mínimo e limite diário por conta
+    app.config['CAMPAIGN_WINDOWS'] = os.environ.get('CAMPAIGN_WINDOWS', '09:00-22:00').split(',')
+    app.config['CAMPAIGN_MIN_SPACING_MINUTES'] = float(os.environ.get('CAMPAIGN_MIN_SPACING_MINUTES', 60))
+    app.config['CAMPAIGN_DAILY_CAP'] = int(os.environ.get('CAMPAIGN_DAILY_CAP', 3))
+    app.config['CAMPAIGN_HORIZON_DAYS'] = float(os.environ.get('CAMPAIGN_HORIZON_DAYS', 14))
+
+    # Ingestão em lote (zip/tar em /api/videos/bulk ou pasta vigiada com inotify)
+    app.config['INGEST_WATCH_DIR'] = os.environ.get('INGEST_WATCH_DIR') or None
+    app.config['INGEST_WATCH_CUTS'] = os.environ.get('INGEST_WATCH_CUTS', 'vertical,square')
+    app.config['INGEST_POLL_SECONDS'] = float(os.environ.get('INGEST_POLL_SECONDS', 5))
+    app.config['INGEST_SETTLE_SECONDS'] = float(os.environ.get('INGEST_SETTLE_SECONDS', 2))
+    app.config['INGEST_MAX_FILES'] = int(os.environ.get('INGEST_MAX_FILES', 500))
+    app.config['INGEST_MAX_ARCHIVE_MB'] = int(os.environ.get('INGEST_MAX_ARCHIVE_MB', 10240))
+    app.config['INGEST_PROBE_WORKERS'] = int(os.environ.get('INGEST_PROBE_WORKERS', 0)) or os.cpu_count()
+    app.config['INGEST_WORKERS'] = int(os.environ.get('INGEST_WORKERS', 1))
+
+    # Exportação em stream: linhas lidas em lotes curtos por keyset
+    app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 5000))
+
+    # Corte das pontas mudas e paradas antes do encode (áudio RMS + diferença entre frames)
+    app.config['TRIM_ENABLED'] = _env_flag('TRIM_ENABLED', 'false')
+    app.config['TRIM_SILENCE_DB'] = float(os.environ.get('TRIM_SILENCE_DB', -45))
+    app.config['TRIM_MOTION_THRESHOLD'] = float(os.environ.get('TRIM_MOTION_THRESHOLD', 2.0))
+    app.config['TRIM_PADDING_SECONDS'] = float(os.environ.get('TRIM_PADDING_SECONDS', 0.3))
+    app.config['TRIM_MIN_SECONDS'] = float(os.environ.get('TRIM_MIN_SECONDS', 1.0))
+
+    # Overlays queimados nas variantes: perfis em JSON (inline ou caminho do arquivo)
+    app.config['OVERLAY_PROFILES'] = os.environ.get('OVERLAY_PROFILES') or None
+    app.config['OVERLAY_DEFAULT_PROFILE'] = os.environ.get('OVERLAY_DEFAULT_PROFILE') or None
+
+    # Governor: admissão de uploads e encodes pelo orçamento de memória, disco e fila
+    app.config['GOVERNOR_ENABLED'] = _env_flag('GOVERNOR_ENABLED', 'true')
+    app.config['GOVERNOR_MEMORY_BUDGET_MB'] = int(os.environ.get('GOVERNOR_MEMORY_BUDGET_MB', 0))
+    app.config['GOVERNOR_MEMORY_RESERVE_MB'] = int(os.environ.get('GOVERNOR_MEMORY_RESERVE_MB', 350))
+    app.config['GOVERNOR_MEMORY_MIN_FREE_MB'] = int(os.environ.get('GOVERNOR_MEMORY_MIN_FREE_MB', 100))
+    app.config['GOVERNOR_DISK_MIN_FREE_MB'] = int(os.environ.get('GOVERNOR_DISK_MIN_FREE_MB', 500))
+    app.config['GOVERNOR_MAX_ENCODES'] = int(os.environ.get('GOVERNOR_MAX_ENCODES', 2))
+    app.config['GOVERNOR_MAX_BACKLOG'] = int(os.environ.get('GOVERNOR_MAX_BACKLOG', 50))
+    app.config['GOVERNOR_ENCODE_WAIT_SECONDS'] = float(os.environ.get('GOVERNOR_ENCODE_WAIT_SECONDS', 30))
+    app.config['GOVERNOR_QUEUE_WAIT_SECONDS'] = float(os.environ.get('GOVERNOR_QUEUE_WAIT_SECONDS', 600))
+    app.config['GOVERNOR_ESTIMATE_MARGIN'] = float(os.environ.get('GOVERNOR_ESTIMATE_MARGIN', 1.2))
+
+    # Arquivos do frontend até este tamanho ficam em memória (o resto sai do disco)
+    app.config['STATIC_MEMORY_MAX_BYTES'] = int(os.environ.get('STATIC_MEMORY_MAX_BYTES', 1024 * 1024))
+    # Reindexa a pasta do frontend a cada pedido (só para desenvolver o frontend)
+    app.config['STATIC_AUTO_RELOAD'] = _env_flag('STATIC_AUTO_RELOAD', 'false')
+
+    if config:
+        app.config.update(config)
+
+    # Habilitar CORS
+    CORS(app)
+
+    # Registrar blueprints
+    from src.routes.user import user_bp
+    from src.routes.tiktok_accounts import tiktok_accounts_bp
+    from src.routes.videos import videos_bp
+    from src.routes.posting_jobs import posting_jobs_bp
+    from src.routes.storage import storage_bp
+    from src.routes.system import system_bp
+
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(tiktok_accounts_bp, url_prefix='/api')
+    app.register_blueprint(videos_bp, url_prefix='/api')
+    app.register_blueprint(posting_jobs_bp, url_prefix='/api')
+    app.register_blueprint(storage_bp, url_prefix='/api')
+    app.register_blueprint(system_bp, url_prefix='/api')
+
+    db.init_app(app)
+
+    # Schema verificado uma vez, na primeira requisição, pelo marcador de versão
+    from src.models.schema import ensure_schema
+    app.before_request(ensure_schema)
+
+    from src.services.sql_profiler import init_sql_profiler
+    init_sql_profiler(app, db)
+
+    from src.services.http_cache import init_http_cache
+    init_http_cache(app)
+
+    # Traces do pipeline de vídeo (TRACE_EXPORTER=file|otlp|none)
+    from src.services.tracing import init_tracing, register_cli as register_tracing_cli
+    init_tracing(app)
+    register_tracing_cli(app)
+
+    from src.services.storage import init_storage
+    init_storage(app)
+
+    from src.services.media import init_media, register_cli as register_media_cli
+    init_media(app)
+    register_media_cli(app)
+
+    from src.services.governor import init_governor
+    init_governor(app)
+
+    from src.services.render_queue import init_render_queue
+    init_render_queue(app)
+
+    from src.services.account_health import init_account_health, register_cli as register_account_health_cli
+    init_account_health(app)
+    register_account_health_cli(app)
+
+    from src.services.phash import register_cli as register_phash_cli
+    register_phash_cli(app)
+
+    from src.services.job_archive import init_job_archive, register_cli as register_job_archive_cli
+    init_job_archive(app)
+    register_job_archive_cli(app)
+
+    from src.services.leases import init_leases, register_cli as register_leases_cli
+    init_leases(app)
+    register_leases_cli(app)
+
+    from src.services.lifecycle import init_lifecycle
+    init_lifecycle(app)
+
+    from src.services.ingest import init_ingest, register_cli as register_ingest_cli
+    init_ingest(app)
+    register_ingest_cli(app)
+
+    # Frontend servido de um manifesto montado no boot (arquivos pequenos em memória)
+    from src.services.static_files import init_static_files, serve_static, register_cli as register_static_cli
+    init_static_files(app)
+    register_static_cli(app)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        return serve_static(path)
+
+    return app
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app = create_app()
+    # O reloader roda o servidor num processo filho que não recebe o SIGTERM do drain
+    from src.services.lifecycle import install_signal_handlers
+    install_signal_handlers(app)
+    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=os.environ.get('FLASK_ENV') != 'production')
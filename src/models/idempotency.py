@@ -0,0 +1,21 @@
+from src.models.user import db
+from datetime import datetime
+
+class IdempotencyKey(db.Model):
+    """Resultado de um POST feito com o header Idempotency-Key (ver services/idempotency)"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (db.UniqueConstraint('scope', 'key'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(200), nullable=False)  # rota (request.path)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # o mesmo key com outro corpo é erro do cliente
+
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, completed
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    response_mimetype = db.Column(db.String(100))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
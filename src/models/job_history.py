@@ -0,0 +1,77 @@
+from src.models.user import db
+from datetime import datetime
+
+class ArchivedPostingJob(db.Model):
+    """Jobs finalizados há mais de ARCHIVE_AFTER_DAYS, fora da tabela quente"""
+    __tablename__ = 'posting_jobs_archive'
+
+    # Mesmo id do job original (sem chaves estrangeiras: o vídeo pode ter sido removido)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    video_id = db.Column(db.Integer, nullable=False, index=True)
+    tiktok_account_id = db.Column(db.Integer, nullable=False, index=True)
+    video_variant = db.Column(db.String(20), nullable=False)
+    video_file_path = db.Column(db.String(500), nullable=False)
+    caption = db.Column(db.Text)
+    status = db.Column(db.String(20))
+    error_class = db.Column(db.String(30))
+    scheduled_time = db.Column(db.DateTime)
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime, index=True)
+    retry_count = db.Column(db.Integer)
+    max_retries = db.Column(db.Integer)
+    error_message = db.Column(db.Text)
+    log_data = db.Column(db.Text)
+    tiktok_post_url = db.Column(db.String(500))
+    trace_id = db.Column(db.String(32))
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        """Converte para dicionário (mesmo formato de PostingJob.to_dict)"""
+        return {
+            'id': self.id,
+            'video_id': self.video_id,
+            'tiktok_account_id': self.tiktok_account_id,
+            'video_variant': self.video_variant,
+            'caption': self.caption,
+            'status': self.status,
+            'error_class': self.error_class,
+            'scheduled_time': self.scheduled_time.isoformat() if self.scheduled_time else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'retry_count': self.retry_count,
+            'max_retries': self.max_retries,
+            'error_message': self.error_message,
+            'tiktok_post_url': self.tiktok_post_url,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'archived_at': self.archived_at.isoformat() if self.archived_at else None
+        }
+
+
+class JobRollup(db.Model):
+    """Contagem horária de jobs finalizados por conta, status e classe de erro"""
+    __tablename__ = 'job_rollups_hourly'
+    __table_args__ = (
+        db.UniqueConstraint('bucket', 'tiktok_account_id', 'status', 'error_class'),
+        # Índice de cobertura para os totais por status do /jobs/stats
+        db.Index('ix_job_rollups_hourly_status_count', 'status', 'count'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime, nullable=False, index=True)  # início da hora (UTC)
+    tiktok_account_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False)  # completed, failed
+    error_class = db.Column(db.String(30), nullable=False, default='')  # '' quando não há erro
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        """Converte para dicionário"""
+        return {
+            'bucket': self.bucket.isoformat(),
+            'tiktok_account_id': self.tiktok_account_id,
+            'status': self.status,
+            'error_class': self.error_class or None,
+            'count': self.count
+        }
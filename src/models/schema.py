@@ -0,0 +1,82 @@
+import threading
+
+from sqlalchemy import inspect, text
+from src.models.user import db
+
+# Incrementar sempre que um modelo ganhar tabela, coluna ou índice novo
+SCHEMA_VERSION = 16
+
+_schema_lock = threading.Lock()
+_schema_checked = set()
+
+
+def upgrade_schema():
+    """Adiciona colunas e índices novos em tabelas que já existem no banco.
+
+    O db.create_all() só cria tabelas ausentes; bancos antigos (volume do Fly)
+    precisam receber as colunas adicionadas aos modelos depois da criação.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def _stored_version():
+    if db.engine.dialect.name != 'sqlite':
+        return None
+    with db.engine.connect() as conn:
+        return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def _store_version():
+    if db.engine.dialect.name != 'sqlite':
+        return
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+def ensure_schema():
+    """Cria/atualiza o schema só quando o marcador de versão do banco está desatualizado.
+
+    Com o marcador em dia, o custo é um único PRAGMA, em vez de refletir todas
+    as tabelas a cada boot.
+    """
+    engine_url = str(db.engine.url)
+    if engine_url in _schema_checked:
+        return
+
+    with _schema_lock:
+        if engine_url in _schema_checked:
+            return
+
+        if _stored_version() != SCHEMA_VERSION:
+            # Importar todos os modelos para criar as tabelas
+            from src.models.tiktok_account import TikTokAccount
+            from src.models.video import Video, PostingJob, VariantRender
+            from src.models.job_history import ArchivedPostingJob, JobRollup
+            from src.models.idempotency import IdempotencyKey
+            from src.models.table_version import TableVersion, install_version_triggers
+            from src.models.video_search import install_search_index
+
+            db.create_all()
+            upgrade_schema()
+            with db.engine.begin() as conn:
+                install_version_triggers(conn)
+                install_search_index(conn)
+            _store_version()
+
+        _schema_checked.add(engine_url)
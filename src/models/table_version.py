@@ -0,0 +1,67 @@
+from src.models.user import db
+
+# Tabelas cujas alterações invalidam os ETags da API (ver services/http_cache)
+TRACKED_TABLES = (
+    'videos',
+    'tiktok_accounts',
+    'posting_jobs',
+    'variant_renders',
+    'posting_jobs_archive',
+    'job_rollups_hourly',
+)
+
+# Colunas que a API serve nas tabelas com lease: o trigger de UPDATE só olha
+# para elas, para heartbeat e renovação de lease não trocarem o ETag. Sem
+# updated_at: o SQLite dispara o trigger se a coluna estiver no SET, mesmo sem
+# mudar o valor, e toda alteração de verdade mexe em outra coluna daqui
+SERVED_COLUMNS = {
+    'videos': (
+        'original_filename', 'file_size', 'duration', 'resolution', 'format', 'cut_vertical', 'cut_square',
+        'cut_horizontal', 'caption', 'hashtags', 'processing_status', 'processed_files', 'trim_start',
+        'trim_end', 'overlay_profile', 'created_at',
+    ),
+    'posting_jobs': (
+        'video_id', 'tiktok_account_id', 'video_variant', 'caption', 'status', 'scheduled_time', 'started_at',
+        'completed_at', 'retry_count', 'max_retries', 'error_message', 'error_class', 'tiktok_post_url',
+        'created_at',
+    ),
+    'variant_renders': (
+        'video_id', 'variant', 'status', 'deadline', 'started_at', 'completed_at', 'error_message',
+        'created_at',
+    ),
+}
+
+
+class TableVersion(db.Model):
+    """Contador de alterações por tabela, incrementado por triggers no SQLite"""
+    __tablename__ = 'table_versions'
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+def install_version_triggers(conn):
+    """Cria os triggers que incrementam table_versions a cada INSERT/UPDATE/DELETE.
+
+    Os triggers pegam qualquer escrita (ORM, Core, outros processos, CLI) e o
+    incremento é commitado junto com a alteração; nas tabelas de SERVED_COLUMNS
+    o UPDATE só conta se mexer numa coluna servida pela API. Só no SQLite; nos outros
+    bancos o ETag usa a marca d'água da tabela (ver services/http_cache).
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+
+    for table in TRACKED_TABLES:
+        conn.exec_driver_sql(
+            f"INSERT INTO table_versions (name, version) VALUES ('{table}', 0) ON CONFLICT (name) DO NOTHING"
+        )
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            if event == 'UPDATE' and table in SERVED_COLUMNS:
+                event = f"UPDATE OF {', '.join(SERVED_COLUMNS[table])}"
+            name = f"tv_{table}_{event.split()[0].lower()}"
+            # Recria: bancos antigos têm o trigger de UPDATE sem a lista de colunas
+            conn.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER {name} AFTER {event} ON {table} "
+                f"BEGIN UPDATE table_versions SET version = version + 1 WHERE name = '{table}'; END"
+            )
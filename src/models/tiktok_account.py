@@ -1,8 +1,10 @@
 from src.models.user import db
-from cryptography.fernet import Fernet
 import os
 from datetime import datetime
 
+# Chave Fernet das senhas, gerada no primeiro uso; nunca versionar (ver .gitignore)
+ENCRYPTION_KEY_FILE = os.path.join(os.path.dirname(__file__), '..', 'database', 'encryption.key')
+
 class TikTokAccount(db.Model):
     __tablename__ = 'tiktok_accounts'
     
@@ -12,6 +14,7 @@ class TikTokAccount(db.Model):
     status = db.Column(db.String(20), default='active')  # active, inactive, blocked, limited
     last_post_time = db.Column(db.DateTime)
     total_posts = db.Column(db.Integer, default=0)
+    last_checked_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -24,12 +27,13 @@ class TikTokAccount(db.Model):
     
     def _get_encryption_key(self):
         """Gera ou recupera a chave de criptografia"""
-        key_file = os.path.join(os.path.dirname(__file__), '..', 'database', 'encryption.key')
+        key_file = ENCRYPTION_KEY_FILE
         
         if os.path.exists(key_file):
             with open(key_file, 'rb') as f:
                 return f.read()
         else:
+            from cryptography.fernet import Fernet
             key = Fernet.generate_key()
             os.makedirs(os.path.dirname(key_file), exist_ok=True)
             with open(key_file, 'wb') as f:
@@ -38,12 +42,14 @@ class TikTokAccount(db.Model):
     
     def _encrypt_password(self, password):
         """Criptografa a senha"""
+        from cryptography.fernet import Fernet
         key = self._get_encryption_key()
         f = Fernet(key)
         return f.encrypt(password.encode()).decode()
     
     def get_decrypted_password(self):
         """Descriptografa e retorna a senha"""
+        from cryptography.fernet import Fernet
         key = self._get_encryption_key()
         f = Fernet(key)
         return f.decrypt(self.encrypted_password.encode()).decode()
@@ -72,6 +78,7 @@ class TikTokAccount(db.Model):
             'status': self.status,
             'last_post_time': self.last_post_time.isoformat() if self.last_post_time else None,
             'total_posts': self.total_posts,
+            'last_checked_at': self.last_checked_at.isoformat() if self.last_checked_at else None,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
@@ -1,6 +1,7 @@
 from src.models.user import db
 from datetime import datetime
 import os
+import secrets
 
 class Video(db.Model):
     __tablename__ = 'videos'
@@ -26,6 +27,32 @@ class Video(db.Model):
     processing_status = db.Column(db.String(20), default='uploaded')  # uploaded, processing, processed, error
     processed_files = db.Column(db.Text)  # JSON com caminhos dos arquivos processados
     
+    # Trecho útil (s) sem as pontas mudas e paradas; None = vídeo inteiro (ver services/trim)
+    trim_start = db.Column(db.Float)
+    trim_end = db.Column(db.Float)
+    
+    # Overlays queimados nas variantes: perfil (OVERLAY_PROFILES) e legendas SRT/VTT/ASS enviadas
+    overlay_profile = db.Column(db.String(50))
+    subtitles_path = db.Column(db.String(500))
+    
+    # Retenção: original removido pelo sweeper após o processamento
+    original_purged_at = db.Column(db.DateTime)
+    
+    # Trace de ponta a ponta (upload → probe → encode → agendamento → post)
+    trace_id = db.Column(db.String(32), index=True)
+    
+    # Hash perceptual (64 bits em hex) para detectar cópias quase idênticas
+    phash = db.Column(db.String(16))
+    
+    # sha256 do arquivo enviado: reenvios idênticos (ex.: lote repetido) são descartados
+    source_sha256 = db.Column(db.String(64), index=True)
+    
+    # Lease do worker que está processando (ver services/leases)
+    worker_id = db.Column(db.String(64))
+    lease_expires_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    processing_attempts = db.Column(db.Integer, default=0)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -51,8 +78,16 @@ class Video(db.Model):
         self.processing_status = status
         if processed_files:
             self.processed_files = processed_files
+        if status in ['processed', 'error']:
+            self.lease_expires_at = None
         self.updated_at = datetime.utcnow()
     
+    def trim_range(self):
+        """(início, fim) do trecho a codificar, ou None para o vídeo inteiro"""
+        if self.trim_start is None or self.trim_end is None:
+            return None
+        return self.trim_start, self.trim_end
+    
     def to_dict(self):
         """Converte para dicionário"""
         return {
@@ -68,6 +103,9 @@ class Video(db.Model):
             'caption': self.caption,
             'hashtags': self.hashtags,
             'processing_status': self.processing_status,
+            'trim_start': self.trim_start,
+            'trim_end': self.trim_end,
+            'overlay_profile': self.overlay_profile,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
@@ -75,9 +113,17 @@ class Video(db.Model):
 
 class PostingJob(db.Model):
     __tablename__ = 'posting_jobs'
+    __table_args__ = (
+        # Varreduras do arquivador: finalizados por data e ainda não agregados
+        db.Index('ix_posting_jobs_status_completed_at', 'status', 'completed_at'),
+        db.Index('ix_posting_jobs_status_rolled_up_at', 'status', 'rolled_up_at'),
+        # Listagem e fila em ordem de agendamento (com e sem filtro de status)
+        db.Index('ix_posting_jobs_status_scheduled_time', 'status', 'scheduled_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False)
+    # Indexado: filtro de jobs pela busca de vídeos (video_id IN ...)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False, index=True)
     tiktok_account_id = db.Column(db.Integer, db.ForeignKey('tiktok_accounts.id'), nullable=False)
     
     # Configurações da postagem
@@ -87,7 +133,7 @@ class PostingJob(db.Model):
     
     # Status e timing
     status = db.Column(db.String(20), default='pending')  # pending, processing, completed, failed, retrying
-    scheduled_time = db.Column(db.DateTime)
+    scheduled_time = db.Column(db.DateTime, index=True)
     started_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
     
@@ -97,15 +143,30 @@ class PostingJob(db.Model):
     
     # Logs e erros
     error_message = db.Column(db.Text)
+    error_class = db.Column(db.String(30))  # network, throttled, rejected_format, cancelled, ...
     log_data = db.Column(db.Text)  # JSON com logs detalhados
     
     # URL do post no TikTok (para postagens manuais)
     tiktok_post_url = db.Column(db.String(500))
     
+    # Mesmo trace do vídeo de origem
+    trace_id = db.Column(db.String(32), index=True)
+    
+    # Chave de idempotência enviada ao backend de postagem: a mesma em todas as tentativas do job
+    post_key = db.Column(db.String(32), default=lambda: secrets.token_hex(16))
+    
+    # Quando o resultado entrou nos rollups horários (ver services/job_archive)
+    rolled_up_at = db.Column(db.DateTime)
+    
+    # Lease do worker que está postando (ver services/leases)
+    worker_id = db.Column(db.String(64))
+    lease_expires_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def update_status(self, status, error_message=None):
+    def update_status(self, status, error_message=None, error_class=None):
         """Atualiza o status do job"""
         self.status = status
         if error_message:
@@ -113,8 +174,14 @@ class PostingJob(db.Model):
         
         if status == 'processing':
             self.started_at = datetime.utcnow()
-        elif status in ['completed', 'failed']:
+        elif status == 'completed':
             self.completed_at = datetime.utcnow()
+            self.error_class = None
+            self.lease_expires_at = None
+        elif status == 'failed':
+            self.completed_at = datetime.utcnow()
+            self.error_class = error_class or 'unknown'
+            self.lease_expires_at = None
         
         self.updated_at = datetime.utcnow()
     
@@ -142,8 +209,61 @@ class PostingJob(db.Model):
             'retry_count': self.retry_count,
             'max_retries': self.max_retries,
             'error_message': self.error_message,
+            'error_class': self.error_class,
             'tiktok_post_url': self.tiktok_post_url,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
+
+class VariantRender(db.Model):
+    __tablename__ = 'variant_renders'
+    __table_args__ = (db.UniqueConstraint('video_id', 'variant'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('videos.id'), nullable=False)
+    variant = db.Column(db.String(20), nullable=False)  # vertical, square, horizontal
+    output_path = db.Column(db.String(500), nullable=False)
+    
+    # Fila de renderização: a menor deadline é renderizada primeiro
+    status = db.Column(db.String(20), default='pending')  # pending, rendering, completed, failed
+    deadline = db.Column(db.DateTime, index=True)
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    error_message = db.Column(db.Text)
+    
+    # Lease do worker que está renderizando (ver services/leases)
+    worker_id = db.Column(db.String(64))
+    lease_expires_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    video = db.relationship('Video', backref=db.backref('renders', lazy=True, cascade='all, delete-orphan'))
+    
+    def update_status(self, status, error_message=None):
+        """Atualiza o status da renderização"""
+        self.status = status
+        self.error_message = error_message
+        
+        if status == 'rendering':
+            self.started_at = datetime.utcnow()
+        elif status in ['completed', 'failed']:
+            self.completed_at = datetime.utcnow()
+            self.lease_expires_at = None
+        
+        self.updated_at = datetime.utcnow()
+    
+    def to_dict(self):
+        """Converte para dicionário"""
+        return {
+            'id': self.id,
+            'video_id': self.video_id,
+            'variant': self.variant,
+            'status': self.status,
+            'deadline': self.deadline.isoformat() if self.deadline else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'error_message': self.error_message
+        }
@@ -0,0 +1,54 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Índice FTS5 de conteúdo externo: guarda só os tokens, o texto continua em `videos`
+FTS_TABLE = 'videos_fts'
+FTS_COLUMNS = ('original_filename', 'caption', 'hashtags')
+
+
+def install_search_index(conn):
+    """Cria o índice FTS5 dos vídeos e os triggers que o mantêm em dia (só SQLite).
+
+    O tokenizer unicode61 separa em '#', '_' e '.', então "#Viral" vira "viral",
+    e "clip_12.mp4" vira "clip", "12", "mp4". Acentos são ignorados na busca.
+    Na criação, o índice é preenchido com os vídeos que já existem.
+    """
+    if conn.dialect.name != 'sqlite':
+        return
+
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).first()
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+
+    if not exists:
+        try:
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({columns}, content='videos', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        except Exception as e:
+            # SQLite compilado sem FTS5: a busca responde 501
+            logger.warning('Índice de busca não criado (FTS5 indisponível?): %s', e)
+            return
+
+    conn.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON videos BEGIN "
+        f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (new.id, {new_values}); END"
+    )
+    conn.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON videos BEGIN "
+        f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+    )
+    # Só quando muda um campo indexado (status, leases etc. não mexem no índice)
+    conn.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF {columns} ON videos BEGIN "
+        f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (new.id, {new_values}); END"
+    )
+
+    if not exists:
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
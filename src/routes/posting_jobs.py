@@ -1,52 +1,57 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db
 from src.models.video import PostingJob
+from src.models.job_history import ArchivedPostingJob
 from src.models.tiktok_account import TikTokAccount
+from src.services import campaign_planner, export, fieldsets, governor, job_archive, search
+from src.services.dispatcher import dispatch_due_jobs
+from src.services.http_cache import conditional
+from src.services.idempotency import idempotent
+from src.services.render_queue import wake_render_worker
 from datetime import datetime, timedelta
 import json
 
 posting_jobs_bp = Blueprint('posting_jobs', __name__)
 
 @posting_jobs_bp.route('/jobs', methods=['GET'])
+@conditional('posting_jobs', 'tiktok_accounts', 'videos')
 def get_jobs():
-    """Lista todos os jobs de postagem"""
+    """Lista todos os jobs de postagem (?fields=id,status,... para trazer só alguns campos).
+
+    ?q= filtra pela legenda/hashtags/nome do vídeo e ?hashtag= por uma hashtag exata.
+    """
     try:
         status_filter = request.args.get('status')
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 20))
         
-        query = PostingJob.query
+        available = fieldsets.job_fields()
+        names = fieldsets.parse_fields(request.args.get('fields'), available)
+        
+        # Só as colunas pedidas; conta e vídeo entram por JOIN quando algum campo deles é pedido
+        query = fieldsets.select_fields(db.session, PostingJob, available, names)
+        count_query = PostingJob.query
         
         if status_filter:
-            query = query.filter_by(status=status_filter)
+            query = query.filter(PostingJob.status == status_filter)
+            count_query = count_query.filter(PostingJob.status == status_filter)
         
+        # Busca no índice de texto dos vídeos (uma subquery avaliada uma vez)
+        for param, to_match in (('q', search.match_query), ('hashtag', search.hashtag_query)):
+            if request.args.get(param):
+                video_ids = search.matching_video_ids(db.session, to_match(request.args.get(param)))
+                query = query.filter(PostingJob.video_id.in_(video_ids))
+                count_query = count_query.filter(PostingJob.video_id.in_(video_ids))
+        
+        # Total contado sem os JOINs (são todos por chave, não mudam a contagem)
         jobs = query.order_by(PostingJob.scheduled_time.asc()).paginate(
-            page=page, per_page=per_page, error_out=False
+            page=page, per_page=per_page, error_out=False, count=False
         )
-        
-        # Incluir informações da conta e vídeo
-        jobs_data = []
-        for job in jobs.items:
-            job_dict = job.to_dict()
-            
-            # Adicionar informações da conta
-            account = TikTokAccount.query.get(job.tiktok_account_id)
-            if account:
-                job_dict['account_username'] = account.username
-                job_dict['account_status'] = account.status
-            
-            # Adicionar informações do vídeo
-            from src.models.video import Video
-            video = Video.query.get(job.video_id)
-            if video:
-                job_dict['video_filename'] = video.original_filename
-                job_dict['video_duration'] = video.get_duration_formatted()
-            
-            jobs_data.append(job_dict)
+        jobs.total = count_query.order_by(None).count()
         
         return jsonify({
             'success': True,
-            'jobs': jobs_data,
+            'jobs': fieldsets.serialize(jobs.items, available, names),
             'pagination': {
                 'page': jobs.page,
                 'pages': jobs.pages,
@@ -55,6 +60,16 @@ def get_jobs():
             }
         })
         
+    except search.SearchUnavailable as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 501
+    except (fieldsets.FieldsetError, search.SearchError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -107,6 +122,9 @@ def retry_job(job_id):
                 'error': 'Número máximo de tentativas excedido'
             }), 400
         
+        # O resultado anterior sai dos rollups; o novo entra quando terminar
+        job_archive.unroll(job)
+        
         # Reagendar para 5 minutos a partir de agora
         job.scheduled_time = datetime.utcnow() + timedelta(minutes=5)
         job.status = 'pending'
@@ -157,6 +175,7 @@ def update_job_url(job_id):
         
         # Se o job estava pendente ou com erro, marcar como completo
         if job.status in ['pending', 'failed']:
+            job_archive.unroll(job)
             job.update_status('completed')
         
         db.session.commit()
@@ -187,7 +206,7 @@ def cancel_job(job_id):
                 'error': 'Apenas jobs pendentes podem ser cancelados'
             }), 400
         
-        job.update_status('failed', 'Cancelado pelo usuário')
+        job.update_status('failed', 'Cancelado pelo usuário', 'cancelled')
         db.session.commit()
         
         return jsonify({
@@ -203,14 +222,17 @@ def cancel_job(job_id):
         }), 500
 
 @posting_jobs_bp.route('/jobs/stats', methods=['GET'])
+@conditional('posting_jobs', 'job_rollups_hourly', time_bucket=60)
 def get_jobs_stats():
     """Retorna estatísticas dos jobs"""
     try:
-        total_jobs = PostingJob.query.count()
-        pending_jobs = PostingJob.query.filter_by(status='pending').count()
-        processing_jobs = PostingJob.query.filter_by(status='processing').count()
-        completed_jobs = PostingJob.query.filter_by(status='completed').count()
-        failed_jobs = PostingJob.query.filter_by(status='failed').count()
+        # Tabela quente agrupada por status + rollups dos finalizados (inclui o arquivo)
+        counts = job_archive.status_counts()
+        total_jobs = sum(counts.values())
+        pending_jobs = counts['pending']
+        processing_jobs = counts['processing']
+        completed_jobs = counts['completed']
+        failed_jobs = counts['failed']
         
         # Jobs nas próximas 24 horas
         tomorrow = datetime.utcnow() + timedelta(days=1)
@@ -245,61 +267,165 @@ def get_jobs_stats():
             'error': str(e)
         }), 500
 
+@posting_jobs_bp.route('/jobs/history', methods=['GET'])
+@conditional('posting_jobs', 'job_rollups_hourly', time_bucket=60)
+def get_jobs_history():
+    """Série horária de jobs finalizados (por status, classe de erro ou conta)"""
+    try:
+        hours = min(int(request.args.get('hours', 24)), 24 * 90)
+        account_id = request.args.get('account_id', type=int)
+        group_by = request.args.get('group_by', 'status')
+        
+        return jsonify({
+            'success': True,
+            'group_by': group_by,
+            'history': job_archive.history(hours, account_id, group_by)
+        })
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@posting_jobs_bp.route('/jobs/export', methods=['GET'])
+def export_jobs():
+    """Exporta jobs em NDJSON ou CSV, em stream (?format=csv&status=&account_id=&since=&until=&gzip=true).
+
+    ?include_archived=true acrescenta os jobs arquivados depois dos ativos;
+    ?fields= escolhe as colunas, como em /api/jobs.
+    """
+    try:
+        names = fieldsets.parse_fields(request.args.get('fields'), fieldsets.job_fields())
+        fmt = export.parse_format(request.args.get('format'))
+        rows = export.job_rows(
+            db.session, names,
+            status=request.args.get('status'),
+            account_id=request.args.get('account_id', type=int),
+            since=export.parse_datetime(request.args.get('since'), 'since'),
+            until=export.parse_datetime(request.args.get('until'), 'until'),
+            include_archived=request.args.get('include_archived', 'false').lower() == 'true'
+        )
+        return export.stream_export(
+            'jobs', rows, fieldsets.job_fields(), names, fmt,
+            compress=request.args.get('gzip', 'false').lower() == 'true'
+        )
+        
+    except (fieldsets.FieldsetError, export.ExportError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@posting_jobs_bp.route('/jobs/archive', methods=['GET'])
+@conditional('posting_jobs_archive')
+def get_archived_jobs():
+    """Lista os jobs arquivados"""
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 20))
+        
+        query = ArchivedPostingJob.query
+        if request.args.get('status'):
+            query = query.filter_by(status=request.args.get('status'))
+        if request.args.get('account_id'):
+            query = query.filter_by(tiktok_account_id=int(request.args.get('account_id')))
+        
+        jobs = query.order_by(ArchivedPostingJob.completed_at.desc()).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        
+        return jsonify({
+            'success': True,
+            'jobs': [job.to_dict() for job in jobs.items],
+            'pagination': {
+                'page': jobs.page,
+                'pages': jobs.pages,
+                'per_page': jobs.per_page,
+                'total': jobs.total
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @posting_jobs_bp.route('/jobs/process', methods=['POST'])
 def process_pending_jobs():
-    """Processa jobs pendentes (simulação)"""
+    """Processa jobs pendentes através do backend de postagem configurado"""
     try:
-        # Buscar jobs pendentes que devem ser executados agora
-        now = datetime.utcnow()
-        pending_jobs = PostingJob.query.filter(
-            PostingJob.status == 'pending',
-            PostingJob.scheduled_time <= now
-        ).limit(5).all()  # Processar até 5 jobs por vez
+        data = request.get_json(silent=True) or {}
+        summary = dispatch_due_jobs(data.get('limit'))
         
-        processed_count = 0
+        return jsonify({
+            'success': True,
+            'message': f"{summary['completed']} jobs processados com sucesso",
+            'processed_count': summary['completed'],
+            'failed_count': summary['failed'],
+            'requeued_count': summary['requeued'],
+            'total_pending': summary['total_pending']
+        })
         
-        for job in pending_jobs:
-            # Verificar se a conta está ativa
-            account = TikTokAccount.query.get(job.tiktok_account_id)
-            if not account or account.status != 'active':
-                job.update_status('failed', 'Conta não está ativa')
-                continue
-            
-            # Simular processamento
-            job.update_status('processing')
+    except governor.OverBudget as e:
+        # Drain: os jobs continuam pending e o waker chama de novo quando a máquina voltar
+        return governor.over_budget_response(e)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@posting_jobs_bp.route('/jobs/plan', methods=['POST'])
+@idempotent
+def plan_campaign_jobs():
+    """Planeja (dry_run, padrão) ou cria os jobs de uma campanha: vários vídeos em várias contas"""
+    try:
+        data = request.get_json(silent=True) or {}
+        dry_run = data.get('dry_run', True)
+        plan = campaign_planner.plan_campaign(data)
+        
+        created = 0
+        if not dry_run:
+            created = campaign_planner.commit_plan(plan)
             db.session.commit()
-            
-            # Aqui seria implementada a lógica real de postagem no TikTok
-            # Por enquanto, simula sucesso/falha
-            import random
-            import time
-            
-            time.sleep(2)  # Simula tempo de processamento
-            
-            success = random.choice([True, True, True, False])  # 75% de sucesso
-            
-            if success:
-                job.update_status('completed')
-                account.increment_post_count()
-                processed_count += 1
-            else:
-                error_messages = [
-                    'Erro de rede durante upload',
-                    'Conta temporariamente limitada',
-                    'Formato de vídeo não aceito',
-                    'Erro interno do TikTok'
-                ]
-                job.update_status('failed', random.choice(error_messages))
+            wake_render_worker()
         
-        db.session.commit()
+        summary = dict(plan['summary'])
+        for key in ('first_slot', 'last_slot'):
+            summary[key] = summary[key].isoformat() if summary[key] else None
         
         return jsonify({
             'success': True,
-            'message': f'{processed_count} jobs processados com sucesso',
-            'processed_count': processed_count,
-            'total_pending': len(pending_jobs)
-        })
-        
+            'dry_run': bool(dry_run),
+            'created': created,
+            'summary': summary,
+            'unplaced': plan['unplaced'],
+            'slots': [
+                {**slot, 'scheduled_time': slot['scheduled_time'].isoformat()}
+                for slot in plan['slots']
+            ]
+        }), 200 if dry_run else 201
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -308,6 +434,7 @@ def process_pending_jobs():
         }), 500
 
 @posting_jobs_bp.route('/jobs/queue', methods=['GET'])
+@conditional('posting_jobs', 'tiktok_accounts', time_bucket=60)
 def get_queue_status():
     """Retorna status da fila de postagem"""
     try:
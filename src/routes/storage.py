@@ -0,0 +1,36 @@
+from flask import Blueprint, request, jsonify
+from src.services import storage
+
+storage_bp = Blueprint('storage', __name__)
+
+@storage_bp.route('/storage/report', methods=['GET'])
+def get_storage_report():
+    """Relatório (dry-run) do que o sweeper removeria agora"""
+    try:
+        return jsonify({
+            'success': True,
+            'report': storage.sweep(dry_run=True)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@storage_bp.route('/storage/sweep', methods=['POST'])
+def run_storage_sweep():
+    """Executa uma passada de limpeza imediatamente"""
+    try:
+        data = request.get_json(silent=True) or {}
+        report = storage.sweep(dry_run=bool(data.get('dry_run', False)))
+        
+        return jsonify({
+            'success': True,
+            'message': f"{len(report['actions'])} arquivos removidos",
+            'report': report
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
@@ -0,0 +1,32 @@
+from flask import Blueprint, jsonify
+from src.services import governor, lifecycle
+
+system_bp = Blueprint('system', __name__)
+
+@system_bp.route('/system/budget', methods=['GET'])
+def get_budget():
+    """Orçamentos de memória, disco e encodes, com o que está reservado agora"""
+    try:
+        return jsonify({
+            'success': True,
+            'budget': governor.status()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@system_bp.route('/system/lifecycle', methods=['GET'])
+def get_lifecycle():
+    """Drain em andamento, trabalho em execução e o próximo vencimento que o waker usa"""
+    try:
+        return jsonify({
+            'success': True,
+            'lifecycle': lifecycle.status()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
@@ -1,20 +1,34 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from src.models.user import db
 from src.models.tiktok_account import TikTokAccount
+from src.services import fieldsets
+from src.services.account_health import check_accounts, status_from_check, summarize
+from src.services.http_cache import conditional
+from src.services.posting_backends import get_backend
 from datetime import datetime
+import asyncio
+import json
 
 tiktok_accounts_bp = Blueprint('tiktok_accounts', __name__)
 
 @tiktok_accounts_bp.route('/accounts', methods=['GET'])
+@conditional('tiktok_accounts')
 def get_accounts():
-    """Lista todas as contas do TikTok"""
+    """Lista todas as contas do TikTok (?fields=id,username,... para trazer só alguns campos)"""
     try:
-        accounts = TikTokAccount.query.all()
+        available = fieldsets.account_fields()
+        names = fieldsets.parse_fields(request.args.get('fields'), available)
+        accounts = fieldsets.select_fields(db.session, TikTokAccount, available, names).all()
         return jsonify({
             'success': True,
-            'accounts': [account.to_dict() for account in accounts],
+            'accounts': fieldsets.serialize(accounts, available, names),
             'total': len(accounts)
         })
+    except fieldsets.FieldsetError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -131,34 +145,29 @@ def test_account(account_id):
     try:
         account = TikTokAccount.query.get_or_404(account_id)
         
-        # Aqui seria implementado o teste real de login
-        # Por enquanto, simula um teste
-        import random
-        import time
-        
-        time.sleep(2)  # Simula tempo de teste
-        
-        # Simula resultado aleatório para demonstração
-        success = random.choice([True, True, True, False])  # 75% de sucesso
+        result = asyncio.run(get_backend(current_app.config).check_account({
+            'account_id': account.id,
+            'username': account.username,
+            'checked_at': datetime.utcnow().isoformat()
+        }))
+        # Mesma regra da checagem em lote: erro transitório não muda o status
+        new_status = status_from_check(result)
+        account.last_checked_at = datetime.utcnow()
+        if new_status:
+            account.update_status(new_status)
+        db.session.commit()
         
-        if success:
-            account.update_status('active')
-            db.session.commit()
-            
-            return jsonify({
-                'success': True,
-                'message': 'Conta testada com sucesso - Login OK',
-                'status': 'active'
-            })
+        if result['outcome'] == 'completed':
+            message = 'Conta testada com sucesso - Login OK'
         else:
-            account.update_status('inactive')
-            db.session.commit()
-            
-            return jsonify({
-                'success': False,
-                'message': 'Falha no teste - Credenciais inválidas ou conta bloqueada',
-                'status': 'inactive'
-            })
+            message = f"Falha no teste - {result['error_message'] or result['error_class']}"
+        return jsonify({
+            'success': result['outcome'] == 'completed',
+            'message': message,
+            'status': account.status,
+            'outcome': result['outcome'],
+            'error_class': result['error_class']
+        })
         
     except Exception as e:
         return jsonify({
@@ -166,7 +175,48 @@ def test_account(account_id):
             'error': str(e)
         }), 500
 
+@tiktok_accounts_bp.route('/accounts/check', methods=['POST'])
+def check_accounts_bulk():
+    """Testa várias contas em paralelo, enviando os resultados (NDJSON) conforme terminam"""
+    data = request.get_json(silent=True) or {}
+    results = check_accounts(
+        status=data.get('status'),
+        account_ids=data.get('account_ids'),
+        skip_checked_within=data.get('skip_checked_within_minutes'),
+        concurrency=data.get('concurrency')
+    )
+    
+    if not data.get('stream', True):
+        try:
+            results = list(results)
+            return jsonify({
+                'success': True,
+                'results': results,
+                'summary': summarize(results)
+            })
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    def generate():
+        finished = []
+        try:
+            for result in results:
+                finished.append(result)
+                yield json.dumps(result) + '\n'
+            # A última linha sai depois da gravação em lote dos status
+            yield json.dumps({'summary': summarize(finished)}) + '\n'
+        except Exception as e:
+            db.session.rollback()
+            yield json.dumps({'error': str(e)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @tiktok_accounts_bp.route('/accounts/stats', methods=['GET'])
+@conditional('tiktok_accounts', 'posting_jobs', time_bucket=60)
 def get_accounts_stats():
     """Retorna estatísticas das contas"""
     try:
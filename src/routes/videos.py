@@ -1,12 +1,22 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, send_file, current_app, redirect
 from werkzeug.utils import secure_filename
 from src.models.user import db
 from src.models.video import Video, PostingJob
 from src.models.tiktok_account import TikTokAccount
+from src.services import (
+    export, fieldsets, governor, ingest, leases, lifecycle, media, overlays, phash, search, storage, trim
+)
+from src.services.encoding import encode_variant, variant_filter
+from src.services.http_cache import conditional
+from src.services.idempotency import idempotent
+from src.services.render_queue import (
+    jit_enabled, render_proxy, request_render, select_variant, wake_render_worker
+)
+from src.services.tracing import new_trace_id, record_span, span
+import hashlib
 import os
 import json
 from datetime import datetime, timedelta
-import ffmpeg
 
 videos_bp = Blueprint('videos', __name__)
 
@@ -18,6 +28,8 @@ def allowed_file(filename):
 
 def get_video_info(file_path):
     """Extrai informações do vídeo usando ffmpeg"""
+    import ffmpeg
+    
     try:
         probe = ffmpeg.probe(file_path)
         video_stream = next((stream for stream in probe['streams'] if stream['codec_type'] == 'video'), None)
@@ -38,125 +50,224 @@ def get_video_info(file_path):
     
     return None
 
-def process_video_cuts(video_id):
-    """Processa os cortes do vídeo em diferentes formatos"""
+def process_video_cuts(video_id, wait=None):
+    """Processa os cortes do vídeo em diferentes formatos.
+
+    Cada encode espera até `wait` segundos por memória/disco/vaga no governor
+    (padrão: GOVERNOR_ENCODE_WAIT_SECONDS). Sem vaga, o vídeo volta para
+    'uploaded' na fila da ingestão e o retorno é None. Durante o drain nada
+    novo é pego; o encode em andamento para na fronteira de um segmento e o
+    vídeo fica em 'uploaded' para o próximo boot.
+    """
     try:
+        if governor.draining():
+            return None
+        
         video = Video.query.get(video_id)
         if not video:
             return False
         
-        video.update_processing_status('processing')
-        db.session.commit()
-        
-        input_path = video.file_path
-        base_name = os.path.splitext(video.original_filename)[0]
-        output_dir = os.path.join(os.path.dirname(input_path), 'processed')
-        os.makedirs(output_dir, exist_ok=True)
-        
-        processed_files = {}
-        
-        # Obter informações do vídeo original
-        video_info = get_video_info(input_path)
-        if not video_info:
-            video.update_processing_status('error')
-            db.session.commit()
+        # Outro worker (ou o reaper) pode já ter pego o vídeo
+        if not leases.claim(
+            Video, video_id, ('uploaded',), 'processing', status_attr='processing_status',
+            processing_attempts=db.func.coalesce(Video.processing_attempts, 0) + 1
+        ):
             return False
         
-        original_width = video_info['width']
-        original_height = video_info['height']
-        
-        # Corte vertical (9:16) - TikTok padrão
-        if video.cut_vertical:
-            output_path = os.path.join(output_dir, f"{base_name}_vertical.mp4")
-            
-            # Calcular dimensões para 9:16
-            target_height = original_height
-            target_width = int(target_height * 9 / 16)
-            
-            if target_width <= original_width:
-                # Crop horizontal
-                x_offset = (original_width - target_width) // 2
-                (
-                    ffmpeg
-                    .input(input_path)
-                    .filter('crop', target_width, target_height, x_offset, 0)
-                    .output(output_path, vcodec='libx264', acodec='aac')
-                    .overwrite_output()
-                    .run(quiet=True)
-                )
-            else:
-                # Scale down
-                (
-                    ffmpeg
-                    .input(input_path)
-                    .filter('scale', target_width, target_height)
-                    .output(output_path, vcodec='libx264', acodec='aac')
-                    .overwrite_output()
-                    .run(quiet=True)
-                )
-            
-            processed_files['vertical'] = output_path
-        
-        # Corte quadrado (1:1)
-        if video.cut_square:
-            output_path = os.path.join(output_dir, f"{base_name}_square.mp4")
-            
-            # Usar a menor dimensão como base
-            size = min(original_width, original_height)
-            x_offset = (original_width - size) // 2
-            y_offset = (original_height - size) // 2
-            
-            (
-                ffmpeg
-                .input(input_path)
-                .filter('crop', size, size, x_offset, y_offset)
-                .output(output_path, vcodec='libx264', acodec='aac')
-                .overwrite_output()
-                .run(quiet=True)
-            )
-            
-            processed_files['square'] = output_path
+        with lifecycle.busy(), leases.heartbeat(Video, [video_id]):
+            return _process_claimed_video(video, governor.encode_wait() if wait is None else wait)
         
-        # Corte horizontal (16:9 para 9:16)
-        if video.cut_horizontal:
-            output_path = os.path.join(output_dir, f"{base_name}_horizontal.mp4")
-            
-            # Para vídeos horizontais, criar versão vertical
-            target_width = int(original_height * 9 / 16)
-            x_offset = (original_width - target_width) // 2
-            
-            (
-                ffmpeg
-                .input(input_path)
-                .filter('crop', target_width, original_height, x_offset, 0)
-                .output(output_path, vcodec='libx264', acodec='aac')
-                .overwrite_output()
-                .run(quiet=True)
-            )
-            
-            processed_files['horizontal'] = output_path
+    except Exception as e:
+        print(f"Erro no processamento do vídeo: {e}")
+        db.session.rollback()
+        return False
+
+def _process_claimed_video(video, wait):
+    try:
+        # Com backend remoto, o original vem do bucket para o cache local e fica protegido durante o encode
+        with media.local(video.file_path) as input_path:
+            return _encode_video(video, input_path, wait)
         
-        # Atualizar vídeo com arquivos processados
-        video.update_processing_status('processed', json.dumps(processed_files))
+    except governor.OverBudget as e:
+        # Sem recursos agora não é falha do vídeo: volta à fila sem gastar tentativa
+        print(f"Processamento do vídeo adiado: {e}")
+        db.session.rollback()
+        video.update_processing_status('uploaded')
+        video.processing_attempts = max(0, (video.processing_attempts or 1) - 1)
+        leases.release(video)
         db.session.commit()
-        
-        return True
+        # No drain, quem retoma é o reaper do próximo boot (segmentos prontos são reaproveitados)
+        if not governor.draining():
+            ingest.enqueue([video.id])
+        return None
         
     except Exception as e:
         print(f"Erro no processamento do vídeo: {e}")
+        db.session.rollback()
         video.update_processing_status('error')
         db.session.commit()
         return False
 
+def _encode_video(video, input_path, wait):
+    # Variantes já publicadas numa tentativa interrompida (drain/reaper) não são refeitas
+    processed_files = json.loads(video.processed_files or '{}')
+    
+    # Obter informações do vídeo original
+    with span('probe', video.trace_id):
+        video_info = get_video_info(input_path)
+    if not video_info:
+        video.update_processing_status('error')
+        db.session.commit()
+        return False
+    
+    # Pontas mudas e paradas ficam fora de todas as variantes (também no modo sob demanda)
+    if current_app.config.get('TRIM_ENABLED', False):
+        with span('trim', video.trace_id):
+            active_range = trim.detect_active_range(input_path, video_info['duration'])
+        video.trim_start, video.trim_end = active_range or (None, None)
+        db.session.commit()
+    
+    # No modo sob demanda, as variantes só são renderizadas quando um job as usa
+    if jit_enabled():
+        video.update_processing_status('processed')
+        db.session.commit()
+        return True
+    
+    # Cortes: vertical (9:16, TikTok padrão), quadrado (1:1) e horizontal (16:9 para 9:16)
+    variants = [
+        variant for variant, enabled in (
+            ('vertical', video.cut_vertical),
+            ('square', video.cut_square),
+            ('horizontal', video.cut_horizontal),
+        ) if enabled
+    ]
+    
+    # Marca d'água, legenda e legendas SRT entram no mesmo passe de encode do corte
+    overlay = overlays.video_overlay(video)
+    
+    for variant in variants:
+        if variant in processed_files and media.exists(processed_files[variant]):
+            continue
+        output_path = storage.processed_path(video.id, video.original_filename, variant)
+        video_filter = variant_filter(variant, video_info['width'], video_info['height'])
+        
+        with governor.encode_slot(input_path, video_info, video_filter, wait, video.trim_range()), \
+                span('encode', video.trace_id, variant=variant):
+            encode_variant(
+                input_path, output_path, video_filter, video_info['duration'], video.trace_id,
+                video.trim_range(), overlay
+            )
+        
+        processed_files[variant] = media.publish(output_path)
+        video.processed_files = json.dumps(processed_files)
+        db.session.commit()
+    
+    # Se os heartbeats falharam, o reaper pode ter devolvido o vídeo à fila
+    db.session.refresh(video)
+    if not leases.owns(video):
+        return False
+    
+    # Atualizar vídeo com arquivos processados
+    video.update_processing_status('processed', json.dumps(processed_files))
+    db.session.commit()
+    
+    return True
+
 @videos_bp.route('/videos', methods=['GET'])
+@conditional('videos')
 def get_videos():
-    """Lista todos os vídeos"""
+    """Lista todos os vídeos (?fields=id,original_filename,... para trazer só alguns campos)"""
     try:
-        videos = Video.query.order_by(Video.created_at.desc()).all()
+        available = fieldsets.video_fields()
+        names = fieldsets.parse_fields(request.args.get('fields'), available)
+        videos = fieldsets.select_fields(db.session, Video, available, names).order_by(Video.created_at.desc())
+        return jsonify({
+            'success': True,
+            'videos': fieldsets.serialize(videos, available, names)
+        })
+    except fieldsets.FieldsetError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@videos_bp.route('/videos/export', methods=['GET'])
+def export_videos():
+    """Exporta vídeos em NDJSON ou CSV, em stream (?format=csv&status=&since=&until=&gzip=true)"""
+    try:
+        available = fieldsets.video_fields()
+        names = fieldsets.parse_fields(request.args.get('fields'), available)
+        fmt = export.parse_format(request.args.get('format'))
+        rows = export.video_rows(
+            db.session, names,
+            status=request.args.get('status'),
+            since=export.parse_datetime(request.args.get('since'), 'since'),
+            until=export.parse_datetime(request.args.get('until'), 'until')
+        )
+        return export.stream_export(
+            'videos', rows, available, names, fmt,
+            compress=request.args.get('gzip', 'false').lower() == 'true'
+        )
+    except (fieldsets.FieldsetError, export.ExportError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@videos_bp.route('/videos/search', methods=['GET'])
+@conditional('videos')
+def search_videos():
+    """Busca por legenda, hashtags e nome do arquivo (?q=dança #viral&limit=20&cursor=...)"""
+    try:
+        available = fieldsets.video_fields()
+        names = fieldsets.parse_fields(request.args.get('fields'), available)
+        hits, next_cursor = search.search_videos(
+            db.session, request.args.get('q'),
+            limit=request.args.get('limit', 20, type=int),
+            cursor=request.args.get('cursor')
+        )
+        
+        # Carrega só a página e devolve na ordem de relevância
+        query_names = names if 'id' in names else ['id'] + names
+        rows = fieldsets.select_fields(db.session, Video, available, query_names).filter(
+            Video.id.in_([video_id for video_id, _ in hits])
+        )
+        by_id = {item['id']: item for item in fieldsets.serialize(rows, available, query_names)}
+        videos = []
+        for video_id, score in hits:
+            item = by_id.get(video_id)
+            if item is None:
+                continue
+            if 'id' not in names:
+                item = {name: item[name] for name in names}
+            item['score'] = round(-score, 4) if score is not None else None
+            videos.append(item)
+        
         return jsonify({
             'success': True,
-            'videos': [video.to_dict() for video in videos]
+            'videos': videos,
+            'next_cursor': next_cursor
         })
+    except search.SearchUnavailable as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 501
+    except (fieldsets.FieldsetError, search.SearchError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -164,6 +275,8 @@ def get_videos():
         }), 500
 
 @videos_bp.route('/videos/upload', methods=['POST'])
+@governor.admission
+@idempotent
 def upload_video():
     """Upload de vídeo"""
     try:
@@ -197,21 +310,34 @@ def upload_video():
                 'error': 'Arquivo muito grande (máximo 100MB)'
             }), 400
         
+        # Overlays: perfil (ou OVERLAY_DEFAULT_PROFILE) e legendas opcionais queimadas nas variantes
+        overlay_profile = overlays.resolve_profile(request.form.get('overlay_profile'))
+        subtitles = request.files.get('subtitles')
+        if subtitles and subtitles.filename:
+            overlays.check_subtitles(subtitles.filename)
+        
         # Salvar arquivo
         filename = secure_filename(file.filename)
-        upload_dir = os.path.join(current_app.root_path, 'uploads')
-        os.makedirs(upload_dir, exist_ok=True)
         
         # Adicionar timestamp ao nome do arquivo
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         name, ext = os.path.splitext(filename)
         filename = f"{name}_{timestamp}{ext}"
         
-        file_path = os.path.join(upload_dir, filename)
-        file.save(file_path)
+        file_path = storage.original_path(filename)
+        trace_id = new_trace_id()
+        with span('save', trace_id, file_size=file_size):
+            file.save(file_path)
+        subtitles_path = None
+        if subtitles and subtitles.filename:
+            subtitles_path = storage.original_path(f"{name}_{timestamp}.{subtitles.filename.rsplit('.', 1)[1].lower()}")
+            subtitles.save(subtitles_path)
+        with open(file_path, 'rb') as f:
+            source_sha256 = hashlib.file_digest(f, 'sha256').hexdigest()
         
         # Extrair informações do vídeo
-        video_info = get_video_info(file_path)
+        with span('probe', trace_id):
+            video_info = get_video_info(file_path)
         
         # Obter configurações do formulário
         data = request.form
@@ -221,6 +347,31 @@ def upload_video():
         caption = data.get('caption', '')
         hashtags = data.get('hashtags', '')
         
+        # Cópias recodificadas/cortadas de um vídeo já enviado: avisar ou recusar
+        duplicate_policy = data.get('on_duplicate') or current_app.config.get('PHASH_DUPLICATE_POLICY', 'warn')
+        video_phash = None
+        duplicates = []
+        if duplicate_policy != 'off':
+            with span('phash', trace_id):
+                video_phash = phash.compute_phash(file_path)
+                duplicates = phash.find_duplicates(video_phash)
+        
+        if duplicates and duplicate_policy == 'reject':
+            os.remove(file_path)
+            if subtitles_path:
+                os.remove(subtitles_path)
+            return jsonify({
+                'success': False,
+                'error': 'Já existe um vídeo quase idêntico',
+                'duplicates': duplicates
+            }), 409
+        
+        # Backend remoto: original e legenda vão para o bucket (a cópia local fica no cache)
+        with span('publish', trace_id):
+            file_path = media.publish(file_path)
+            if subtitles_path:
+                subtitles_path = media.publish(subtitles_path)
+        
         # Criar registro no banco
         video = Video(
             original_filename=file.filename,
@@ -233,35 +384,110 @@ def upload_video():
             cut_square=cut_square,
             cut_horizontal=cut_horizontal,
             caption=caption,
-            hashtags=hashtags
+            hashtags=hashtags,
+            trace_id=trace_id,
+            phash=video_phash,
+            source_sha256=source_sha256,
+            overlay_profile=overlay_profile,
+            subtitles_path=subtitles_path
         )
         
         db.session.add(video)
         db.session.commit()
+        phash.remember(video.id, video_phash)
         
         # Processar vídeo em background (simulado)
         # Em produção, isso seria feito com Celery
-        success = process_video_cuts(video.id)
+        with span('process', trace_id, video_id=video.id):
+            success = process_video_cuts(video.id)
         
         if success:
             return jsonify({
                 'success': True,
                 'message': 'Vídeo enviado e processado com sucesso',
-                'video': video.to_dict()
+                'video': video.to_dict(),
+                'duplicates': duplicates
             }), 201
+        elif success is None:
+            # Servidor ocupado: o vídeo foi salvo e os cortes ficam para a fila
+            db.session.refresh(video)
+            return jsonify({
+                'success': True,
+                'message': 'Vídeo enviado; cortes na fila de processamento',
+                'video': video.to_dict(),
+                'duplicates': duplicates
+            }), 202
         else:
             return jsonify({
                 'success': False,
                 'error': 'Erro no processamento do vídeo'
             }), 500
         
+    except overlays.OverlayError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@videos_bp.route('/videos/bulk', methods=['POST'])
+@governor.admission
+def bulk_upload_videos():
+    """Upload em lote: zip/tar no corpo da requisição (ou no campo `archive` do multipart).
+
+    Os vídeos são extraídos em stream para o storage, analisados em paralelo,
+    deduplicados e cadastrados num único INSERT, com os mesmos cortes,
+    legenda e hashtags (query string ou campos do formulário).
+    """
+    try:
+        # O lote pode passar bem do limite de um upload único
+        request.max_content_length = current_app.config.get('INGEST_MAX_ARCHIVE_MB', 10240) * 1024 * 1024
+        
+        if request.mimetype == 'multipart/form-data':
+            if 'archive' not in request.files:
+                return jsonify({
+                    'success': False,
+                    'error': 'Nenhum arquivo enviado'
+                }), 400
+            stream, values = request.files['archive'].stream, request.form
+        else:
+            stream, values = request.stream, request.args
+        
+        options = ingest.parse_options(values)
+        sources, skipped = ingest.receive_archive(stream)
+        if not sources and not skipped:
+            return jsonify({
+                'success': False,
+                'error': 'Nenhum vídeo encontrado no arquivo'
+            }), 400
+        
+        videos, skipped = ingest.ingest(sources, options, skipped)
+        queued = any(video['processing_status'] == 'uploaded' for video in videos)
+        return jsonify({
+            'success': True,
+            'message': f'{len(videos)} vídeos cadastrados, {len(skipped)} recusados',
+            'videos': videos,
+            'skipped': skipped
+        }), 202 if queued else 201
+        
+    except ingest.IngestError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @videos_bp.route('/videos/<int:video_id>/post', methods=['POST'])
+@idempotent
 def create_posting_jobs(video_id):
     """Cria jobs de postagem para um vídeo"""
     try:
@@ -288,26 +514,18 @@ def create_posting_jobs(video_id):
                 'error': 'Nenhuma conta ativa disponível'
             }), 400
         
-        # Obter arquivos processados
-        processed_files = json.loads(video.processed_files or '{}')
+        # Determinar qual variante usar (prioridade: vertical > square > horizontal)
+        variant, file_path = select_variant(video)
+        if not variant:
+            return jsonify({
+                'success': False,
+                'error': 'Nenhuma variante disponível para postagem'
+            }), 400
         
         jobs_created = []
         current_time = datetime.utcnow()
         
         for i, account_id in enumerate(account_ids):
-            # Determinar qual variante usar (prioridade: vertical > square > horizontal)
-            if 'vertical' in processed_files:
-                variant = 'vertical'
-                file_path = processed_files['vertical']
-            elif 'square' in processed_files:
-                variant = 'square'
-                file_path = processed_files['square']
-            elif 'horizontal' in processed_files:
-                variant = 'horizontal'
-                file_path = processed_files['horizontal']
-            else:
-                continue
-            
             # Calcular tempo de agendamento
             scheduled_time = current_time + timedelta(minutes=i * interval_minutes)
             
@@ -317,13 +535,20 @@ def create_posting_jobs(video_id):
                 video_variant=variant,
                 video_file_path=file_path,
                 caption=video.caption,
-                scheduled_time=scheduled_time
+                scheduled_time=scheduled_time,
+                trace_id=video.trace_id
             )
             
             db.session.add(job)
             jobs_created.append(job)
         
+        # Variante ainda não renderizada: entra na fila com a deadline do primeiro job
+        if jobs_created and jit_enabled() and not media.exists(file_path):
+            request_render(video, variant, min(job.scheduled_time for job in jobs_created))
+        
         db.session.commit()
+        wake_render_worker()
+        record_span('schedule', video.trace_id, current_time, datetime.utcnow(), jobs=len(jobs_created))
         
         return jsonify({
             'success': True,
@@ -356,22 +581,15 @@ def delete_video(video_id):
                 'error': f'Não é possível remover vídeo com {pending_jobs} jobs pendentes'
             }), 400
         
-        # Remover arquivos físicos
-        try:
-            if os.path.exists(video.file_path):
-                os.remove(video.file_path)
-            
-            # Remover arquivos processados
-            if video.processed_files:
-                processed_files = json.loads(video.processed_files)
-                for file_path in processed_files.values():
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-        except Exception as e:
-            print(f"Erro ao remover arquivos: {e}")
+        # Arquivos físicos são removidos pelo sweeper, fora da requisição
+        files_to_remove = [video.file_path, video.subtitles_path]
+        if video.processed_files:
+            files_to_remove.extend(json.loads(video.processed_files).values())
         
         db.session.delete(video)
         db.session.commit()
+        storage.schedule_deletion(files_to_remove)
+        phash.forget(video_id)
         
         return jsonify({
             'success': True,
@@ -385,3 +603,57 @@ def delete_video(video_id):
             'error': str(e)
         }), 500
 
+@videos_bp.route('/videos/<int:video_id>/duplicates', methods=['GET'])
+def get_video_duplicates(video_id):
+    """Lista os vídeos quase idênticos a este (pelo hash perceptual)"""
+    try:
+        video = Video.query.get_or_404(video_id)
+        return jsonify({
+            'success': True,
+            'phash': video.phash,
+            'duplicates': phash.find_duplicates(video.phash, exclude_id=video.id)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@videos_bp.route('/videos/<int:video_id>/preview/<variant>', methods=['GET'])
+def preview_video(video_id, variant):
+    """Preview de uma variante; usa um proxy leve enquanto ela não foi renderizada"""
+    try:
+        video = Video.query.get_or_404(video_id)
+        
+        if variant not in ('vertical', 'square', 'horizontal'):
+            return jsonify({
+                'success': False,
+                'error': 'Variante inválida'
+            }), 400
+        
+        processed_files = json.loads(video.processed_files or '{}')
+        rendered = processed_files.get(variant)
+        if rendered and media.exists(rendered):
+            # Fora do cache local, o cliente baixa direto do bucket por uma URL temporária
+            if media.is_remote(rendered) and not os.path.exists(media.cache_path(rendered)):
+                return redirect(media.presigned_url(rendered))
+            return send_file(media.cache_path(rendered), mimetype='video/mp4', conditional=True)
+        
+        proxy_path = render_proxy(video, variant)
+        if not proxy_path:
+            return jsonify({
+                'success': False,
+                'error': 'Não foi possível gerar o preview'
+            }), 500
+        
+        response = send_file(proxy_path, mimetype='video/mp4', conditional=True)
+        response.headers['X-Preview-Proxy'] = 'true'
+        return response
+        
+    except governor.OverBudget as e:
+        return governor.over_budget_response(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, or_
+
+from src.services.posting_backends import TRANSIENT_ERRORS, get_backend
+
+logger = logging.getLogger(__name__)
+
+_wake_event = threading.Event()
+_checker_thread = None
+
+
+def init_account_health(app):
+    """Inicia a checagem periódica das contas quando ACCOUNT_CHECK_INTERVAL > 0"""
+    if app.config.get('ACCOUNT_CHECK_INTERVAL', 0) > 0:
+        _start_checker(app)
+
+
+def status_from_check(result):
+    """Novo status da conta a partir da checagem, ou None quando não dá para concluir nada.
+
+    Falhas de rede, timeout e erro interno são problemas nossos ou da
+    plataforma, não da conta: o status fica como está e a conta é checada de
+    novo na próxima rodada.
+    """
+    if result['outcome'] == 'completed':
+        return 'active'
+    if result['error_class'] == 'throttled':
+        return 'limited'
+    if result['error_class'] in TRANSIENT_ERRORS:
+        return None
+    return 'inactive'
+
+
+def _select_accounts(status=None, account_ids=None, skip_checked_within=None):
+    from src.models.tiktok_account import TikTokAccount
+
+    query = TikTokAccount.query
+    if status:
+        query = query.filter(TikTokAccount.status.in_(status if isinstance(status, (list, tuple)) else [status]))
+    if account_ids:
+        query = query.filter(TikTokAccount.id.in_(account_ids))
+    if skip_checked_within:
+        cutoff = datetime.utcnow() - timedelta(minutes=skip_checked_within)
+        query = query.filter(or_(TikTokAccount.last_checked_at.is_(None), TikTokAccount.last_checked_at < cutoff))
+
+    return [
+        {'account_id': account.id, 'username': account.username, 'status': account.status}
+        for account in query.order_by(TikTokAccount.id.asc())
+    ]
+
+
+async def _check_as_completed(backend, accounts, limit):
+    semaphore = asyncio.Semaphore(max(1, limit))
+    checked_at = datetime.utcnow().isoformat()
+
+    async def check(account):
+        async with semaphore:
+            return account, await backend.check_account({
+                'account_id': account['account_id'],
+                'username': account['username'],
+                'checked_at': checked_at,
+            })
+
+    tasks = [asyncio.create_task(check(account)) for account in accounts]
+    for next_done in asyncio.as_completed(tasks):
+        yield await next_done
+
+
+def _iterate(async_iterator):
+    """Consome um iterador assíncrono de forma síncrona (para respostas em streaming do Flask)"""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(async_iterator.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(_shutdown(async_iterator))
+        loop.close()
+
+
+async def _shutdown(async_iterator):
+    # Cliente desconectou no meio do stream: cancela as checagens restantes
+    pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    await async_iterator.aclose()
+
+
+def _write_statuses(updates):
+    """Grava todos os resultados em um único UPDATE executemany"""
+    from src.models.user import db
+    from src.models.tiktok_account import TikTokAccount
+
+    if not updates:
+        return
+    table = TikTokAccount.__table__
+    statement = table.update().where(table.c.id == bindparam('b_id')).values(
+        status=bindparam('b_status'),
+        last_checked_at=bindparam('b_checked_at'),
+        updated_at=bindparam('b_checked_at')
+    )
+    db.session.execute(statement, updates)
+    db.session.commit()
+
+
+def check_accounts(status=None, account_ids=None, skip_checked_within=None, concurrency=None):
+    """Checa as contas em paralelo e gera um resultado por conta, na ordem em que terminam.
+
+    Os status só são gravados no fim, de uma vez; se o consumidor parar antes
+    (cliente desconectou), os resultados já obtidos são gravados mesmo assim.
+    """
+    from src.models.user import db
+
+    config = current_app.config
+    accounts = _select_accounts(status, account_ids, skip_checked_within)
+    # Encerra a transação de leitura antes das checagens, para não segurar o banco
+    db.session.close()
+
+    backend = get_backend(config)
+    limit = concurrency or config.get('ACCOUNT_CHECK_CONCURRENCY', 20)
+    updates = []
+    try:
+        for account, result in _iterate(_check_as_completed(backend, accounts, limit)):
+            new_status = status_from_check(result)
+            if new_status:
+                updates.append({
+                    'b_id': account['account_id'],
+                    'b_status': new_status,
+                    'b_checked_at': datetime.utcnow(),
+                })
+            yield {
+                'account_id': account['account_id'],
+                'username': account['username'],
+                'previous_status': account['status'],
+                'status': new_status or account['status'],
+                'conclusive': new_status is not None,
+                'outcome': result['outcome'],
+                'error_class': result['error_class'],
+                'error_message': result['error_message'],
+                'latency_ms': result['latency_ms'],
+            }
+    finally:
+        _write_statuses(updates)
+
+
+def summarize(results):
+    summary = {'checked': 0, 'changed': 0, 'inconclusive': 0, 'by_status': {}}
+    for result in results:
+        summary['checked'] += 1
+        summary['changed'] += result['status'] != result['previous_status']
+        summary['inconclusive'] += not result['conclusive']
+        summary['by_status'][result['status']] = summary['by_status'].get(result['status'], 0) + 1
+    return summary
+
+
+def _checker_loop(app):
+    while True:
+        _wake_event.wait(app.config['ACCOUNT_CHECK_INTERVAL'])
+        _wake_event.clear()
+        try:
+            with app.app_context():
+                from src.models.schema import ensure_schema
+                ensure_schema()
+                summary = summarize(check_accounts(
+                    skip_checked_within=app.config.get('ACCOUNT_CHECK_MIN_AGE_MINUTES', 60)
+                ))
+            if summary['checked']:
+                logger.info('Checagem periódica: %s', summary)
+        except Exception as e:
+            logger.warning('Erro na checagem periódica de contas: %s', e)
+
+
+def _start_checker(app):
+    global _checker_thread
+    if _checker_thread is None or not _checker_thread.is_alive():
+        _checker_thread = threading.Thread(target=_checker_loop, args=(app,), name='account-checker', daemon=True)
+        _checker_thread.start()
+
+
+def rotate_encryption_key():
+    """Recriptografa as senhas das contas com uma chave nova e troca o arquivo da chave.
+
+    A chave nova é gravada num arquivo temporário e só substitui a antiga
+    depois do commit; se algo falhar, as senhas continuam com a chave antiga.
+    """
+    import uuid
+    from cryptography.fernet import Fernet
+    from src.models.tiktok_account import ENCRYPTION_KEY_FILE, TikTokAccount
+    from src.models.user import db
+
+    accounts = TikTokAccount.query.all()
+    old = Fernet(accounts[0]._get_encryption_key()) if accounts else None
+    key = Fernet.generate_key()
+    new = Fernet(key)
+    tmp = f'{ENCRYPTION_KEY_FILE}.{uuid.uuid4().hex[:8]}.tmp'
+    os.makedirs(os.path.dirname(ENCRYPTION_KEY_FILE), exist_ok=True)
+    with open(tmp, 'wb') as f:
+        f.write(key)
+    try:
+        for account in accounts:
+            account.encrypted_password = new.encrypt(old.decrypt(account.encrypted_password.encode())).decode()
+        db.session.commit()
+        os.replace(tmp, ENCRYPTION_KEY_FILE)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return len(accounts)
+
+
+def register_cli(app):
+    """Registra os comandos `flask check-accounts` e `flask rotate-encryption-key`"""
+    import click
+
+    @app.cli.command('check-accounts')
+    @click.option('--status', multiple=True, help='Checa só contas com este status (pode repetir)')
+    @click.option('--skip-checked-within', type=float, default=None, help='Pula contas checadas há menos de N minutos')
+    @click.option('--concurrency', type=int, default=None)
+    def check_accounts_command(status, skip_checked_within, concurrency):
+        """Checa as contas em paralelo, mostrando os resultados conforme terminam"""
+        from src.models.schema import ensure_schema
+
+        ensure_schema()
+        results = []
+        for result in check_accounts(list(status) or None, None, skip_checked_within, concurrency):
+            results.append(result)
+            click.echo(
+                f"{result['username']:<30} {result['previous_status']:>8} -> {result['status']:<8} "
+                f"{result['error_class'] or 'ok'} ({result['latency_ms'] or 0:.0f} ms)"
+            )
+        click.echo(summarize(results))
+
+    @app.cli.command('rotate-encryption-key')
+    def rotate_encryption_key_command():
+        """Troca a chave das senhas das contas (ex.: chave vazada), recriptografando todas"""
+        from src.models.schema import ensure_schema
+
+        ensure_schema()
+        click.echo(f'{rotate_encryption_key()} senhas recriptografadas com a chave nova')
@@ -0,0 +1,323 @@
+import heapq
+import math
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import func, insert
+
+DAY = 86400
+# Jobs que ocupam um horário da conta (falhados e cancelados liberam o horário)
+OCCUPYING_STATUSES = ('pending', 'processing', 'completed')
+
+
+class PlanError(ValueError):
+    """Parâmetros de campanha inválidos (janela mal formatada, vídeo não processado...)"""
+
+
+def parse_windows(windows):
+    """["09:00-12:00", "22:00-02:00"] -> [(início, fim)] em segundos do dia, ordenados.
+
+    Janelas que passam da meia-noite são divididas em duas.
+    """
+    parsed = []
+    for window in windows:
+        try:
+            start, end = window.split('-')
+            start_h, start_m = map(int, start.strip().split(':'))
+            end_h, end_m = map(int, end.strip().split(':'))
+        except (AttributeError, ValueError):
+            raise PlanError(f'Janela inválida: {window!r} (use "HH:MM-HH:MM")')
+        start, end = start_h * 3600 + start_m * 60, end_h * 3600 + end_m * 60
+        if not (0 <= start <= DAY and 0 <= end <= DAY) or start == end:
+            raise PlanError(f'Janela inválida: {window!r}')
+        if start < end:
+            parsed.append((start, end))
+        else:
+            parsed.extend([(start, DAY), (0, end)])
+    if not parsed:
+        raise PlanError('Informe ao menos uma janela de postagem')
+    return sorted(parsed)
+
+
+class AccountSlots:
+    """Agenda de uma conta: janelas, espaçamento mínimo, limite diário e horários ocupados.
+
+    Os horários são segundos desde a meia-noite (UTC) do dia em que o plano
+    começa; `busy` fica ordenado para achar os vizinhos por bisseção. Os jobs
+    já existentes entram com a fração de segundo, e os horários planejados são
+    arredondados para cima, para nunca ficarem a menos do espaçamento.
+    """
+    __slots__ = ('account_id', 'windows', 'spacing', 'daily_cap', 'busy', 'per_day', 'cursor')
+
+    def __init__(self, account_id, windows, spacing, daily_cap, busy, per_day, cursor):
+        self.account_id = account_id
+        self.windows = windows
+        self.spacing = spacing
+        self.daily_cap = daily_cap
+        self.busy = busy
+        self.per_day = per_day
+        self.cursor = cursor
+
+    def _align(self, t):
+        """Primeiro instante >= t dentro de alguma janela"""
+        day, offset = divmod(t, DAY)
+        for start, end in self.windows:
+            if offset < end:
+                return day * DAY + max(offset, start)
+        return (day + 1) * DAY + self.windows[0][0]
+
+    def next_slot(self, horizon):
+        """Primeiro horário livre a partir do cursor, ou None se não houver até `horizon`"""
+        t = self.cursor
+        busy = self.busy
+        spacing = self.spacing
+        while True:
+            t = self._align(t)
+            if t >= horizon:
+                return None
+            day = t // DAY
+            if self.per_day.get(day, 0) >= self.daily_cap:
+                t = (day + 1) * DAY
+                continue
+            i = bisect_left(busy, t)
+            if i and t - busy[i - 1] < spacing:
+                t = math.ceil(busy[i - 1] + spacing)
+                continue
+            if i < len(busy) and busy[i] - t < spacing:
+                t = math.ceil(busy[i] + spacing)
+                continue
+            return t
+
+    def take(self, t):
+        insort(self.busy, t)
+        day = t // DAY
+        self.per_day[day] = self.per_day.get(day, 0) + 1
+        self.cursor = t
+
+
+def assign(videos, accounts, posts_per_video, horizon, taken_pairs=frozenset()):
+    """Guloso com heap: cada post vai para a conta livre mais cedo que ainda não tem o vídeo.
+
+    `videos` é a lista de ids na ordem de prioridade, `accounts` são AccountSlots.
+    Retorna (atribuições [(video_id, account_id, t)], posts que não couberam).
+    """
+    heap = []
+    for index, account in enumerate(accounts):
+        slot = account.next_slot(horizon)
+        if slot is not None:
+            heap.append((slot, index))
+    heapq.heapify(heap)
+
+    assignments = []
+    unplaced = []
+    for video_id in videos:
+        skipped = []
+        placed = 0
+        while placed < posts_per_video and heap:
+            slot, index = heapq.heappop(heap)
+            account = accounts[index]
+            if (video_id, account.account_id) in taken_pairs:
+                skipped.append((slot, index))
+                continue
+            account.take(slot)
+            assignments.append((video_id, account.account_id, slot))
+            placed += 1
+            following = account.next_slot(horizon)
+            if following is not None:
+                skipped.append((following, index))
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        if placed < posts_per_video:
+            unplaced.append({'video_id': video_id, 'missing_posts': posts_per_video - placed})
+    return assignments, unplaced
+
+
+def _seconds(moment, origin):
+    return (moment - origin).total_seconds()
+
+
+def build_accounts(account_ids, origin, start, defaults, overrides):
+    """Monta os AccountSlots com os jobs já agendados, posts do dia e last_post_time das contas"""
+    from src.models.user import db
+    from src.models.video import PostingJob
+    from src.models.tiktok_account import TikTokAccount
+
+    start_offset = math.ceil(_seconds(start, origin))
+    busy = defaultdict(list)
+    per_day = defaultdict(Counter)
+
+    # Só os horários a partir do dia de início importam para espaçamento e limite diário
+    occupied_at = func.coalesce(PostingJob.completed_at, PostingJob.scheduled_time)
+    for account_id, moment in db.session.query(PostingJob.tiktok_account_id, occupied_at).filter(
+        PostingJob.tiktok_account_id.in_(account_ids),
+        PostingJob.status.in_(OCCUPYING_STATUSES),
+        occupied_at >= origin
+    ):
+        t = _seconds(moment, origin)
+        busy[account_id].append(t)
+        per_day[account_id][int(t // DAY)] += 1
+
+    last_posts = dict(db.session.query(TikTokAccount.id, TikTokAccount.last_post_time).filter(
+        TikTokAccount.id.in_(account_ids)
+    ))
+
+    accounts = []
+    for account_id in account_ids:
+        settings = {**defaults, **overrides.get(account_id, {})}
+        account_busy = busy[account_id]
+        last_post = last_posts.get(account_id)
+        if last_post is not None and last_post >= origin - timedelta(days=1):
+            # Post anterior ao início do plano: só conta para o espaçamento
+            account_busy.append(_seconds(last_post, origin))
+        account_busy.sort()
+        accounts.append(AccountSlots(
+            account_id=account_id,
+            windows=settings['windows'],
+            spacing=int(settings['min_spacing_minutes'] * 60),
+            daily_cap=settings['daily_cap'],
+            busy=account_busy,
+            per_day=dict(per_day[account_id]),
+            cursor=start_offset,
+        ))
+    return accounts
+
+
+def _settings_from(data, fallback):
+    settings = {}
+    if 'windows' in data:
+        settings['windows'] = parse_windows(data['windows'])
+    if 'min_spacing_minutes' in data:
+        settings['min_spacing_minutes'] = float(data['min_spacing_minutes'])
+    if 'daily_cap' in data:
+        settings['daily_cap'] = int(data['daily_cap'])
+    if fallback is not None:
+        settings = {**fallback, **settings}
+    if settings.get('daily_cap', 1) < 1 or settings.get('min_spacing_minutes', 0) < 0:
+        raise PlanError('daily_cap deve ser >= 1 e min_spacing_minutes >= 0')
+    return settings
+
+
+def plan_campaign(data):
+    """Planeja os horários de uma campanha: vídeos x contas, respeitando o que já está na fila.
+
+    `data` segue o corpo de POST /api/jobs/plan. Não grava nada; ver commit_plan.
+    """
+    from src.models.video import Video, PostingJob
+    from src.models.tiktok_account import TikTokAccount
+
+    config = current_app.config
+    video_ids = [int(video_id) for video_id in data.get('video_ids') or []]
+    if not video_ids:
+        raise PlanError('Informe video_ids')
+    videos = {video.id: video for video in Video.query.filter(Video.id.in_(video_ids))}
+    not_ready = [video_id for video_id in video_ids if video_id not in videos
+                 or videos[video_id].processing_status != 'processed']
+    if not_ready:
+        raise PlanError(f'Vídeos inexistentes ou não processados: {not_ready}')
+
+    account_ids = [int(account_id) for account_id in data.get('account_ids') or []]
+    if not account_ids:
+        account_ids = [account_id for (account_id,) in TikTokAccount.query.with_entities(
+            TikTokAccount.id
+        ).filter_by(status='active').order_by(TikTokAccount.id.asc())]
+    if not account_ids:
+        raise PlanError('Nenhuma conta ativa disponível')
+
+    defaults = _settings_from(data, {
+        'windows': parse_windows(config.get('CAMPAIGN_WINDOWS', ['09:00-22:00'])),
+        'min_spacing_minutes': config.get('CAMPAIGN_MIN_SPACING_MINUTES', 60),
+        'daily_cap': config.get('CAMPAIGN_DAILY_CAP', 3),
+    })
+    overrides = {
+        int(account_id): _settings_from(settings, None)
+        for account_id, settings in (data.get('account_overrides') or {}).items()
+    }
+
+    start = datetime.fromisoformat(data['start']) if data.get('start') else datetime.utcnow()
+    if start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    horizon_days = float(data.get('horizon_days', config.get('CAMPAIGN_HORIZON_DAYS', 14)))
+    posts_per_video = int(data.get('posts_per_video', 1))
+    if posts_per_video < 1 or posts_per_video > len(account_ids):
+        raise PlanError(f'posts_per_video deve estar entre 1 e {len(account_ids)}')
+
+    origin = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    accounts = build_accounts(account_ids, origin, start, defaults, overrides)
+
+    # A mesma conta nunca recebe o mesmo vídeo duas vezes
+    taken_pairs = set(PostingJob.query.with_entities(PostingJob.video_id, PostingJob.tiktok_account_id).filter(
+        PostingJob.video_id.in_(video_ids),
+        PostingJob.tiktok_account_id.in_(account_ids),
+        PostingJob.status.in_(OCCUPYING_STATUSES)
+    ))
+
+    horizon = _seconds(start + timedelta(days=horizon_days), origin)
+    assignments, unplaced = assign(video_ids, accounts, posts_per_video, horizon, taken_pairs)
+
+    slots = [
+        {'video_id': video_id, 'tiktok_account_id': account_id, 'scheduled_time': origin + timedelta(seconds=t)}
+        for video_id, account_id, t in assignments
+    ]
+    per_account = Counter(slot['tiktok_account_id'] for slot in slots)
+    return {
+        'slots': slots,
+        'unplaced': unplaced,
+        'summary': {
+            'planned': len(slots),
+            'requested': len(video_ids) * posts_per_video,
+            'accounts_used': len(per_account),
+            'max_per_account': max(per_account.values(), default=0),
+            'first_slot': min((slot['scheduled_time'] for slot in slots), default=None),
+            'last_slot': max((slot['scheduled_time'] for slot in slots), default=None),
+        },
+    }
+
+
+def commit_plan(plan):
+    """Cria os jobs do plano em um único INSERT em lote e enfileira as renderizações sob demanda.
+
+    Não faz commit: o chamador commita e avisa o worker de renderização.
+    """
+    from src.models.user import db
+    from src.models.video import PostingJob, Video
+    from src.services import media
+    from src.services.render_queue import jit_enabled, request_render, select_variant
+
+    video_ids = {slot['video_id'] for slot in plan['slots']}
+    videos = {video.id: video for video in Video.query.filter(Video.id.in_(video_ids))}
+    variants = {video_id: select_variant(video) for video_id, video in videos.items()}
+    missing = [video_id for video_id, (variant, _) in variants.items() if not variant]
+    if missing:
+        raise PlanError(f'Nenhuma variante disponível para postagem: {missing}')
+
+    now = datetime.utcnow()
+    rows = []
+    first_slot = {}
+    for slot in plan['slots']:
+        video = videos[slot['video_id']]
+        variant, file_path = variants[video.id]
+        rows.append({
+            'video_id': video.id,
+            'tiktok_account_id': slot['tiktok_account_id'],
+            'video_variant': variant,
+            'video_file_path': file_path,
+            'caption': video.caption,
+            'scheduled_time': slot['scheduled_time'],
+            'trace_id': video.trace_id,
+            'created_at': now,
+            'updated_at': now,
+        })
+        first_slot[video.id] = min(first_slot.get(video.id, slot['scheduled_time']), slot['scheduled_time'])
+
+    if rows:
+        db.session.execute(insert(PostingJob), rows)
+
+    # Variante ainda não renderizada: entra na fila com a deadline do primeiro job do vídeo
+    if jit_enabled():
+        for video_id, scheduled_time in first_slot.items():
+            variant, file_path = variants[video_id]
+            if not media.exists(file_path):
+                request_render(videos[video_id], variant, scheduled_time)
+    return len(rows)
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import secrets
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, func, or_
+
+from src.services import governor, leases, lifecycle, media
+from src.services.posting_backends import TRANSIENT_ERRORS, get_backend, run_bounded
+from src.services.tracing import record_span, span
+
+
+def _append_log(job, entry):
+    logs = json.loads(job.log_data or '[]')
+    logs.append(entry)
+    job.log_data = json.dumps(logs)
+
+
+def _apply_result(job, account, result, now):
+    """Atualiza job e conta a partir do resultado do backend; retorna o desfecho"""
+    _append_log(job, {
+        'at': now.isoformat(),
+        'attempt': job.retry_count,
+        'outcome': result['outcome'],
+        'error_class': result['error_class'],
+        'latency_ms': result['latency_ms'],
+    })
+
+    if result['outcome'] == 'completed':
+        job.update_status('completed')
+        if result['post_url']:
+            job.tiktok_post_url = result['post_url']
+        account.increment_post_count()
+        return 'completed'
+
+    # Erros transitórios voltam para a fila com backoff exponencial (ou Retry-After)
+    if result['error_class'] in TRANSIENT_ERRORS and job.can_retry():
+        base = current_app.config.get('POSTING_RETRY_BASE_SECONDS', 60)
+        delay = result['retry_after'] or base * (2 ** job.retry_count)
+        job.increment_retry()
+        job.status = 'pending'
+        job.error_message = result['error_message']
+        job.error_class = result['error_class']
+        job.scheduled_time = now + timedelta(seconds=delay)
+        job.started_at = None
+        job.worker_id = None
+        job.lease_expires_at = None
+        return 'requeued'
+
+    job.update_status('failed', result['error_message'], result['error_class'])
+    return 'failed'
+
+
+def dispatch_due_jobs(limit=None):
+    """Despacha os jobs vencidos com I/O não bloqueante contra o backend configurado.
+
+    Durante o drain levanta governor.Drained sem pegar nenhum job; um lote já
+    pego termina antes de o processo sair (lifecycle.busy).
+    """
+    if governor.draining():
+        raise governor.Drained()
+    with lifecycle.busy():
+        return _dispatch(limit)
+
+
+def _dispatch(limit):
+    from src.models.user import db
+    from src.models.tiktok_account import TikTokAccount
+    from src.models.video import PostingJob, VariantRender
+
+    config = current_app.config
+    limit = limit or config.get('POSTING_BATCH_SIZE', 50)
+    now = datetime.utcnow()
+
+    # Jobs cuja variante ainda está na fila de renderização esperam a próxima rodada
+    pending_jobs = PostingJob.query.outerjoin(VariantRender, and_(
+        VariantRender.video_id == PostingJob.video_id,
+        VariantRender.variant == PostingJob.video_variant
+    )).filter(
+        PostingJob.status == 'pending',
+        PostingJob.scheduled_time <= now,
+        or_(VariantRender.id.is_(None), VariantRender.status == 'completed')
+    ).order_by(PostingJob.scheduled_time.asc()).limit(limit).all()
+
+    account_ids = {job.tiktok_account_id for job in pending_jobs}
+    accounts = {
+        account.id: account
+        for account in TikTokAccount.query.filter(TikTokAccount.id.in_(account_ids))
+    } if account_ids else {}
+
+    ready = []
+    summary = {'completed': 0, 'failed': 0, 'requeued': 0, 'lost': 0, 'total_pending': len(pending_jobs)}
+    for job in pending_jobs:
+        account = accounts.get(job.tiktok_account_id)
+        if not account or account.status != 'active':
+            job.update_status('failed', 'Conta não está ativa', 'account_inactive')
+            summary['failed'] += 1
+            continue
+        # Outro worker pode ter lido o mesmo lote: só fica com o job quem vencer o UPDATE
+        # Jobs anteriores à coluna post_key ganham a chave no claim (e ela não muda mais)
+        if leases.claim(
+            PostingJob, job.id, ('pending',), 'processing', commit=False, started_at=now,
+            post_key=func.coalesce(PostingJob.post_key, secrets.token_hex(16))
+        ):
+            ready.append((job, account))
+    db.session.commit()
+
+    if not ready:
+        return summary
+
+    payloads = []
+    for job, account in ready:
+        # Espera planejada (criação → horário agendado) e atraso na fila (agendado → início)
+        record_span('scheduled_delay', job.trace_id, job.created_at, job.scheduled_time, job_id=job.id)
+        record_span('queue_wait', job.trace_id, job.scheduled_time, job.started_at, job_id=job.id)
+        payloads.append({
+            'job_id': job.id,
+            'attempt': job.retry_count,
+            # Estável entre tentativas e devoluções do reaper: o backend descarta a postagem repetida
+            'idempotency_key': job.post_key,
+            'account_id': account.id,
+            'username': account.username,
+            'video_path': job.video_file_path,
+            # Mídia no bucket: o serviço de postagem baixa por uma URL temporária
+            'video_url': media.presigned_url(job.video_file_path),
+            'caption': job.caption,
+            'trace_id': job.trace_id,
+        })
+
+    backend = get_backend(config)
+
+    async def post(payload):
+        with span('dispatch', payload['trace_id'], job_id=payload['job_id'], account_id=payload['account_id']):
+            return await backend.post_video(payload)
+
+    with leases.heartbeat(PostingJob, [job.id for job, _ in ready]):
+        results = asyncio.run(run_bounded(post, payloads, config.get('POSTING_MAX_IN_FLIGHT', 20)))
+
+    # Recarrega os jobs numa consulta só para ver quais leases ainda são nossas
+    db.session.expire_all()
+    PostingJob.query.filter(PostingJob.id.in_([job.id for job, _ in ready])).all()
+
+    finished_at = datetime.utcnow()
+    for (job, account), result in zip(ready, results):
+        if not leases.owns(job):
+            # Lease expirou e o reaper já devolveu o job à fila
+            summary['lost'] += 1
+            continue
+        summary[_apply_result(job, account, result, finished_at)] += 1
+    db.session.commit()
+
+    return summary
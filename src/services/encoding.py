@@ -0,0 +1,242 @@
+import bisect
+import contextvars
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+
+from src.services import overlays
+from src.services.tracing import span
+
+VIDEO_CODEC = 'libx264'
+AUDIO_CODEC = 'aac'
+
+
+def _config(key, default):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+
+def variant_filter(variant, width, height):
+    """Retorna (filtro, argumentos) do ffmpeg para a variante, a partir da resolução original"""
+    if variant == 'vertical':
+        # Calcular dimensões para 9:16
+        target_width = int(height * 9 / 16)
+        if target_width <= width:
+            # Crop horizontal
+            return 'crop', (target_width, height, (width - target_width) // 2, 0)
+        # Scale down
+        return 'scale', (target_width, height)
+
+    if variant == 'square':
+        # Usar a menor dimensão como base
+        size = min(width, height)
+        return 'crop', (size, size, (width - size) // 2, (height - size) // 2)
+
+    if variant == 'horizontal':
+        # Para vídeos horizontais, criar versão vertical
+        target_width = int(height * 9 / 16)
+        return 'crop', (target_width, height, (width - target_width) // 2, 0)
+
+    raise ValueError(f'Variante desconhecida: {variant}')
+
+
+def is_segmented(duration):
+    """Se uma fonte com essa duração vai pelo encode por segmentos"""
+    min_duration = _config('SEGMENT_MIN_DURATION', 120)
+    return bool(_config('SEGMENT_ENCODING_ENABLED', False) and duration and duration >= min_duration)
+
+
+def segment_parallelism():
+    """(processos ffmpeg simultâneos, threads de cada um) no encode por segmentos"""
+    workers = _config('SEGMENT_WORKERS', None) or os.cpu_count() or 1
+    return workers, max(1, (os.cpu_count() or 1) // workers)
+
+
+def encode_variant(input_path, output_path, video_filter, duration=None, trace_id=None, trim=None, overlay=None):
+    """Gera uma variante; fontes longas podem ser divididas em segmentos paralelos.
+
+    Com `trim` = (início, fim), só esse trecho da fonte é decodificado e codificado.
+    `overlay` (ver overlays.video_overlay) entra no mesmo filter graph do corte.
+    """
+    length = trim[1] - trim[0] if trim else duration
+    if is_segmented(length):
+        if encode_segmented(input_path, output_path, video_filter, duration, trace_id, trim, overlay):
+            return
+    encode_single_pass(input_path, output_path, video_filter, trim, overlay)
+
+
+def _trim_args(trim):
+    """Seek na entrada: com recodificação o ffmpeg corta no frame exato"""
+    return {'ss': trim[0], 't': trim[1] - trim[0]} if trim else {}
+
+
+def encode_single_pass(input_path, output_path, video_filter, trim=None, overlay=None):
+    import ffmpeg
+
+    filter_name, filter_args = video_filter
+    source = ffmpeg.input(input_path, **_trim_args(trim))
+    video = overlays.apply(
+        source.video.filter(filter_name, *filter_args), overlay, filter_args[0], filter_args[1],
+        trim[0] if trim else 0.0
+    )
+    (
+        ffmpeg
+        # 'a?' mantém o áudio quando existir (o stream filtrado sozinho descartava o som)
+        .output(video, source['a?'], output_path,
+                vcodec=VIDEO_CODEC, acodec=AUDIO_CODEC)
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+
+def keyframe_times(input_path):
+    """Lista os instantes (s) dos keyframes do primeiro stream de vídeo, sem decodificar"""
+    import ffmpeg
+
+    probe = ffmpeg.probe(
+        input_path, select_streams='v:0', show_packets=None,
+        show_entries='packet=pts_time,flags'
+    )
+    times = [
+        float(packet['pts_time']) for packet in probe.get('packets', [])
+        if 'K' in packet.get('flags', '') and packet.get('pts_time') not in (None, 'N/A')
+    ]
+    has_audio = bool(ffmpeg.probe(input_path, select_streams='a').get('streams'))
+    return sorted(times), has_audio
+
+
+def plan_segments(keyframes, duration, segments, start=0.0):
+    """Divide [start, duration] em até `segments` faixas com cortes nos keyframes mais próximos"""
+    boundaries = [start]
+    for i in range(1, segments):
+        target = start + (duration - start) * i / segments
+        pos = bisect.bisect_left(keyframes, target)
+        candidates = keyframes[max(0, pos - 1):pos + 1]
+        if not candidates:
+            continue
+        cut = min(candidates, key=lambda t: abs(t - target))
+        if boundaries[-1] < cut < duration:
+            boundaries.append(cut)
+    boundaries.append(duration)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def checkpoint_dir(input_path, output_path, video_filter, trim=None, overlay=None):
+    """Diretório dos segmentos de um encode, derivado da fonte e dos parâmetros.
+
+    O mesmo encode cai sempre no mesmo diretório: depois de um drain (ou de
+    um restart), os segmentos já prontos são reaproveitados.
+    """
+    key = json.dumps([
+        os.path.basename(input_path), os.path.getsize(input_path), video_filter, trim, overlay,
+    ], sort_keys=True, default=str)
+    name = f'segments_{hashlib.sha1(key.encode()).hexdigest()[:16]}'
+    return os.path.join(os.path.dirname(output_path), name)
+
+
+def encode_segmented(input_path, output_path, video_filter, duration, trace_id=None, trim=None, overlay=None):
+    """Encode paralelo por segmentos alinhados ao GOP.
+
+    Cada faixa entre keyframes vira um processo ffmpeg independente com os
+    mesmos parâmetros; o áudio é codificado uma vez só, e o resultado é
+    juntado pelo concat demuxer sem recodificar. Retorna False quando não há
+    keyframes suficientes para dividir (o chamador cai no single pass).
+
+    Segmento pronto é renomeado do temporário para o nome final, que leva a
+    faixa: no drain, os que não começaram levantam Drained e os prontos
+    ficam em checkpoint_dir para a retomada.
+    """
+    import ffmpeg
+    from src.services import governor
+
+    workers, threads = segment_parallelism()
+    min_segment = _config('SEGMENT_MIN_SECONDS', 10)
+    trim_start, trim_end = trim or (0.0, duration)
+    segment_count = max(1, min(workers * 2, int((trim_end - trim_start) // min_segment)))
+
+    keyframes, has_audio = keyframe_times(input_path)
+    ranges = plan_segments(keyframes, trim_end, segment_count, trim_start)
+    if len(ranges) < 2:
+        return False
+
+    filter_name, filter_args = video_filter
+    work_dir = checkpoint_dir(input_path, output_path, video_filter, trim, overlay)
+    os.makedirs(work_dir, exist_ok=True)
+
+    def checkpointed(path, encode):
+        """Gera `path` via temporário, pulando se já existir de uma execução interrompida"""
+        if os.path.exists(path):
+            return path
+        if governor.draining():
+            raise governor.Drained()
+        base, ext = os.path.splitext(path)
+        tmp = f'{base}.tmp{ext}'
+        encode(tmp)
+        os.replace(tmp, path)
+        return path
+
+    def encode_range(index, start, end):
+        def encode(tmp):
+            with span('encode_segment', trace_id, index=index, start=start, end=end):
+                video = ffmpeg.input(input_path, ss=start, t=end - start).video.filter(filter_name, *filter_args)
+                (
+                    overlays.apply(video, overlay, filter_args[0], filter_args[1], start)
+                    .output(tmp, vcodec=VIDEO_CODEC, an=None, threads=threads)
+                    .overwrite_output()
+                    .run(quiet=True)
+                )
+
+        return checkpointed(os.path.join(work_dir, f'segment_{index:04d}_{start:.3f}_{end:.3f}.mp4'), encode)
+
+    def encode_audio():
+        def encode(tmp):
+            with span('encode_audio', trace_id):
+                (
+                    ffmpeg
+                    .input(input_path, **_trim_args(trim))
+                    .output(tmp, vn=None, acodec=AUDIO_CODEC)
+                    .overwrite_output()
+                    .run(quiet=True)
+                )
+
+        return checkpointed(os.path.join(work_dir, 'audio.m4a'), encode)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Cada tarefa leva uma cópia do contexto para manter o span pai do trace
+            audio_future = executor.submit(contextvars.copy_context().run, encode_audio) if has_audio else None
+            segment_futures = [
+                executor.submit(contextvars.copy_context().run, encode_range, i, start, end)
+                for i, (start, end) in enumerate(ranges)
+            ]
+            segment_paths = [future.result() for future in segment_futures]
+            audio_path = audio_future.result() if audio_future else None
+
+        list_path = os.path.join(work_dir, 'segments.txt')
+        with open(list_path, 'w') as f:
+            for path in segment_paths:
+                f.write(f"file '{path}'\n")
+
+        streams = [ffmpeg.input(list_path, f='concat', safe=0)['v']]
+        if audio_path:
+            streams.append(ffmpeg.input(audio_path)['a'])
+        with span('concat', trace_id, segments=len(segment_paths)):
+            (
+                ffmpeg
+                .output(*streams, output_path, c='copy', movflags='+faststart')
+                .overwrite_output()
+                .run(quiet=True)
+            )
+    except governor.Drained:
+        # Segmentos prontos ficam para a retomada
+        raise
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return True
@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+
+from flask import current_app, stream_with_context
+from sqlalchemy import and_, or_
+
+from src.services import fieldsets
+
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+YIELD_PER = 1000
+FLUSH_BYTES = 64 * 1024
+
+# json.dumps com argumentos cria um encoder por chamada; num milhão de linhas isso pesa
+_json = json.JSONEncoder(ensure_ascii=False)
+
+
+class ExportError(ValueError):
+    """Parâmetro de exportação inválido (formato, data, filtro)"""
+
+
+def parse_format(value):
+    fmt = (value or 'ndjson').lower()
+    if fmt not in FORMATS:
+        raise ExportError(f"Formato inválido: {value} (use {' ou '.join(FORMATS)})")
+    return fmt
+
+
+def parse_datetime(value, name):
+    """Data/hora ISO do filtro (ex.: 2024-05-01 ou 2024-05-01T12:00-03:00), em UTC ingênuo"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f'{name} inválido: use uma data ISO (ex.: 2024-05-01 ou 2024-05-01T12:00)')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _after(keys, last):
+    """Condição de keyset: linhas depois de `last` na ordem de `keys` (a última chave é única)"""
+    if len(keys) == 1:
+        return keys[0] > last[0]
+    if last[0] is None:
+        # NULLs vêm primeiro (ver keyset_rows): depois deles, todo valor não nulo
+        return or_(keys[0].isnot(None), and_(keys[0].is_(None), keys[1] > last[1]))
+    # Forma que o SQLite resolve com range no índice da primeira chave
+    return and_(keys[0] >= last[0], or_(keys[0] > last[0], keys[1] > last[1]))
+
+
+def keyset_rows(query, keys):
+    """Linhas da query na ordem de `keys`, em lotes de EXPORT_BATCH_SIZE lidos com yield_per.
+
+    Cada lote é um SELECT curto: no SQLite sem WAL, um cursor aberto durante
+    a exportação inteira seguraria o lock de leitura e travaria as escritas
+    do dispatcher. As colunas de `keys` vão no fim de cada linha.
+    """
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 5000)
+    query = query.add_columns(*keys).order_by(keys[0].asc().nulls_first(), *keys[1:])
+    last = None
+    while True:
+        batch = query if last is None else query.filter(_after(keys, last))
+        count = 0
+        for row in batch.limit(batch_size).yield_per(YIELD_PER):
+            count += 1
+            last = tuple(row[-len(keys):])
+            yield row
+        if count < batch_size:
+            return
+
+
+def _lines(rows, available, names, fmt):
+    """Texto do arquivo em pedaços de ~FLUSH_BYTES (cabeçalho incluso no CSV)"""
+    formatted = [(index, available[name].format) for index, name in enumerate(names) if available[name].format]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(names)
+
+    for row in rows:
+        values = list(row[:len(names)])
+        for index, format_value in formatted:
+            values[index] = format_value(values[index])
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(_json.encode(dict(zip(names, values))))
+            buffer.write('\n')
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: formato gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(name, rows, available, names, fmt, compress=False):
+    """Resposta em stream (memória constante) com as linhas no formato pedido, opcionalmente .gz"""
+    body = _lines(rows, available, names, fmt)
+    mimetype = FORMATS[fmt]
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    if compress:
+        body = _gzip(body)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+
+    response = current_app.response_class(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Proxies (nginx, Fly) não devem segurar o stream até o fim
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def job_rows(session, names, status=None, account_id=None, since=None, until=None, include_archived=False):
+    """Jobs (e, se pedido, os arquivados depois) por horário agendado, com os filtros aplicados"""
+    from src.models.job_history import ArchivedPostingJob
+    from src.models.video import PostingJob
+
+    sources = [(PostingJob, fieldsets.job_fields())]
+    if include_archived:
+        sources.append((ArchivedPostingJob, fieldsets.archived_job_fields()))
+
+    for model, available in sources:
+        query = fieldsets.select_fields(session, model, available, names)
+        if status:
+            query = query.filter(model.status == status)
+        if account_id:
+            query = query.filter(model.tiktok_account_id == account_id)
+        if since:
+            query = query.filter(model.scheduled_time >= since)
+        if until:
+            query = query.filter(model.scheduled_time < until)
+        yield from keyset_rows(query, (model.scheduled_time, model.id))
+
+
+def video_rows(session, names, status=None, since=None, until=None):
+    """Vídeos por id (ordem de criação), filtrados por status de processamento e data de criação"""
+    from src.models.video import Video
+
+    query = fieldsets.select_fields(session, Video, fieldsets.video_fields(), names)
+    if status:
+        query = query.filter(Video.processing_status == status)
+    if since:
+        query = query.filter(Video.created_at >= since)
+    if until:
+        query = query.filter(Video.created_at < until)
+    return keyset_rows(query, (Video.id,))
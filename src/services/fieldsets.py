@@ -0,0 +1,164 @@
+import functools
+from collections import namedtuple
+
+# Um campo da API: a coluna que o alimenta, a formatação opcional e a tabela
+# extra que precisa entrar no JOIN (campos de outro modelo, ex.: username da conta)
+Field = namedtuple('Field', 'column format join', defaults=(None, None))
+
+
+class FieldsetError(ValueError):
+    """Campo pedido em `fields=` que o endpoint não oferece"""
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _size_mb(file_size):
+    # Mesmo resultado de Video.get_file_size_mb
+    return round(file_size / (1024 * 1024), 2) if file_size else 0
+
+
+def _duration(duration):
+    # Mesmo resultado de Video.get_duration_formatted
+    if duration:
+        return f"{int(duration // 60):02d}:{int(duration % 60):02d}"
+    return "00:00"
+
+
+@functools.lru_cache(maxsize=None)
+def video_fields():
+    """Campos de /api/videos, na ordem de Video.to_dict"""
+    from src.models.video import Video
+
+    c = Video.__table__.c
+    return {
+        'id': Field(c.id),
+        'original_filename': Field(c.original_filename),
+        'file_size_mb': Field(c.file_size, _size_mb),
+        'duration': Field(c.duration, _duration),
+        'resolution': Field(c.resolution),
+        'format': Field(c.format),
+        'cut_vertical': Field(c.cut_vertical),
+        'cut_square': Field(c.cut_square),
+        'cut_horizontal': Field(c.cut_horizontal),
+        'caption': Field(c.caption),
+        'hashtags': Field(c.hashtags),
+        'processing_status': Field(c.processing_status),
+        'trim_start': Field(c.trim_start),
+        'trim_end': Field(c.trim_end),
+        'overlay_profile': Field(c.overlay_profile),
+        'created_at': Field(c.created_at, _iso),
+        'updated_at': Field(c.updated_at, _iso),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def account_fields():
+    """Campos de /api/accounts, na ordem de TikTokAccount.to_dict (nunca a senha)"""
+    from src.models.tiktok_account import TikTokAccount
+
+    c = TikTokAccount.__table__.c
+    return {
+        'id': Field(c.id),
+        'username': Field(c.username),
+        'status': Field(c.status),
+        'last_post_time': Field(c.last_post_time, _iso),
+        'total_posts': Field(c.total_posts),
+        'last_checked_at': Field(c.last_checked_at, _iso),
+        'created_at': Field(c.created_at, _iso),
+        'updated_at': Field(c.updated_at, _iso),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def job_fields():
+    """Campos de /api/jobs: PostingJob.to_dict mais os dados da conta e do vídeo"""
+    from src.models.video import PostingJob, Video
+    from src.models.tiktok_account import TikTokAccount
+
+    c = PostingJob.__table__.c
+    accounts = TikTokAccount.__table__
+    videos = Video.__table__
+    return {
+        'id': Field(c.id),
+        'video_id': Field(c.video_id),
+        'tiktok_account_id': Field(c.tiktok_account_id),
+        'video_variant': Field(c.video_variant),
+        'caption': Field(c.caption),
+        'status': Field(c.status),
+        'scheduled_time': Field(c.scheduled_time, _iso),
+        'started_at': Field(c.started_at, _iso),
+        'completed_at': Field(c.completed_at, _iso),
+        'retry_count': Field(c.retry_count),
+        'max_retries': Field(c.max_retries),
+        'error_message': Field(c.error_message),
+        'error_class': Field(c.error_class),
+        'tiktok_post_url': Field(c.tiktok_post_url),
+        'created_at': Field(c.created_at, _iso),
+        'updated_at': Field(c.updated_at, _iso),
+        'account_username': Field(accounts.c.username, join=(accounts, accounts.c.id == c.tiktok_account_id)),
+        'account_status': Field(accounts.c.status, join=(accounts, accounts.c.id == c.tiktok_account_id)),
+        'video_filename': Field(videos.c.original_filename, join=(videos, videos.c.id == c.video_id)),
+        'video_duration': Field(videos.c.duration, _duration, join=(videos, videos.c.id == c.video_id)),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def archived_job_fields():
+    """Os campos de job_fields lidos de posting_jobs_archive (mesmos nomes de coluna)"""
+    from src.models.job_history import ArchivedPostingJob
+    from src.models.video import Video
+    from src.models.tiktok_account import TikTokAccount
+
+    archive = ArchivedPostingJob.__table__
+    accounts = TikTokAccount.__table__
+    videos = Video.__table__
+    # Os JOINs partem do job arquivado (conta ou vídeo podem já ter sido removidos)
+    joins = {
+        accounts: (accounts, accounts.c.id == archive.c.tiktok_account_id),
+        videos: (videos, videos.c.id == archive.c.video_id),
+    }
+    return {
+        name: Field(field.column, field.format, joins[field.join[0]]) if field.join is not None
+        else Field(archive.c[field.column.name], field.format)
+        for name, field in job_fields().items()
+    }
+
+
+def parse_fields(value, available):
+    """Lista de campos de `fields=a,b,c` (todos quando ausente), na ordem pedida"""
+    if not value:
+        return list(available)
+    names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise FieldsetError(
+            f"Campos inválidos: {', '.join(unknown)} (disponíveis: {', '.join(available)})"
+        )
+    return names or list(available)
+
+
+def select_fields(session, model, available, names):
+    """Query sobre `model` que carrega só as colunas dos campos pedidos, com os JOINs necessários"""
+    fields = [available[name] for name in names]
+    query = session.query(*[field.column for field in fields]).select_from(model)
+
+    joined = []
+    for field in fields:
+        if field.join is not None and field.join[0] not in joined:
+            joined.append(field.join[0])
+            query = query.outerjoin(*field.join)
+    return query
+
+
+def serialize(rows, available, names):
+    """Converte as linhas (tuplas na ordem de `names`) em dicts, formatando só o necessário"""
+    formatted = [(name, available[name].format) for name in names if available[name].format]
+    items = []
+    for row in rows:
+        item = dict(zip(names, row))
+        for name, format_value in formatted:
+            item[name] = format_value(item[name])
+        items.append(item)
+    return items
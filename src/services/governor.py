@@ -0,0 +1,419 @@
+import functools
+import itertools
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import jsonify, make_response, request
+
+from src.services import encoding, storage
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# RSS do ffmpeg (libx264 + aac) medido com fontes 720p e 1080p: uma parte fixa,
+# o decode da fonte e o lookahead/referências do x264 na resolução de saída
+ENCODE_BASE_MB = 30
+DECODE_MB_PER_MEGAPIXEL = 11
+ENCODE_MB_PER_MEGAPIXEL = 170
+# Cada thread extra do x264 acrescenta ~7% (frames em paralelo)
+THREAD_OVERHEAD = 0.07
+AUDIO_ENCODE_MB = 30
+# Arquivo de saída relativo à fonte, proporcional à área; segmentos + concat ocupam o dobro
+DISK_SAFETY_FACTOR = 1.5
+# Corpo em trânsito (spool do multipart) mais a cópia salva no storage
+UPLOAD_MEMORY_MB = 16
+UPLOAD_DISK_FACTOR = 2
+
+RETRY_AFTER_MIN = 5
+RETRY_AFTER_MAX = 600
+EWMA_ALPHA = 0.3
+BACKLOG_CACHE_SECONDS = 5
+RECHECK_SECONDS = 5
+
+MESSAGES = {
+    'encodes': 'Todos os encodes simultâneos estão em uso',
+    'memory': 'Memória insuficiente para mais processamento agora',
+    'disk': 'Pouco espaço livre em disco',
+    'queue': 'Há encodes esperando vez na fila',
+    'backlog': 'Fila de processamento cheia',
+    'draining': 'Servidor encerrando; o trabalho segue quando ele voltar',
+}
+
+Reservation = namedtuple('Reservation', 'kind memory_mb disk_mb started')
+
+_settings = {
+    'enabled': True,
+    'total_memory_mb': 0,
+    'memory_budget_mb': 0,
+    'memory_min_free_mb': 100,
+    'disk_min_free_mb': 500,
+    'max_encodes': 2,
+    'max_backlog': 50,
+    'encode_wait': 30,
+    'queue_wait': 600,
+    'estimate_margin': 1.2,
+}
+_lock = threading.Condition()
+_reservations = {}
+# Encodes esperando vez, em ordem de chegada
+_waiters = deque()
+_ids = itertools.count(1)
+# Duração média de um encode (s), para estimar o Retry-After
+_encode_seconds = [60.0]
+_backlog_cache = {'at': 0.0, 'value': 0}
+# Drain (SIGTERM): nenhuma reserva nova, nem de quem já está na fila
+_draining = threading.Event()
+
+
+class OverBudget(RuntimeError):
+    """Memória, disco ou fila de encodes no limite; `retry_after` em segundos"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Drained(OverBudget):
+    """O processo está encerrando (drain): o trabalho volta à fila em vez de começar"""
+
+    def __init__(self):
+        super().__init__(MESSAGES['draining'], RETRY_AFTER_MIN)
+
+
+def init_governor(app):
+    """Carrega os limites; sem GOVERNOR_MEMORY_BUDGET_MB, o orçamento é a RAM menos a reserva do app"""
+    config = app.config
+    total = total_memory_mb()
+    _settings['enabled'] = config.get('GOVERNOR_ENABLED', True)
+    _settings['total_memory_mb'] = total
+    _settings['memory_budget_mb'] = (
+        config.get('GOVERNOR_MEMORY_BUDGET_MB') or max(0, total - config.get('GOVERNOR_MEMORY_RESERVE_MB', 350))
+    )
+    _settings['memory_min_free_mb'] = config.get('GOVERNOR_MEMORY_MIN_FREE_MB', 100)
+    _settings['disk_min_free_mb'] = config.get('GOVERNOR_DISK_MIN_FREE_MB', 500)
+    _settings['max_encodes'] = max(1, config.get('GOVERNOR_MAX_ENCODES', 2))
+    _settings['max_backlog'] = config.get('GOVERNOR_MAX_BACKLOG', 50)
+    _settings['encode_wait'] = config.get('GOVERNOR_ENCODE_WAIT_SECONDS', 30)
+    _settings['queue_wait'] = config.get('GOVERNOR_QUEUE_WAIT_SECONDS', 600)
+    _settings['estimate_margin'] = config.get('GOVERNOR_ESTIMATE_MARGIN', 1.2)
+
+
+def begin_drain():
+    """Recusa novas reservas e acorda quem espera na fila (que sai com Drained)"""
+    _draining.set()
+    with _lock:
+        _lock.notify_all()
+
+
+def draining():
+    return _draining.is_set()
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _meminfo():
+    """Campos do /proc/meminfo em MB"""
+    values = {}
+    for line in (_read('/proc/meminfo') or '').splitlines():
+        key, _, value = line.partition(':')
+        if value.strip():
+            values[key] = int(value.split()[0]) // 1024
+    return values
+
+
+def _cgroup_memory():
+    """(limite, uso) do cgroup v2 em MB; None sem limite (container sem memory.max)"""
+    limit = _read('/sys/fs/cgroup/memory.max')
+    current = _read('/sys/fs/cgroup/memory.current')
+    if not limit or limit == 'max' or not current:
+        return None
+    return int(limit) // MB, int(current) // MB
+
+
+def total_memory_mb():
+    total = _meminfo().get('MemTotal', 0)
+    cgroup = _cgroup_memory()
+    if cgroup:
+        total = min(total, cgroup[0]) if total else cgroup[0]
+    return total
+
+
+def available_memory_mb():
+    """Memória que ainda pode ser alocada sem swap/OOM (None se o sistema não informa)"""
+    available = _meminfo().get('MemAvailable')
+    cgroup = _cgroup_memory()
+    if cgroup:
+        headroom = cgroup[0] - cgroup[1]
+        available = headroom if available is None else min(available, headroom)
+    return available
+
+
+def free_disk_mb():
+    return shutil.disk_usage(storage.temp_dir()).free // MB
+
+
+def estimate_encode(width, height, video_filter, input_size, duration=None):
+    """(memória, disco) em MB para gerar a variante, a partir do probe da fonte"""
+    _, filter_args = video_filter
+    source_mp = width * height / 1e6
+    output_mp = filter_args[0] * filter_args[1] / 1e6
+    segmented = encoding.is_segmented(duration)
+    if segmented:
+        processes, threads = encoding.segment_parallelism()
+    else:
+        # Sem -threads, o x264 usa 1,5 thread por núcleo
+        processes, threads = 1, max(1, math.ceil((os.cpu_count() or 1) * 1.5))
+
+    per_process = ENCODE_BASE_MB + DECODE_MB_PER_MEGAPIXEL * source_mp + ENCODE_MB_PER_MEGAPIXEL * output_mp
+    memory = per_process * (1 + THREAD_OVERHEAD * (threads - 1)) * processes
+    if segmented:
+        memory += AUDIO_ENCODE_MB
+    disk = input_size / MB * min(1.0, output_mp / source_mp) * DISK_SAFETY_FACTOR * (2 if segmented else 1)
+    return math.ceil(memory * _settings['estimate_margin']), math.ceil(disk)
+
+
+def _reserved():
+    memory = sum(reservation.memory_mb for reservation in _reservations.values())
+    disk = sum(reservation.disk_mb for reservation in _reservations.values())
+    encodes = sum(1 for reservation in _reservations.values() if reservation.kind == 'encode')
+    return memory, disk, encodes
+
+
+def _check(kind, memory_mb, disk_mb):
+    """Motivo ('encodes', 'memory', 'disk') pelo qual a reserva não cabe agora, ou None"""
+    reserved_memory, reserved_disk, encodes = _reserved()
+    if kind == 'encode' and encodes >= _settings['max_encodes']:
+        return 'encodes'
+
+    # Sozinha, uma reserva maior que o orçamento passa (senão nunca rodaria);
+    # o piso de memória livre medida continua valendo
+    if reserved_memory and reserved_memory + memory_mb > _settings['memory_budget_mb']:
+        return 'memory'
+    available = available_memory_mb()
+    if available is not None:
+        needed = memory_mb if reserved_memory else 0
+        if available - needed < _settings['memory_min_free_mb']:
+            return 'memory'
+
+    if free_disk_mb() - reserved_disk - disk_mb < _settings['disk_min_free_mb']:
+        storage.wake_sweeper()
+        return 'disk'
+    return None
+
+
+def _retry_after(reason, pending=None):
+    """Segundos até a próxima tentativa valer a pena, pela duração média dos encodes"""
+    if pending is None:
+        pending = len(_waiters) + _reserved()[2]
+    if reason == 'disk':
+        # Espaço volta quando o sweeper roda ou um encode termina e libera a estimativa
+        pending = max(pending, _settings['max_encodes'])
+    seconds = _encode_seconds[0] * (pending + 1) / _settings['max_encodes']
+    return int(min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, math.ceil(seconds))))
+
+
+@contextmanager
+def reserve(kind, memory_mb, disk_mb=0, wait=0):
+    """Reserva memória/disco (e, para 'encode', uma vaga de encode) enquanto o bloco executa.
+
+    Com `wait`, entra numa fila FIFO e espera até `wait` segundos pela vez;
+    sem espera, encodes não furam a fila. Quando não cabe, levanta OverBudget.
+    Memória e disco medidos também mudam por fora, então a espera reavalia
+    a cada RECHECK_SECONDS mesmo sem aviso. Durante o drain, levanta Drained.
+    """
+    if _draining.is_set():
+        raise Drained()
+    if not _settings['enabled']:
+        yield
+        return
+
+    token = object()
+    deadline = time.monotonic() + (wait or 0)
+    with _lock:
+        if wait:
+            _waiters.append(token)
+        try:
+            while True:
+                if _draining.is_set():
+                    raise Drained()
+                if wait and _waiters[0] is not token:
+                    reason = 'queue'
+                elif not wait and kind == 'encode' and _waiters:
+                    reason = 'queue'
+                else:
+                    reason = _check(kind, memory_mb, disk_mb)
+                if reason is None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise OverBudget(MESSAGES[reason], _retry_after(reason))
+                _lock.wait(min(remaining, RECHECK_SECONDS))
+        finally:
+            if wait:
+                _waiters.remove(token)
+                _lock.notify_all()
+        reservation_id = next(_ids)
+        _reservations[reservation_id] = Reservation(kind, memory_mb, disk_mb, time.monotonic())
+
+    try:
+        yield
+    finally:
+        with _lock:
+            reservation = _reservations.pop(reservation_id)
+            if kind == 'encode':
+                elapsed = time.monotonic() - reservation.started
+                _encode_seconds[0] += EWMA_ALPHA * (elapsed - _encode_seconds[0])
+            _lock.notify_all()
+
+
+def encode_slot(input_path, video_info, video_filter, wait=0, trim=None):
+    """Reserva para gerar uma variante de `input_path` (ver estimate_encode)"""
+    input_size = os.path.getsize(input_path)
+    duration = video_info.get('duration')
+    if trim and duration:
+        # Só o trecho é codificado: a saída encolhe na mesma proporção
+        input_size = input_size * (trim[1] - trim[0]) / duration
+        duration = trim[1] - trim[0]
+    memory_mb, disk_mb = estimate_encode(
+        video_info['width'], video_info['height'], video_filter, input_size, duration
+    )
+    return reserve('encode', memory_mb, disk_mb, wait)
+
+
+def encode_wait():
+    """Espera por vaga de quem está numa requisição (o cliente aguarda a resposta)"""
+    return _settings['encode_wait']
+
+
+def queue_wait():
+    """Espera por vaga dos workers em background (nada aguarda além da fila)"""
+    return _settings['queue_wait']
+
+
+def backlog():
+    """Encodes atrasados: vídeos com cortes por fazer e renderizações com deadline vencida.
+
+    Renderizações de jobs futuros não contam: estão agendadas, não acumuladas.
+    O valor fica em cache por BACKLOG_CACHE_SECONDS (consultado a cada upload).
+    """
+    from src.models.video import VariantRender, Video
+
+    now = time.monotonic()
+    if now - _backlog_cache['at'] > BACKLOG_CACHE_SECONDS:
+        uploaded = Video.query.filter(Video.processing_status.in_(('uploaded', 'processing'))).count()
+        overdue = VariantRender.query.filter(
+            VariantRender.status == 'pending', VariantRender.deadline <= datetime.utcnow()
+        ).count()
+        _backlog_cache.update(at=now, value=uploaded + overdue)
+    return _backlog_cache['value']
+
+
+def over_budget_response(error):
+    response = make_response(jsonify({
+        'success': False,
+        'error': str(error),
+        'retry_after': error.retry_after
+    }), 503)
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def admission(view):
+    """Controle de admissão de uploads: 503 com Retry-After em vez de aceitar o que não cabe.
+
+    Recusa quando a fila de encodes atrasados passou de GOVERNOR_MAX_BACKLOG
+    ou quando o corpo (pelo Content-Length) não cabe no disco/memória. A
+    reserva vale até a resposta; fica acima de @idempotent, para que a key
+    não seja consumida por um pedido recusado. Durante o drain, recusa tudo.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if _draining.is_set():
+            return over_budget_response(Drained())
+        if not _settings['enabled']:
+            return view(*args, **kwargs)
+
+        pending = backlog()
+        if _settings['max_backlog'] and pending >= _settings['max_backlog']:
+            return over_budget_response(OverBudget(MESSAGES['backlog'], _retry_after('backlog', pending)))
+
+        disk_mb = math.ceil((request.content_length or 0) * UPLOAD_DISK_FACTOR / MB)
+        try:
+            with reserve('upload', UPLOAD_MEMORY_MB, disk_mb):
+                return view(*args, **kwargs)
+        except OverBudget as e:
+            return over_budget_response(e)
+
+    return wrapper
+
+
+def status():
+    """Estado dos orçamentos para o endpoint /api/system/budget"""
+    with _lock:
+        reserved_memory, reserved_disk, encodes = _reserved()
+        waiting = len(_waiters)
+        reservations = [
+            {'kind': r.kind, 'memory_mb': r.memory_mb, 'disk_mb': r.disk_mb,
+             'running_seconds': round(time.monotonic() - r.started, 1)}
+            for r in _reservations.values()
+        ]
+        refusal = _check('upload', UPLOAD_MEMORY_MB, 0)
+        retry_after = _retry_after(refusal) if refusal else None
+
+    pending = backlog()
+    if _settings['max_backlog'] and pending >= _settings['max_backlog']:
+        refusal, retry_after = 'backlog', _retry_after('backlog', pending)
+
+    if _draining.is_set():
+        state, refusal, retry_after = 'draining', 'draining', RETRY_AFTER_MIN
+    elif not _settings['enabled']:
+        state = 'disabled'
+    elif refusal:
+        state = 'shedding'
+    elif waiting or encodes >= _settings['max_encodes']:
+        state = 'queueing'
+    else:
+        state = 'ok'
+
+    return {
+        'status': state,
+        'reason': MESSAGES[refusal] if refusal and state != 'disabled' else None,
+        'retry_after': retry_after if state != 'disabled' else None,
+        'memory': {
+            'total_mb': _settings['total_memory_mb'],
+            'budget_mb': _settings['memory_budget_mb'],
+            'reserved_mb': reserved_memory,
+            'available_mb': available_memory_mb(),
+            'min_free_mb': _settings['memory_min_free_mb'],
+        },
+        'disk': {
+            'free_mb': free_disk_mb(),
+            'reserved_mb': reserved_disk,
+            'min_free_mb': _settings['disk_min_free_mb'],
+        },
+        'encodes': {
+            'running': encodes,
+            'max': _settings['max_encodes'],
+            'waiting': waiting,
+            'average_seconds': round(_encode_seconds[0], 1),
+        },
+        'backlog': {
+            'pending': pending,
+            'max': _settings['max_backlog'],
+        },
+        'reservations': reservations,
+    }
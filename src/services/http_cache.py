@@ -0,0 +1,139 @@
+import functools
+import gzip
+import hashlib
+import time
+
+from flask import current_app, make_response, request
+from sqlalchemy import func, select
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'image/svg+xml',
+)
+
+_settings = {}
+
+
+def init_http_cache(app):
+    """Carrega a configuração de ETags/compressão e registra a compressão das respostas"""
+    _settings['etags'] = app.config.get('HTTP_ETAGS_ENABLED', True)
+    _settings['compress'] = app.config.get('COMPRESS_ENABLED', True)
+    _settings['min_size'] = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    _settings['gzip_level'] = app.config.get('COMPRESS_GZIP_LEVEL', 6)
+    _settings['brotli_quality'] = app.config.get('COMPRESS_BROTLI_QUALITY', 5)
+
+    if _settings['compress']:
+        app.after_request(compress_response)
+
+
+def _watermark(table):
+    # Bancos sem os triggers de table_versions: contagem + última alteração
+    columns = [func.count()]
+    if 'updated_at' in table.c:
+        columns.append(func.max(table.c.updated_at))
+    elif 'id' in table.c:
+        columns.append(func.max(table.c.id))
+    return select(*columns).select_from(table)
+
+
+def table_versions(tables):
+    """Versão atual de cada tabela: contador dos triggers (SQLite) ou marca d'água"""
+    from src.models.user import db
+    from src.models.table_version import TableVersion
+
+    if db.engine.dialect.name == 'sqlite':
+        versions = dict(db.session.execute(
+            select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_(tables))
+        ).all())
+        return [versions.get(table) for table in tables]
+
+    return [
+        tuple(db.session.execute(_watermark(db.metadata.tables[table])).one())
+        for table in tables
+    ]
+
+
+def conditional(*tables, time_bucket=None):
+    """Responde 304 sem executar a view quando nenhuma das `tables` mudou.
+
+    O ETag (fraco, já que o corpo pode ir comprimido) combina as versões das
+    tabelas com a URL completa; `time_bucket` (segundos) também o renova
+    periodicamente, para respostas que dependem do relógio ("hoje",
+    "próximas 24h", "minutos restantes").
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _settings.get('etags', True):
+                return view(*args, **kwargs)
+
+            # Versões lidas antes da query: se algo mudar no meio, o ETag fica
+            # mais antigo que os dados e a próxima requisição só baixa de novo
+            parts = [request.full_path, *map(str, table_versions(tables))]
+            if time_bucket:
+                parts.append(str(int(time.time() // time_bucket)))
+            etag = hashlib.blake2b('|'.join(parts).encode(), digest_size=12).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _choose_encoding():
+    accept = request.accept_encodings
+    if accept['br'] and _brotli() is not None:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """Comprime com brotli/gzip respostas de texto acima de COMPRESS_MIN_SIZE"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+        or not (response.mimetype in COMPRESSIBLE_TYPES or response.mimetype.startswith('text/'))
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < _settings['min_size']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding == 'br':
+        data = _brotli().compress(data, quality=_settings['brotli_quality'])
+    elif encoding == 'gzip':
+        data = gzip.compress(data, compresslevel=_settings['gzip_level'], mtime=0)
+    else:
+        return response
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    # O ETag forte valia para o corpo sem compressão
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,194 @@
+import functools
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify, make_response, request
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+PURGE_INTERVAL = 600
+POLL_SECONDS = 0.25
+
+# Requisições em andamento neste processo: (rota, key) -> Event avisado ao terminar
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_last_purge = [0.0]
+
+
+def _fingerprint():
+    """Resumo do pedido: método, rota e corpo (no multipart, campos e nome/tamanho dos arquivos)"""
+    digest = hashlib.sha256(f'{request.method} {request.path}'.encode())
+    if request.files:
+        # O boundary muda a cada tentativa do cliente: não dá para usar o corpo cru
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f'\0{name}={value}'.encode())
+        for name, file in sorted(request.files.items(multi=True)):
+            file.stream.seek(0, os.SEEK_END)
+            digest.update(f'\0{name}:{file.filename}:{file.stream.tell()}'.encode())
+            file.stream.seek(0)
+    else:
+        digest.update(b'\0' + request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _table():
+    from src.models.idempotency import IdempotencyKey
+    return IdempotencyKey.__table__
+
+
+def _purge_expired(conn, now):
+    if time.monotonic() - _last_purge[0] < PURGE_INTERVAL:
+        return
+    _last_purge[0] = time.monotonic()
+    conn.execute(delete(_table()).where(_table().c.expires_at < now))
+
+
+def _claim(scope, key, fingerprint):
+    """Registra a key como em andamento; False se ela já existe (e não expirou)"""
+    from src.models.user import db
+
+    table = _table()
+    now = datetime.utcnow()
+    ttl = timedelta(hours=current_app.config.get('IDEMPOTENCY_TTL_HOURS', 24))
+    try:
+        with db.engine.begin() as conn:
+            _purge_expired(conn, now)
+            conn.execute(delete(table).where(table.c.scope == scope, table.c.key == key, table.c.expires_at < now))
+            conn.execute(insert(table).values(
+                scope=scope, key=key, fingerprint=fingerprint, status='in_progress',
+                created_at=now, expires_at=now + ttl
+            ))
+        return True
+    except IntegrityError:
+        return False
+
+
+def _take_over(scope, key, row):
+    """Assume uma key largada em andamento (processo morreu antes de terminar)"""
+    from src.models.user import db
+
+    table = _table()
+    with db.engine.begin() as conn:
+        return conn.execute(update(table).where(
+            table.c.scope == scope, table.c.key == key,
+            table.c.status == 'in_progress', table.c.created_at == row.created_at
+        ).values(created_at=datetime.utcnow())).rowcount == 1
+
+
+def _load(scope, key):
+    from src.models.user import db
+
+    table = _table()
+    with db.engine.connect() as conn:
+        return conn.execute(select(table).where(table.c.scope == scope, table.c.key == key)).first()
+
+
+def _finish(scope, key, response):
+    from src.models.user import db
+
+    table = _table()
+    with db.engine.begin() as conn:
+        if response is None or response.status_code >= 500:
+            # Falha do servidor: a próxima tentativa do cliente executa de novo
+            conn.execute(delete(table).where(table.c.scope == scope, table.c.key == key))
+        else:
+            conn.execute(update(table).where(table.c.scope == scope, table.c.key == key).values(
+                status='completed',
+                response_status=response.status_code,
+                response_body=response.get_data(as_text=True),
+                response_mimetype=response.mimetype,
+                completed_at=datetime.utcnow()
+            ))
+
+
+def _replay(row):
+    response = current_app.response_class(row.response_body, status=row.response_status, mimetype=row.response_mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _error(message, status, **headers):
+    response = make_response(jsonify({'success': False, 'error': message}), status)
+    response.headers.update(headers)
+    return response
+
+
+def _wait_for_original(scope, key, fingerprint):
+    """Espera a requisição original terminar; devolve a resposta final ou None para executar aqui"""
+    config = current_app.config
+    deadline = time.monotonic() + config.get('IDEMPOTENCY_WAIT_SECONDS', 60)
+    lock_seconds = config.get('IDEMPOTENCY_LOCK_SECONDS', 900)
+
+    while True:
+        row = _load(scope, key)
+        if row is None:
+            # A original falhou (5xx) ou expirou: esta tentativa executa
+            if _claim(scope, key, fingerprint):
+                return None
+            continue
+        if row.fingerprint != fingerprint:
+            return _error(f'{HEADER} já usada com outro conteúdo nesta rota', 422)
+        if row.status == 'completed':
+            return _replay(row)
+        if row.created_at < datetime.utcnow() - timedelta(seconds=lock_seconds) and _take_over(scope, key, row):
+            logger.warning('Idempotency-Key %s em %s abandonada; executando de novo', key, scope)
+            return None
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return _error('Requisição original ainda em andamento', 409, **{'Retry-After': '1'})
+        # Mesma instância: acorda assim que a original termina; outra instância: polling no banco
+        with _in_flight_lock:
+            event = _in_flight.get((scope, key))
+        if event is not None:
+            event.wait(min(remaining, 5))
+        else:
+            time.sleep(min(remaining, POLL_SECONDS))
+
+
+def idempotent(view):
+    """POST com Idempotency-Key: repetições devolvem a resposta original em vez de refazer o trabalho.
+
+    A primeira requisição com a key executa; as que chegam enquanto ela roda
+    esperam o resultado (até IDEMPOTENCY_WAIT_SECONDS, depois 409 com
+    Retry-After). Respostas 2xx/4xx ficam guardadas por IDEMPOTENCY_TTL_HOURS;
+    5xx liberam a key para uma nova tentativa.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(f'{HEADER} maior que {MAX_KEY_LENGTH} caracteres', 400)
+
+        scope = request.path
+        fingerprint = _fingerprint()
+        if not _claim(scope, key, fingerprint):
+            response = _wait_for_original(scope, key, fingerprint)
+            if response is not None:
+                return response
+
+        event = threading.Event()
+        with _in_flight_lock:
+            _in_flight[(scope, key)] = event
+        response = None
+        try:
+            response = make_response(view(*args, **kwargs))
+            return response
+        finally:
+            try:
+                _finish(scope, key, response)
+            finally:
+                with _in_flight_lock:
+                    _in_flight.pop((scope, key), None)
+                event.set()
+    return wrapper
@@ -0,0 +1,618 @@
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+import queue
+import select
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from werkzeug.utils import secure_filename
+
+from src.services import governor, media, overlays, phash, storage, trim
+from src.services.tracing import new_trace_id, span
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+REJECTED_DIR = '.rejected'
+
+# inotify(7): arquivo fechado depois de escrito ou movido para a pasta
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (seguido do nome)
+
+# Arquivo de vídeo já copiado/movido para o storage, aguardando o cadastro
+Source = namedtuple('Source', 'name path size sha256')
+
+# Vídeos cadastrados aguardando os cortes (modo sem JIT); processados pelos workers de ingestão
+_queue = queue.Queue()
+# IDs na fila ainda não pegos por um worker (o reaper reenfileira os mesmos vídeos a cada passada)
+_queued = set()
+_queued_lock = threading.Lock()
+_workers = []
+_workers_lock = threading.Lock()
+_watcher_thread = None
+
+
+class IngestError(ValueError):
+    """Arquivo compactado ilegível ou lote inválido"""
+
+
+def init_ingest(app):
+    """Inicia o watcher da pasta de entrada (INGEST_WATCH_DIR), se configurada"""
+    directory = app.config.get('INGEST_WATCH_DIR')
+    if directory:
+        _start_watcher(app, directory)
+
+
+def parse_options(values):
+    """Configurações de corte e metadados compartilhadas por todos os vídeos do lote"""
+    def flag(name, default):
+        return str(values.get(name, default)).lower() == 'true'
+
+    policy = values.get('on_duplicate') or current_app.config.get('PHASH_DUPLICATE_POLICY', 'warn')
+    if policy not in ('warn', 'reject', 'off'):
+        raise IngestError('on_duplicate deve ser warn, reject ou off')
+    try:
+        overlay_profile = overlays.resolve_profile(values.get('overlay_profile'))
+    except overlays.OverlayError as e:
+        raise IngestError(str(e))
+    return {
+        'cut_vertical': flag('cut_vertical', 'true'),
+        'cut_square': flag('cut_square', 'true'),
+        'cut_horizontal': flag('cut_horizontal', 'false'),
+        'caption': values.get('caption', ''),
+        'hashtags': values.get('hashtags', ''),
+        'on_duplicate': policy,
+        'overlay_profile': overlay_profile,
+    }
+
+
+def _watch_options(config):
+    cuts = {cut.strip() for cut in config.get('INGEST_WATCH_CUTS', 'vertical,square').split(',')}
+    return parse_options({
+        'cut_vertical': str('vertical' in cuts),
+        'cut_square': str('square' in cuts),
+        'cut_horizontal': str('horizontal' in cuts),
+    })
+
+
+def _check_name(name):
+    """Motivo para ignorar o arquivo, ou None se é um vídeo aceito"""
+    from src.routes.videos import allowed_file
+
+    base = os.path.basename(name)
+    if not base or base.startswith('.') or '__MACOSX/' in name:
+        return 'ignored'
+    if not allowed_file(base):
+        return 'Formato de arquivo não suportado'
+    return None
+
+
+def _storage_path(name):
+    # Lotes trazem nomes repetidos (pastas diferentes, mesmo segundo): sufixo aleatório
+    base, ext = os.path.splitext(secure_filename(os.path.basename(name)) or 'video')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return storage.original_path(f'{base}_{timestamp}_{uuid.uuid4().hex[:8]}{ext.lower()}')
+
+
+def _store_stream(stream, name, max_bytes):
+    """Copia o stream para o storage calculando o sha256; None se passar de max_bytes"""
+    path = _storage_path(name)
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    if size > max_bytes:
+        os.remove(path)
+        return None
+    return Source(os.path.basename(name), path, size, digest.hexdigest())
+
+
+def _move_file(path, name):
+    """Move um arquivo da pasta de entrada para o storage (rename quando no mesmo volume)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    destination = _storage_path(name)
+    size = os.path.getsize(path)
+    shutil.move(path, destination)
+    return Source(name, destination, size, digest.hexdigest())
+
+
+class _Prefixed:
+    """Stream com os bytes já lidos para detectar o formato recolocados na frente"""
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size=-1):
+        if not self._head:
+            return self._stream.read(size)
+        if size is None or size < 0:
+            data, self._head = self._head + self._stream.read(), b''
+            return data
+        data, self._head = self._head[:size], self._head[size:]
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+
+def _archive_members(stream):
+    """(nome, stream) de cada arquivo regular de um zip ou tar (puro, .gz, .bz2 ou .xz)"""
+    head = stream.read(4)
+    stream = _Prefixed(head, stream)
+
+    if head == b'PK\x03\x04':
+        # O índice do zip fica no fim do arquivo: o corpo vai para um temporário no disco
+        with tempfile.TemporaryFile(dir=storage.temp_dir()) as spool:
+            shutil.copyfileobj(stream, spool, CHUNK_SIZE)
+            spool.seek(0)
+            try:
+                archive = zipfile.ZipFile(spool)
+            except zipfile.BadZipFile as e:
+                raise IngestError(f'Zip inválido: {e}')
+            with archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        with archive.open(info) as member:
+                            yield info.filename, member
+        return
+
+    # Tar é lido em sequência, membro a membro, sem tocar o disco além dos vídeos
+    try:
+        archive = tarfile.open(fileobj=stream, mode='r|*')
+    except tarfile.TarError as e:
+        raise IngestError(f'Envie um arquivo zip ou tar ({e})')
+    with archive:
+        try:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member)
+        except tarfile.TarError as e:
+            raise IngestError(f'Tar inválido: {e}')
+
+
+def receive_archive(stream):
+    """Extrai os vídeos de um zip/tar direto para o storage; devolve (sources, skipped)"""
+    from src.routes.videos import MAX_FILE_SIZE
+
+    max_files = current_app.config.get('INGEST_MAX_FILES', 500)
+    sources = []
+    skipped = []
+    try:
+        for name, member in _archive_members(stream):
+            reason = _check_name(name)
+            if reason == 'ignored':
+                continue
+            if reason is None and len(sources) >= max_files:
+                reason = f'Limite de {max_files} vídeos por lote'
+            if reason is None:
+                source = _store_stream(member, name, MAX_FILE_SIZE)
+                if source is not None:
+                    sources.append(source)
+                    continue
+                reason = 'Arquivo muito grande (máximo 100MB)'
+            skipped.append({'filename': name, 'reason': reason})
+    except Exception:
+        _discard(sources)
+        raise
+    return sources, skipped
+
+
+def _discard(sources, reject_dir=None):
+    """Remove do storage os arquivos que não viraram vídeo (ou devolve para reject_dir)"""
+    for source in sources:
+        try:
+            if reject_dir:
+                os.makedirs(reject_dir, exist_ok=True)
+                shutil.move(source.path, os.path.join(reject_dir, source.name))
+            else:
+                os.remove(source.path)
+        except OSError as e:
+            logger.warning('Não foi possível descartar %s: %s', source.path, e)
+
+
+def _analyze(source, policy, app, detect_trim):
+    """Probe, phash e pontas mortas de um arquivo (roda nas threads do pool: ffprobe/ffmpeg são processos)"""
+    from src.routes.videos import get_video_info
+
+    trace_id = new_trace_id()
+    with span('probe', trace_id):
+        video_info = get_video_info(source.path)
+    video_phash = None
+    if video_info and policy != 'off':
+        with span('phash', trace_id):
+            video_phash = phash.compute_phash(source.path)
+    active_range = None
+    if video_info and detect_trim:
+        with app.app_context(), span('trim', trace_id):
+            active_range = trim.detect_active_range(source.path, video_info['duration'])
+    return trace_id, video_info, video_phash, active_range
+
+
+def _batch_duplicates(value, batch_hashes, max_distance):
+    """Quase duplicados entre os vídeos do próprio lote (ainda fora do índice)"""
+    duplicates = []
+    for name, other in batch_hashes:
+        distance = bin(value ^ other).count('1')
+        if distance <= max_distance:
+            duplicates.append({
+                'video_id': None,
+                'original_filename': name,
+                'distance': distance,
+                'similarity': round(1 - distance / phash.HASH_BITS, 3),
+            })
+    return duplicates
+
+
+def ingest(sources, options, skipped=None, reject_dir=None):
+    """Cadastra um lote de arquivos já no storage: probe em paralelo, dedupe e um único INSERT.
+
+    Cópias exatas (sha256) de vídeos já cadastrados ou repetidas no lote são
+    descartadas; quase duplicados seguem a política on_duplicate, também
+    dentro do lote. Sem JIT, os vídeos entram na fila dos workers de ingestão
+    (INGEST_WORKERS) para os cortes. Devolve (videos, skipped).
+    """
+    from sqlalchemy import insert
+    from src.models.user import db
+    from src.models.video import Video
+    from src.services.render_queue import jit_enabled
+
+    skipped = list(skipped or [])
+    rejected = []
+
+    def skip(source, reason, **extra):
+        rejected.append(source)
+        skipped.append({'filename': source.name, 'reason': reason, **extra})
+
+    # Cópias exatas: já cadastradas ou repetidas no lote
+    known = dict(db.session.query(Video.source_sha256, Video.id).filter(
+        Video.source_sha256.in_({source.sha256 for source in sources})
+    )) if sources else {}
+    unique = []
+    for source in sources:
+        if source.sha256 in known:
+            if known[source.sha256] is None:
+                skip(source, 'Arquivo repetido no lote')
+            else:
+                skip(source, 'Arquivo idêntico já enviado', video_id=known[source.sha256])
+            continue
+        known[source.sha256] = None
+        unique.append(source)
+
+    policy = options['on_duplicate']
+    status = 'processed' if jit_enabled() else 'uploaded'
+    # No modo JIT a linha já entra 'processed': as pontas mortas são detectadas aqui, e não no
+    # _encode_video (que continua fazendo isso para os vídeos que passam pelos cortes)
+    app = current_app._get_current_object()
+    detect_trim = status == 'processed' and app.config.get('TRIM_ENABLED', False)
+    workers = max(1, min(app.config.get('INGEST_PROBE_WORKERS') or os.cpu_count(), len(unique)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        analyzed = list(pool.map(lambda source: _analyze(source, policy, app, detect_trim), unique))
+
+    max_distance = app.config.get('PHASH_MAX_DISTANCE', 10)
+    now = datetime.utcnow()
+    rows = []
+    accepted = []
+    batch_hashes = []
+    for source, (trace_id, video_info, video_phash, active_range) in zip(unique, analyzed):
+        if not video_info:
+            skip(source, 'Não foi possível ler o vídeo')
+            continue
+
+        duplicates = []
+        if video_phash:
+            value = int(video_phash, 16)
+            duplicates = phash.find_duplicates(video_phash) + _batch_duplicates(value, batch_hashes, max_distance)
+            if duplicates and policy == 'reject':
+                skip(source, 'Já existe um vídeo quase idêntico', duplicates=duplicates)
+                continue
+            batch_hashes.append((source.name, value))
+
+        rows.append({
+            'original_filename': source.name,
+            'file_path': source.path,
+            'file_size': source.size,
+            'duration': video_info['duration'],
+            'resolution': video_info['resolution'],
+            'format': source.path.rsplit('.', 1)[1].lower(),
+            'cut_vertical': options['cut_vertical'],
+            'cut_square': options['cut_square'],
+            'cut_horizontal': options['cut_horizontal'],
+            'caption': options['caption'],
+            'hashtags': options['hashtags'],
+            'overlay_profile': options['overlay_profile'],
+            'trim_start': active_range[0] if active_range else None,
+            'trim_end': active_range[1] if active_range else None,
+            # No modo JIT o probe acima é todo o processamento do upload
+            'processing_status': status,
+            'trace_id': trace_id,
+            'phash': video_phash,
+            'source_sha256': source.sha256,
+            'created_at': now,
+            'updated_at': now,
+        })
+        accepted.append((video_phash, duplicates))
+
+    _discard(rejected, reject_dir)
+    if not rows:
+        return [], skipped
+
+    # Backend remoto: os aceitos sobem para o bucket em paralelo (a cópia local fica no cache)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for row, ref in zip(rows, pool.map(media.publish, [row['file_path'] for row in rows])):
+            row['file_path'] = ref
+
+    video_ids = db.session.execute(
+        insert(Video).returning(Video.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    db.session.commit()
+    for video_id, (video_phash, _) in zip(video_ids, accepted):
+        phash.remember(video_id, video_phash)
+
+    if status == 'uploaded':
+        enqueue(video_ids)
+
+    videos = {video.id: video for video in Video.query.filter(Video.id.in_(video_ids))}
+    result = []
+    for video_id, (_, duplicates) in zip(video_ids, accepted):
+        video_dict = videos[video_id].to_dict()
+        if duplicates:
+            video_dict['duplicates'] = duplicates
+        result.append(video_dict)
+    return result, skipped
+
+
+def enqueue(video_ids):
+    """Põe vídeos na fila dos cortes (os que já estão nela ficam onde estão) e retorna quantos entraram.
+
+    Vídeos perdidos num restart o reaper reenfileira.
+    """
+    _start_workers(current_app._get_current_object())
+    added = 0
+    for video_id in video_ids:
+        with _queued_lock:
+            if video_id in _queued:
+                continue
+            _queued.add(video_id)
+        _queue.put(video_id)
+        added += 1
+    return added
+
+
+def wait_idle():
+    """Espera a fila dos cortes esvaziar (comandos de linha de comando)"""
+    _queue.join()
+
+
+def _worker_loop(app):
+    from src.routes.videos import process_video_cuts
+
+    while True:
+        video_id = _queue.get()
+        with _queued_lock:
+            _queued.discard(video_id)
+        try:
+            with app.app_context():
+                # Em background, o encode espera a vez na fila do governor
+                process_video_cuts(video_id, wait=governor.queue_wait())
+        except Exception as e:
+            logger.warning('Erro ao processar o vídeo %s da ingestão: %s', video_id, e)
+        finally:
+            _queue.task_done()
+
+
+def _start_workers(app):
+    # Poucos workers: cada encode já usa todos os núcleos (ou os segmentos em paralelo)
+    with _workers_lock:
+        _workers[:] = [thread for thread in _workers if thread.is_alive()]
+        for index in range(len(_workers), app.config.get('INGEST_WORKERS', 1)):
+            thread = threading.Thread(target=_worker_loop, args=(app,), name=f'ingest-worker-{index}', daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+def _entries(directory):
+    """Arquivos regulares visíveis da pasta (temporários de rsync/scp começam com '.')"""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries if entry.is_file() and not entry.name.startswith('.')}
+    except OSError:
+        return set()
+
+
+class _InotifyWatcher:
+    """Eventos do kernel via libc (Linux): só arquivos que terminaram de ser escritos"""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 falhou')
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f'inotify_add_watch falhou em {directory}')
+        # O que já estava na pasta no boot não gera evento
+        self._initial = _entries(directory)
+
+    def wait(self, timeout):
+        if self._initial:
+            names, self._initial = self._initial, set()
+            return names
+        names = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return names
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            offset += INOTIFY_EVENT.size + length
+            if name and not name.startswith(b'.'):
+                names.add(os.fsdecode(name))
+        return names
+
+
+class _PollingWatcher:
+    """Fallback sem inotify: arquivo pronto quando tamanho e mtime se repetem entre varreduras"""
+
+    def __init__(self, directory, interval):
+        self._directory = directory
+        self._interval = interval
+        self._last = {}
+        self._reported = set()
+
+    def wait(self, timeout):
+        time.sleep(max(timeout, self._interval))
+        current = {}
+        for name in _entries(self._directory):
+            try:
+                stat = os.stat(os.path.join(self._directory, name))
+            except OSError:
+                continue
+            current[name] = (stat.st_size, stat.st_mtime_ns)
+        ready = {name for name, signature in current.items()
+                 if self._last.get(name) == signature and name not in self._reported}
+        self._reported = (self._reported & current.keys()) | ready
+        self._last = current
+        return ready
+
+
+def _watcher(directory, config):
+    try:
+        return _InotifyWatcher(directory)
+    except (OSError, AttributeError) as e:
+        logger.info('inotify indisponível (%s); usando polling em %s', e, directory)
+        return _PollingWatcher(directory, config.get('INGEST_POLL_SECONDS', 5))
+
+
+def ingest_directory(directory, names, options):
+    """Move os arquivos prontos da pasta de entrada para o storage e cadastra o lote.
+
+    Arquivos recusados (duplicados, ilegíveis) vão para a subpasta .rejected.
+    """
+    from src.routes.videos import MAX_FILE_SIZE
+
+    sources = []
+    skipped = []
+    reject_dir = os.path.join(directory, REJECTED_DIR)
+    for name in sorted(names):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        reason = _check_name(name)
+        if reason is None and os.path.getsize(path) > MAX_FILE_SIZE:
+            reason = 'Arquivo muito grande (máximo 100MB)'
+        if reason is None:
+            try:
+                sources.append(_move_file(path, name))
+            except OSError as e:
+                logger.warning('Não foi possível mover %s para o storage: %s', path, e)
+            continue
+        skipped.append({'filename': name, 'reason': reason})
+        os.makedirs(reject_dir, exist_ok=True)
+        shutil.move(path, os.path.join(reject_dir, name))
+    return ingest(sources, options, skipped, reject_dir=reject_dir)
+
+
+def _watch_loop(app, directory):
+    watcher = _watcher(directory, app.config)
+    settle = app.config.get('INGEST_SETTLE_SECONDS', 2)
+    max_files = app.config.get('INGEST_MAX_FILES', 500)
+    options = None
+    pending = set()
+    while True:
+        try:
+            names = watcher.wait(settle)
+            pending |= names
+            # Espera a leva parar de chegar para cadastrar tudo num lote só
+            if not pending or (names and len(pending) < max_files):
+                continue
+            batch = set(sorted(pending)[:max_files])
+            pending -= batch
+            with app.app_context():
+                from src.models.schema import ensure_schema
+                ensure_schema()
+                if options is None:
+                    options = _watch_options(app.config)
+                videos, skipped = ingest_directory(directory, batch, options)
+            logger.info('Ingestão de %s: %d vídeos cadastrados, %d recusados', directory, len(videos), len(skipped))
+        except Exception as e:
+            logger.warning('Erro no watcher de ingestão: %s', e)
+
+
+def _start_watcher(app, directory):
+    global _watcher_thread
+    os.makedirs(directory, exist_ok=True)
+    if _watcher_thread is None or not _watcher_thread.is_alive():
+        _watcher_thread = threading.Thread(target=_watch_loop, args=(app, directory), name='ingest-watcher', daemon=True)
+        _watcher_thread.start()
+
+
+def register_cli(app):
+    """Registra o comando `flask ingest`"""
+    import click
+
+    @app.cli.command('ingest')
+    @click.argument('path', type=click.Path(exists=True))
+    @click.option('--cuts', default='vertical,square', help='Cortes de todos os vídeos do lote')
+    def ingest_command(path, cuts):
+        """Cadastra os vídeos de uma pasta (copiados) ou de um zip/tar"""
+        from src.models.schema import ensure_schema
+        from src.routes.videos import MAX_FILE_SIZE
+
+        ensure_schema()
+        cuts = {cut.strip() for cut in cuts.split(',')}
+        options = parse_options({cut_name: str(cut in cuts) for cut, cut_name in (
+            ('vertical', 'cut_vertical'), ('square', 'cut_square'), ('horizontal', 'cut_horizontal')
+        )})
+
+        if os.path.isdir(path):
+            sources, skipped = [], []
+            for name in sorted(_entries(path)):
+                if _check_name(name) is not None:
+                    continue
+                with open(os.path.join(path, name), 'rb') as f:
+                    source = _store_stream(f, name, MAX_FILE_SIZE)
+                if source is None:
+                    skipped.append({'filename': name, 'reason': 'Arquivo muito grande (máximo 100MB)'})
+                else:
+                    sources.append(source)
+        else:
+            with open(path, 'rb') as f:
+                sources, skipped = receive_archive(f)
+
+        videos, skipped = ingest(sources, options, skipped)
+        for item in skipped:
+            click.echo(f"recusado: {item['filename']} ({item['reason']})")
+        click.echo(f'{len(videos)} vídeos cadastrados, {len(skipped)} recusados')
+        # Sem JIT, os cortes rodam nos workers de ingestão: espera a fila esvaziar
+        wait_idle()
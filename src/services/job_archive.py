@@ -0,0 +1,258 @@
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, and_, func, insert, literal, or_, select
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+_settings = {}
+_archive_lock = threading.Lock()
+_wake_event = threading.Event()
+_archiver_thread = None
+
+
+def init_job_archive(app):
+    """Carrega a configuração do arquivamento e inicia o arquivador em background"""
+    _settings['after_days'] = app.config.get('ARCHIVE_AFTER_DAYS', 30)
+    _settings['batch_size'] = app.config.get('ARCHIVE_BATCH_SIZE', 1000)
+    _settings['interval'] = app.config.get('ARCHIVE_INTERVAL', 300)
+
+    if app.config.get('ARCHIVE_ENABLED', True):
+        _start_archiver(app)
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _finished_at(job):
+    return job.completed_at or job.updated_at or job.created_at
+
+
+def _merge_rollups(deltas):
+    """Soma os deltas {(hora, conta, status, classe de erro): n} nos rollups, na transação atual.
+
+    Um único INSERT ... ON CONFLICT DO UPDATE em lote (SQLite e PostgreSQL).
+    """
+    from src.models.user import db
+    from src.models.job_history import JobRollup
+
+    if not deltas:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+
+    table = JobRollup.__table__
+    statement = upsert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=['bucket', 'tiktok_account_id', 'status', 'error_class'],
+        set_={'count': table.c.count + statement.excluded['count']}
+    )
+    db.session.execute(statement, [
+        {'bucket': bucket, 'tiktok_account_id': account_id, 'status': status, 'error_class': error_class, 'count': delta}
+        for (bucket, account_id, status, error_class), delta in deltas.items()
+    ])
+
+
+def _rollup_key(job):
+    error_class = (job.error_class or 'unknown') if job.status == 'failed' else ''
+    return _hour(_finished_at(job)), job.tiktok_account_id, job.status, error_class
+
+
+def unroll(job):
+    """Retira dos rollups um job finalizado que vai voltar para a fila (retry, URL manual).
+
+    Deve ser chamado antes de mudar status/completed_at, na mesma transação.
+    """
+    if job.rolled_up_at is None or job.status not in TERMINAL_STATUSES:
+        return
+    _merge_rollups({_rollup_key(job): -1})
+    job.rolled_up_at = None
+
+
+def rollup_pending(batch_size=None):
+    """Agrega nos rollups horários os jobs finalizados que ainda não entraram neles"""
+    from src.models.user import db
+    from src.models.video import PostingJob
+
+    batch_size = batch_size or _settings.get('batch_size', 1000)
+    hot = PostingJob.__table__
+    total = 0
+    while True:
+        # Sem ORDER BY: o índice (status, rolled_up_at) entrega o lote sem ordenar o restante
+        ids = db.session.execute(
+            select(hot.c.id).where(
+                hot.c.status.in_(TERMINAL_STATUSES),
+                hot.c.rolled_up_at.is_(None)
+            ).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return total
+
+        # O UPDATE confere o status de novo: um job que voltou para a fila (retry) entre o SELECT e
+        # aqui fica de fora, e os contadores saem das linhas que ele realmente marcou
+        jobs = db.session.execute(hot.update().where(
+            hot.c.id.in_(ids),
+            hot.c.status.in_(TERMINAL_STATUSES),
+            hot.c.rolled_up_at.is_(None)
+        ).values(rolled_up_at=datetime.utcnow()).returning(
+            hot.c.id, hot.c.tiktok_account_id, hot.c.status, hot.c.error_class,
+            hot.c.completed_at, hot.c.updated_at, hot.c.created_at
+        )).all()
+        _merge_rollups(Counter(_rollup_key(job) for job in jobs))
+        db.session.commit()
+        total += len(jobs)
+
+
+def archive_old_jobs(after_days=None, batch_size=None):
+    """Move para posting_jobs_archive, em lotes, os jobs finalizados há mais de N dias"""
+    from src.models.user import db
+    from src.models.video import PostingJob
+    from src.models.job_history import ArchivedPostingJob
+
+    after_days = after_days if after_days is not None else _settings.get('after_days', 30)
+    batch_size = batch_size or _settings.get('batch_size', 1000)
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+
+    hot = PostingJob.__table__
+    archive = ArchivedPostingJob.__table__
+    columns = [column.name for column in archive.columns if column.name != 'archived_at']
+
+    total = 0
+    while True:
+        # Só sai da tabela quente o que já está contabilizado nos rollups
+        ids = [row[0] for row in db.session.execute(
+            select(hot.c.id).where(
+                hot.c.status.in_(TERMINAL_STATUSES),
+                hot.c.rolled_up_at.isnot(None),
+                or_(hot.c.completed_at < cutoff, and_(hot.c.completed_at.is_(None), hot.c.updated_at < cutoff))
+            ).limit(batch_size)
+        )]
+        if not ids:
+            return total
+
+        db.session.execute(insert(archive).from_select(
+            columns + ['archived_at'],
+            select(*[hot.c[name] for name in columns], literal(datetime.utcnow(), DateTime)).where(hot.c.id.in_(ids))
+        ))
+        db.session.execute(hot.delete().where(hot.c.id.in_(ids)))
+        db.session.commit()
+        total += len(ids)
+
+
+def run_archive():
+    """Uma passada completa: agrega os finalizados novos e arquiva os antigos"""
+    with _archive_lock:
+        return {
+            'rolled_up': rollup_pending(),
+            'archived': archive_old_jobs(),
+        }
+
+
+def status_counts():
+    """Total de jobs por status (tabela quente + rollups), sem varrer o histórico"""
+    from src.models.user import db
+    from src.models.video import PostingJob
+    from src.models.job_history import JobRollup
+
+    counts = Counter()
+    # Finalizados ainda não agregados ficam na conta da tabela quente
+    for status, rolled, count in db.session.query(
+        PostingJob.status, PostingJob.rolled_up_at.isnot(None), func.count()
+    ).group_by(PostingJob.status, PostingJob.rolled_up_at.isnot(None)):
+        if not (rolled and status in TERMINAL_STATUSES):
+            counts[status] += count
+
+    for status, count in db.session.query(JobRollup.status, func.sum(JobRollup.count)).group_by(JobRollup.status):
+        counts[status] += count or 0
+    return counts
+
+
+def history(hours=24, account_id=None, group_by='status'):
+    """Série horária de jobs finalizados, lida dos rollups (mais os finalizados ainda não agregados)"""
+    from src.models.user import db
+    from src.models.video import PostingJob
+    from src.models.job_history import JobRollup
+
+    if group_by not in ('status', 'error_class', 'account'):
+        raise ValueError(f'Agrupamento inválido: {group_by}')
+    since = _hour(datetime.utcnow()) - timedelta(hours=hours - 1)
+
+    series = {}
+
+    def add(bucket, key, count):
+        if group_by == 'error_class':
+            key = key or 'none'
+        series.setdefault(bucket, Counter())[str(key)] += count
+
+    key_column = {
+        'status': JobRollup.status,
+        'error_class': JobRollup.error_class,
+        'account': JobRollup.tiktok_account_id,
+    }[group_by]
+    rollups = db.session.query(JobRollup.bucket, key_column, func.sum(JobRollup.count)).filter(
+        JobRollup.bucket >= since
+    )
+    if account_id:
+        rollups = rollups.filter(JobRollup.tiktok_account_id == account_id)
+    for bucket, key, count in rollups.group_by(JobRollup.bucket, key_column):
+        add(bucket, key, count)
+
+    pending = PostingJob.query.filter(
+        PostingJob.status.in_(TERMINAL_STATUSES),
+        PostingJob.rolled_up_at.is_(None)
+    )
+    if account_id:
+        pending = pending.filter(PostingJob.tiktok_account_id == account_id)
+    for job in pending:
+        bucket, tiktok_account_id, status, error_class = _rollup_key(job)
+        if bucket >= since:
+            key = {'status': status, 'error_class': error_class, 'account': tiktok_account_id}[group_by]
+            add(bucket, key, 1)
+
+    return [
+        {'bucket': bucket.isoformat(), 'counts': {key: count for key, count in counts.items() if count}}
+        for bucket, counts in sorted(series.items())
+    ]
+
+
+def _archiver_loop(app):
+    while True:
+        _wake_event.wait(_settings['interval'])
+        _wake_event.clear()
+        try:
+            with app.app_context():
+                from src.models.schema import ensure_schema
+                ensure_schema()
+                report = run_archive()
+            if report['archived']:
+                logger.info('Arquivador moveu %d jobs para o arquivo', report['archived'])
+        except Exception as e:
+            logger.warning('Erro no arquivador de jobs: %s', e)
+
+
+def _start_archiver(app):
+    global _archiver_thread
+    if _archiver_thread is None or not _archiver_thread.is_alive():
+        _archiver_thread = threading.Thread(target=_archiver_loop, args=(app,), name='job-archiver', daemon=True)
+        _archiver_thread.start()
+
+
+def register_cli(app):
+    """Registra o comando `flask archive-jobs`"""
+    import click
+
+    @app.cli.command('archive-jobs')
+    def archive_jobs():
+        """Agrega os jobs finalizados e arquiva os antigos imediatamente"""
+        from src.models.schema import ensure_schema
+
+        ensure_schema()
+        report = run_archive()
+        click.echo(f"{report['rolled_up']} jobs agregados, {report['archived']} arquivados")
@@ -0,0 +1,263 @@
+import json
+import logging
+import os
+import secrets
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+logger = logging.getLogger(__name__)
+
+_worker = {'id': None, 'pid': None}
+_wake_event = threading.Event()
+# Setado por expire_own: os heartbeats param de renovar o que o drain devolveu
+_surrendered = threading.Event()
+_reaper_thread = None
+
+
+def init_leases(app):
+    """Inicia o reaper que devolve à fila o trabalho de workers que pararam de responder"""
+    if app.config.get('REAPER_ENABLED', True):
+        _start_reaper(app)
+
+
+def worker_id():
+    """Identificador deste processo (host:pid:token); muda após fork"""
+    if _worker['pid'] != os.getpid():
+        _worker['pid'] = os.getpid()
+        _worker['id'] = f'{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}'
+    return _worker['id']
+
+
+def lease_seconds():
+    return current_app.config.get('LEASE_SECONDS', 120)
+
+
+def claim(model, row_id, from_statuses, to_status, status_attr='status', commit=True, **values):
+    """Passa a linha para `to_status` com lease deste worker, se ainda estiver em `from_statuses`.
+
+    O UPDATE condicional garante que só um worker fica com cada linha, mesmo
+    com vários processos ou máquinas lendo a mesma fila.
+    """
+    from src.models.user import db
+
+    now = datetime.utcnow()
+    claimed = model.query.filter(
+        model.id == row_id, getattr(model, status_attr).in_(from_statuses)
+    ).update({
+        status_attr: to_status,
+        'worker_id': worker_id(),
+        'lease_expires_at': now + timedelta(seconds=lease_seconds()),
+        'heartbeat_at': now,
+        'updated_at': now,
+        **values,
+    }, synchronize_session=False)
+    if commit:
+        db.session.commit()
+    return bool(claimed)
+
+
+def owns(row):
+    """Se a linha ainda está com lease deste worker (o reaper pode tê-la devolvido à fila)"""
+    return row.worker_id == worker_id() and row.lease_expires_at is not None
+
+
+def release(row):
+    """Encerra a lease; worker_id fica registrado para auditoria"""
+    row.lease_expires_at = None
+
+
+def expire_own():
+    """Vence agora as leases deste worker (drain): o reaper do próximo boot devolve o trabalho sem esperar"""
+    from src.models.user import db
+    from src.models.video import PostingJob, Video, VariantRender
+
+    now = datetime.utcnow()
+    expired = 0
+    for model in (PostingJob, Video, VariantRender):
+        expired += model.query.filter(
+            model.worker_id == worker_id(), model.lease_expires_at > now
+        ).update({'lease_expires_at': now, 'updated_at': model.updated_at}, synchronize_session=False)
+    db.session.commit()
+    _surrendered.set()
+    return expired
+
+
+def wake_reaper():
+    """Antecipa a próxima passada do reaper (ex.: boot depois de um drain)"""
+    _wake_event.set()
+
+
+@contextmanager
+def heartbeat(model, ids):
+    """Renova periodicamente as leases deste worker sobre `ids` enquanto o bloco executa"""
+    from src.models.user import db
+
+    app = current_app._get_current_object()
+    interval = app.config.get('LEASE_HEARTBEAT_SECONDS', 30)
+    lease = timedelta(seconds=app.config.get('LEASE_SECONDS', 120))
+    me = worker_id()
+    ids = list(ids)
+    stop = threading.Event()
+    table = model.__table__
+
+    def beat():
+        while not stop.wait(interval) and not _surrendered.is_set():
+            try:
+                with app.app_context(), db.engine.begin() as conn:
+                    # updated_at fica como está: renovar a lease não é alteração do registro
+                    now = datetime.utcnow()
+                    conn.execute(table.update().where(
+                        table.c.id.in_(ids), table.c.worker_id == me, table.c.lease_expires_at.isnot(None)
+                    ).values(lease_expires_at=now + lease, heartbeat_at=now, updated_at=table.c.updated_at))
+            except Exception as e:
+                logger.warning('Erro ao renovar leases de %s: %s', table.name, e)
+
+    thread = threading.Thread(target=beat, name=f'heartbeat-{table.name}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _expired(model, started_column, now):
+    # Linhas sem lease (anteriores a este mecanismo) expiram pelo horário de início
+    cutoff = now - timedelta(seconds=lease_seconds())
+    return or_(
+        model.lease_expires_at < now,
+        and_(model.lease_expires_at.is_(None), started_column < cutoff)
+    )
+
+
+def _reclaim(model, row, status_attr, expired, values):
+    """Devolve a linha só se a lease continuar expirada (um heartbeat no meio a renova)"""
+    return model.query.filter(
+        model.id == row.id,
+        getattr(model, status_attr) == getattr(row, status_attr),
+        expired
+    ).update(values, synchronize_session=False)
+
+
+def reap_expired():
+    """Devolve à fila jobs, vídeos e renderizações com lease expirada"""
+    from src.models.user import db
+    from src.models.video import PostingJob, Video, VariantRender
+
+    now = datetime.utcnow()
+    report = {'jobs_requeued': 0, 'jobs_failed': 0, 'videos_requeued': 0, 'videos_failed': 0, 'renders_requeued': 0}
+
+    expired = _expired(PostingJob, PostingJob.started_at, now)
+    for job in PostingJob.query.filter(PostingJob.status == 'processing', expired).all():
+        logs = json.loads(job.log_data or '[]')
+        logs.append({'at': now.isoformat(), 'attempt': job.retry_count, 'outcome': 'lease_expired', 'worker_id': job.worker_id})
+        values = {
+            'worker_id': None,
+            'lease_expires_at': None,
+            'error_class': 'lease_expired',
+            'error_message': 'Worker parou de responder durante a postagem',
+            'log_data': json.dumps(logs),
+            'updated_at': now,
+        }
+        if job.can_retry():
+            # Nova tentativa com a mesma idempotency_key (post_key): se a postagem anterior chegou
+            # à plataforma antes do worker morrer, o backend a reconhece e não posta de novo
+            values.update(status='pending', retry_count=job.retry_count + 1, scheduled_time=now, started_at=None)
+            report['jobs_requeued'] += _reclaim(PostingJob, job, 'status', expired, values)
+        else:
+            values.update(status='failed', completed_at=now)
+            report['jobs_failed'] += _reclaim(PostingJob, job, 'status', expired, values)
+
+    max_attempts = current_app.config.get('VIDEO_MAX_ATTEMPTS', 3)
+    expired = _expired(Video, Video.updated_at, now)
+    for video in Video.query.filter(Video.processing_status == 'processing', expired).all():
+        values = {'worker_id': None, 'lease_expires_at': None, 'updated_at': now}
+        if (video.processing_attempts or 0) < max_attempts:
+            values['processing_status'] = 'uploaded'
+            report['videos_requeued'] += _reclaim(Video, video, 'processing_status', expired, values)
+        else:
+            values['processing_status'] = 'error'
+            report['videos_failed'] += _reclaim(Video, video, 'processing_status', expired, values)
+
+    expired = _expired(VariantRender, VariantRender.started_at, now)
+    for render in VariantRender.query.filter(VariantRender.status == 'rendering', expired).all():
+        report['renders_requeued'] += _reclaim(VariantRender, render, 'status', expired, {
+            'status': 'pending', 'worker_id': None, 'lease_expires_at': None, 'started_at': None, 'updated_at': now,
+        })
+
+    db.session.commit()
+
+    if report['renders_requeued']:
+        from src.services.render_queue import wake_render_worker
+        wake_render_worker()
+    return report
+
+
+def reprocess_uploaded():
+    """Põe na fila da ingestão os vídeos que ficaram em 'uploaded' (devolvidos pelo reaper ou upload interrompido).
+
+    Os encodes rodam nos workers da ingestão, não na thread do reaper, que
+    continua devolvendo leases enquanto isso.
+    """
+    from src.models.video import Video
+    from src.services import ingest
+
+    # Carência de uma lease: o upload processa o vídeo logo após criá-lo
+    cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds())
+    video_ids = [
+        video_id for (video_id,) in Video.query.with_entities(Video.id).filter(
+            Video.processing_status == 'uploaded', Video.updated_at < cutoff
+        ).order_by(Video.id.asc())
+    ]
+    return ingest.enqueue(video_ids)
+
+
+def _reaper_loop(app):
+    while True:
+        _wake_event.wait(app.config.get('REAPER_INTERVAL', 60))
+        _wake_event.clear()
+        try:
+            with app.app_context():
+                from src.models.schema import ensure_schema
+                ensure_schema()
+                report = reap_expired()
+                report['videos_enqueued'] = reprocess_uploaded()
+            if any(report.values()):
+                logger.info('Reaper: %s', report)
+        except Exception as e:
+            logger.warning('Erro no reaper de leases: %s', e)
+
+
+def _start_reaper(app):
+    global _reaper_thread
+    if _reaper_thread is None or not _reaper_thread.is_alive():
+        _reaper_thread = threading.Thread(target=_reaper_loop, args=(app,), name='lease-reaper', daemon=True)
+        _reaper_thread.start()
+
+
+def register_cli(app):
+    """Registra o comando `flask reap-leases`"""
+    import click
+
+    @app.cli.command('reap-leases')
+    @click.option('--reprocess/--no-reprocess', default=True, help='Processa também os vídeos devolvidos à fila')
+    def reap_leases(reprocess):
+        """Devolve à fila o trabalho com lease expirada"""
+        from src.models.schema import ensure_schema
+
+        ensure_schema()
+        report = reap_expired()
+        if reprocess:
+            from src.services import ingest
+
+            report['videos_enqueued'] = reprocess_uploaded()
+            click.echo(report)
+            # Os cortes rodam nos workers da ingestão: espera a fila esvaziar
+            ingest.wait_idle()
+        else:
+            click.echo(report)
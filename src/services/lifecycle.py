@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from src.services import governor, leases, media
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(__file__), '..', 'database', 'next_due.json')
+# Chave do estado do waker no bucket (MEDIA_BACKEND=s3)
+STATE_KEY = 'system/next_due.json'
+
+_settings = {
+    'drain_timeout': 100,
+    'state_file': None,
+    'refresh_interval': 60,
+}
+# Trabalho em andamento (cortes, renderizações, despacho) que o drain espera terminar
+_busy = [0]
+_busy_lock = threading.Condition()
+_last_state = {}
+_refresh_thread = None
+
+
+def init_lifecycle(app):
+    """Configura o drain e inicia a thread que mantém o próximo vencimento gravado para o waker"""
+    _settings['drain_timeout'] = app.config.get('DRAIN_TIMEOUT_SECONDS', 100)
+    _settings['refresh_interval'] = app.config.get('WAKE_REFRESH_SECONDS', 60)
+    _settings['state_file'] = None
+    if app.config.get('WAKE_STATE_ENABLED', True):
+        _settings['state_file'] = app.config.get('WAKE_STATE_FILE') or DEFAULT_STATE_FILE
+        _start_refresher(app)
+
+    # Leases vencidas no drain anterior voltam à fila já no boot, sem esperar REAPER_INTERVAL
+    leases.wake_reaper()
+
+
+@contextmanager
+def busy():
+    """Marca trabalho em andamento: o drain espera ele terminar (até DRAIN_TIMEOUT_SECONDS)"""
+    with _busy_lock:
+        _busy[0] += 1
+    try:
+        yield
+    finally:
+        with _busy_lock:
+            _busy[0] -= 1
+            _busy_lock.notify_all()
+
+
+def next_due():
+    """Próximo instante com trabalho (UTC) e o motivo, ou (None, None) se não houver nada.
+
+    Jobs pendentes vencem no horário agendado, renderizações na deadline,
+    vídeos em 'uploaded' quando o reaper os reprocessa e trabalho com lease
+    (interrompido no meio) quando a lease vence.
+    """
+    from sqlalchemy import func
+    from src.models.user import db
+    from src.models.video import PostingJob, VariantRender, Video
+
+    lease = timedelta(seconds=leases.lease_seconds())
+    uploaded = db.session.query(func.min(Video.updated_at)).filter(Video.processing_status == 'uploaded').scalar()
+    candidates = [
+        (db.session.query(func.min(PostingJob.scheduled_time)).filter(PostingJob.status == 'pending').scalar(), 'job'),
+        (db.session.query(func.min(VariantRender.deadline)).filter(VariantRender.status == 'pending').scalar(),
+         'render'),
+        (uploaded + lease if uploaded else None, 'video'),
+    ]
+    for model, status_column, status in (
+        (PostingJob, PostingJob.status, 'processing'),
+        (Video, Video.processing_status, 'processing'),
+        (VariantRender, VariantRender.status, 'rendering'),
+    ):
+        expires = db.session.query(func.min(model.lease_expires_at)).filter(status_column == status).scalar()
+        candidates.append((expires, 'lease'))
+
+    candidates = [candidate for candidate in candidates if candidate[0] is not None]
+    if not candidates:
+        return None, None
+    return min(candidates, key=lambda candidate: candidate[0])
+
+
+def _write_state(state):
+    path = _settings['state_file']
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+    # Com bucket, o waker lê o estado de lá (o volume some junto com a máquina parada)
+    if media.backend().remote:
+        media.upload(path, STATE_KEY)
+
+
+def refresh_next_due(force=False):
+    """Grava o próximo vencimento (arquivo WAKE_STATE_FILE e, com bucket, STATE_KEY) se ele mudou"""
+    if not _settings['state_file']:
+        return None
+    due, reason = next_due()
+    state = {
+        'next_due': due.isoformat(timespec='seconds') + 'Z' if due else None,
+        'reason': reason,
+        'draining': governor.draining(),
+    }
+    if force or state != _last_state:
+        _write_state({**state, 'updated_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z'})
+        _last_state.clear()
+        _last_state.update(state)
+    return state
+
+
+def drain(app, reason='sinal'):
+    """Para de aceitar trabalho, espera o que está em andamento e grava o próximo vencimento.
+
+    Encodes por segmentos param na fronteira de um segmento (Drained) e
+    retomam dali; o que não terminar em DRAIN_TIMEOUT_SECONDS tem a lease
+    vencida na hora, para o reaper do próximo boot devolvê-lo à fila.
+    """
+    logger.info('Drain iniciado (%s)', reason)
+    governor.begin_drain()
+    deadline = time.monotonic() + _settings['drain_timeout']
+    with _busy_lock:
+        while _busy[0] and time.monotonic() < deadline:
+            _busy_lock.wait(min(1.0, max(0.0, deadline - time.monotonic())))
+        unfinished = _busy[0]
+
+    with app.app_context():
+        expired = leases.expire_own() if unfinished else 0
+        try:
+            state = refresh_next_due(force=True)
+        except Exception as e:
+            logger.warning('Não foi possível gravar o próximo vencimento: %s', e)
+            state = None
+    logger.info('Drain concluído: %d em andamento, %d leases vencidas, próximo vencimento %s',
+                unfinished, expired, state and state['next_due'])
+    return {'unfinished': unfinished, 'leases_expired': expired, 'state': state}
+
+
+def install_signal_handlers(app):
+    """SIGTERM/SIGINT (o Fly manda um deles no auto stop) disparam o drain antes de sair.
+
+    Só vale no processo do servidor (thread principal); um segundo sinal
+    durante o drain sai na hora.
+    """
+    def handle(signum, frame):
+        if governor.draining():
+            sys.exit(1)
+        drain(app, signal.Signals(signum).name)
+        sys.exit(0)
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, handle)
+
+
+def status():
+    """Estado para /api/system/lifecycle"""
+    with _busy_lock:
+        in_flight = _busy[0]
+    due, reason = next_due()
+    return {
+        'draining': governor.draining(),
+        'in_flight': in_flight,
+        'next_due': due.isoformat() if due else None,
+        'next_due_reason': reason,
+    }
+
+
+def _refresher_loop(app):
+    while not governor.draining():
+        try:
+            with app.app_context():
+                from src.models.schema import ensure_schema
+                ensure_schema()
+                refresh_next_due()
+        except Exception as e:
+            logger.warning('Erro ao gravar o próximo vencimento: %s', e)
+        time.sleep(_settings['refresh_interval'])
+
+
+def _start_refresher(app):
+    global _refresh_thread
+    if _refresh_thread is None or not _refresh_thread.is_alive():
+        _refresh_thread = threading.Thread(target=_refresher_loop, args=(app,), name='wake-state', daemon=True)
+        _refresh_thread.start()
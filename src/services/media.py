@@ -0,0 +1,625 @@
+import hashlib
+import hmac
+import http.client
+import logging
+import mimetypes
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+
+from src.services import storage
+
+logger = logging.getLogger(__name__)
+
+REMOTE_SCHEME = 's3://'
+# Blocos de leitura/escrita em disco e rede: a memória não cresce com o arquivo
+CHUNK_SIZE = 1024 * 1024
+# Mínimo do S3 para as partes de um multipart (exceto a última)
+MIN_PART_SIZE = 5 * 1024 * 1024
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+ATTEMPTS = 3
+RETRY_DELAY = 1.0
+# Só o que vira arquivo de trabalho entra no cache (tmp e overlays têm limpeza própria)
+CACHED_DIRS = ('originals', 'processed')
+
+_settings = {
+    'cache_bytes': 0,
+    'url_expires': 3600,
+}
+_backend = None
+
+# Cópias locais de objetos remotos: caminho -> [tamanho, confirmado no bucket], do menos ao mais usado
+_cache = OrderedDict()
+_pinned = {}
+_cache_lock = threading.Lock()
+_fetch_locks = {}
+
+
+class MediaError(OSError):
+    """Falha do armazenamento de objetos (resposta inesperada, multipart rejeitado)"""
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hmac(key, message):
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+def _signing_key(secret_key, date, region):
+    key = _hmac(f'AWS4{secret_key}'.encode(), date)
+    key = _hmac(key, region)
+    key = _hmac(key, 's3')
+    return _hmac(key, 'aws4_request')
+
+
+def _canonical_query(query):
+    return '&'.join(
+        f"{quote(str(name), safe='-_.~')}={quote(str(value), safe='-_.~')}"
+        for name, value in sorted(query.items())
+    )
+
+
+def _string_to_sign(method, path, query, headers, payload_hash, amz_date, scope):
+    names = sorted(name.lower() for name in headers)
+    values = {name.lower(): ' '.join(str(value).split()) for name, value in headers.items()}
+    canonical_request = '\n'.join([
+        method,
+        quote(path, safe='/-_.~'),
+        _canonical_query(query),
+        ''.join(f'{name}:{values[name]}\n' for name in names),
+        ';'.join(names),
+        payload_hash,
+    ])
+    return '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope, _sha256(canonical_request.encode())]), ';'.join(names)
+
+
+def sign_v4(method, path, query, headers, payload_hash, access_key, secret_key, region, now):
+    """Header Authorization (AWS Signature V4) para os headers dados; eles precisam incluir host e x-amz-date"""
+    date = now.strftime('%Y%m%d')
+    scope = f'{date}/{region}/s3/aws4_request'
+    string_to_sign, signed_headers = _string_to_sign(
+        method, path, query, headers, payload_hash, now.strftime('%Y%m%dT%H%M%SZ'), scope
+    )
+    signature = hmac.new(_signing_key(secret_key, date, region), string_to_sign.encode(), hashlib.sha256).hexdigest()
+    return f'AWS4-HMAC-SHA256 Credential={access_key}/{scope},SignedHeaders={signed_headers},Signature={signature}'
+
+
+def presign_v4(method, host, path, expires, access_key, secret_key, region, now):
+    """Query string de uma URL pré-assinada (só o host assinado, payload não assinado)"""
+    date = now.strftime('%Y%m%d')
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    scope = f'{date}/{region}/s3/aws4_request'
+    query = {
+        'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+        'X-Amz-Credential': f'{access_key}/{scope}',
+        'X-Amz-Date': amz_date,
+        'X-Amz-Expires': int(expires),
+        'X-Amz-SignedHeaders': 'host',
+    }
+    string_to_sign, _ = _string_to_sign(method, path, query, {'host': host}, 'UNSIGNED-PAYLOAD', amz_date, scope)
+    query['X-Amz-Signature'] = hmac.new(
+        _signing_key(secret_key, date, region), string_to_sign.encode(), hashlib.sha256
+    ).hexdigest()
+    return _canonical_query(query)
+
+
+def _file_chunks(path, offset, length):
+    """Trecho [offset, offset + length) do arquivo, lido em blocos de CHUNK_SIZE"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                raise MediaError(f'{path} encolheu durante o envio')
+            length -= len(data)
+            yield data
+
+
+def _file_sha256(path, offset, length):
+    digest = hashlib.sha256()
+    for data in _file_chunks(path, offset, length):
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _xml_text(body, tag):
+    for element in ElementTree.fromstring(body).iter():
+        if element.tag.rsplit('}', 1)[-1] == tag:
+            return element.text
+    return None
+
+
+class LocalBackend:
+    """Mídia só no disco desta máquina: a referência é o próprio caminho (comportamento original)"""
+
+    remote = False
+
+
+class S3Backend:
+    """Cliente mínimo de S3 (AWS, Tigris, R2, MinIO) com endereçamento por caminho e assinatura V4.
+
+    Uploads acima de uma parte vão em multipart; cada parte é lida do disco
+    duas vezes (hash e envio) em vez de ficar inteira na memória.
+    """
+
+    remote = True
+
+    def __init__(self, endpoint, bucket, access_key, secret_key, region='us-east-1',
+                 part_size=8 * 1024 * 1024, timeout=60.0):
+        parts = urlsplit(endpoint)
+        self.ssl = parts.scheme == 'https'
+        self.hostname = parts.hostname
+        self.port = parts.port or (443 if self.ssl else 80)
+        default_port = 443 if self.ssl else 80
+        self.host = self.hostname if self.port == default_port else f'{self.hostname}:{self.port}'
+        self.endpoint = f'{parts.scheme}://{self.host}'
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self.timeout = timeout
+
+    def ref_for(self, key):
+        return f'{REMOTE_SCHEME}{self.bucket}/{key}'
+
+    def _path(self, bucket, key):
+        return f'/{bucket}/{key}'
+
+    def _connection(self):
+        connection_class = http.client.HTTPSConnection if self.ssl else http.client.HTTPConnection
+        return connection_class(self.hostname, self.port, timeout=self.timeout)
+
+    def _send(self, method, path, query=None, headers=None, body=None, payload_hash=EMPTY_SHA256):
+        """Uma requisição assinada; devolve (conexão, resposta) com o corpo ainda não lido"""
+        query = query or {}
+        now = datetime.now(timezone.utc)
+        headers = {
+            'host': self.host,
+            'x-amz-date': now.strftime('%Y%m%dT%H%M%SZ'),
+            'x-amz-content-sha256': payload_hash,
+            **(headers or {}),
+        }
+        headers['Authorization'] = sign_v4(
+            method, path, query, headers, payload_hash, self.access_key, self.secret_key, self.region, now
+        )
+        url = quote(path, safe='/-_.~')
+        if query:
+            url += '?' + _canonical_query(query)
+        connection = self._connection()
+        try:
+            connection.request(method, url, body=body() if callable(body) else body, headers=headers)
+            return connection, connection.getresponse()
+        except BaseException:
+            connection.close()
+            raise
+
+    def _request(self, method, path, query=None, headers=None, body=None, payload_hash=EMPTY_SHA256,
+                 expect=(200,), stream=False):
+        """Requisição com novas tentativas em erro de rede ou 5xx; `body` pode ser uma função (refeita a cada tentativa).
+
+        Com `stream`, devolve a resposta aberta (o chamador lê e fecha).
+        """
+        for attempt in range(ATTEMPTS):
+            try:
+                connection, response = self._send(method, path, query, headers, body, payload_hash)
+            except (OSError, http.client.HTTPException) as e:
+                if attempt + 1 == ATTEMPTS:
+                    raise MediaError(f'{method} {path}: {e}') from e
+                time.sleep(RETRY_DELAY * 2 ** attempt)
+                continue
+
+            if response.status in expect:
+                if stream:
+                    return response
+                data = response.read()
+                connection.close()
+                response.data = data
+                return response
+
+            data = response.read()
+            connection.close()
+            if response.status >= 500 and attempt + 1 < ATTEMPTS:
+                time.sleep(RETRY_DELAY * 2 ** attempt)
+                continue
+            raise MediaError(f'{method} {path}: HTTP {response.status} {data[:200]!r}')
+
+    def head(self, bucket, key):
+        """Tamanho e data de modificação do objeto, ou None se ele não existir"""
+        response = self._request('HEAD', self._path(bucket, key), expect=(200, 404))
+        if response.status == 404:
+            return None
+        modified = response.getheader('Last-Modified')
+        return {
+            'size': int(response.getheader('Content-Length') or 0),
+            'mtime': datetime.strptime(modified, '%a, %d %b %Y %H:%M:%S GMT').replace(
+                tzinfo=timezone.utc).timestamp() if modified else 0,
+        }
+
+    def put_file(self, bucket, key, path):
+        size = os.path.getsize(path)
+        headers = {'content-type': mimetypes.guess_type(path)[0] or 'application/octet-stream'}
+        if size <= self.part_size:
+            self._request(
+                'PUT', self._path(bucket, key), headers={**headers, 'content-length': str(size)},
+                body=lambda: _file_chunks(path, 0, size), payload_hash=_file_sha256(path, 0, size)
+            )
+            return
+
+        object_path = self._path(bucket, key)
+        response = self._request('POST', object_path, query={'uploads': ''}, headers=headers)
+        upload_id = _xml_text(response.data, 'UploadId')
+        if not upload_id:
+            raise MediaError(f'Multipart de {key} sem UploadId')
+        try:
+            etags = []
+            for number, offset in enumerate(range(0, size, self.part_size), start=1):
+                length = min(self.part_size, size - offset)
+                response = self._request(
+                    'PUT', object_path, query={'partNumber': number, 'uploadId': upload_id},
+                    headers={'content-length': str(length)},
+                    body=lambda offset=offset, length=length: _file_chunks(path, offset, length),
+                    payload_hash=_file_sha256(path, offset, length)
+                )
+                etags.append(response.getheader('ETag'))
+
+            manifest = ''.join(
+                f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+                for number, etag in enumerate(etags, start=1)
+            )
+            manifest = f'<CompleteMultipartUpload>{manifest}</CompleteMultipartUpload>'.encode()
+            response = self._request(
+                'POST', object_path, query={'uploadId': upload_id}, body=manifest,
+                headers={'content-length': str(len(manifest))}, payload_hash=_sha256(manifest)
+            )
+            # O S3 pode responder 200 e mesmo assim recusar a conclusão (erro no corpo)
+            if _xml_text(response.data, 'Code'):
+                raise MediaError(f'Multipart de {key} recusado: {response.data[:200]!r}')
+        except BaseException:
+            try:
+                self._request('DELETE', object_path, query={'uploadId': upload_id}, expect=(204, 200, 404))
+            except MediaError as e:
+                logger.warning('Não foi possível abortar o multipart de %s: %s', key, e)
+            raise
+
+    def get_file(self, bucket, key, path):
+        """Baixa o objeto em stream para um temporário ao lado de `path` e renomeia no fim"""
+        response = self._request('GET', self._path(bucket, key), stream=True)
+        expected = int(response.getheader('Content-Length') or -1)
+        tmp = f'{path}.{uuid.uuid4().hex[:8]}.part'
+        received = 0
+        try:
+            with open(tmp, 'wb') as f:
+                while True:
+                    data = response.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    f.write(data)
+                    received += len(data)
+            if expected >= 0 and received != expected:
+                raise MediaError(f'Download de {key} incompleto ({received} de {expected} bytes)')
+            os.replace(tmp, path)
+        finally:
+            response.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def delete(self, bucket, key):
+        self._request('DELETE', self._path(bucket, key), expect=(204, 200, 404))
+
+    def presigned_url(self, bucket, key, expires):
+        path = self._path(bucket, key)
+        query = presign_v4('GET', self.host, path, expires, self.access_key, self.secret_key, self.region,
+                           datetime.now(timezone.utc))
+        return f"{self.endpoint}{quote(path, safe='/-_.~')}?{query}"
+
+
+def get_backend(config):
+    """Backend de mídia conforme MEDIA_BACKEND (local ou s3)"""
+    kind = (config.get('MEDIA_BACKEND') or 'local').lower()
+    if kind == 'local':
+        return LocalBackend()
+    if kind == 's3':
+        return S3Backend(
+            config['MEDIA_S3_ENDPOINT'],
+            config['MEDIA_S3_BUCKET'],
+            config['MEDIA_S3_ACCESS_KEY'],
+            config['MEDIA_S3_SECRET_KEY'],
+            region=config.get('MEDIA_S3_REGION') or 'us-east-1',
+            part_size=int(config.get('MEDIA_PART_SIZE_MB', 8) * 1024 * 1024),
+        )
+    raise ValueError(f'MEDIA_BACKEND desconhecido: {kind}')
+
+
+def init_media(app):
+    """Escolhe o backend de mídia e, se remoto, reconhece as cópias locais já em disco como cache"""
+    global _backend
+    _backend = get_backend(app.config)
+    _settings['cache_bytes'] = int(app.config.get('MEDIA_CACHE_MB', 2048) * 1024 * 1024)
+    _settings['url_expires'] = app.config.get('MEDIA_URL_EXPIRES', 3600)
+    with _cache_lock:
+        _cache.clear()
+    if _backend.remote:
+        _scan_cache()
+
+
+def backend():
+    return _backend or LocalBackend()
+
+
+def is_remote(ref):
+    return bool(ref) and ref.startswith(REMOTE_SCHEME)
+
+
+def _split(ref):
+    bucket, _, key = ref[len(REMOTE_SCHEME):].partition('/')
+    return bucket, key
+
+
+def _key(path):
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(storage.media_root())).replace(os.sep, '/')
+
+
+def ref_for(path):
+    """Referência que um arquivo de `storage` terá depois de publicado (o caminho, no backend local)"""
+    if not backend().remote:
+        return path
+    return backend().ref_for(_key(path))
+
+
+def cache_path(ref):
+    """Caminho local de trabalho da referência (o próprio caminho, se ela for local)"""
+    if not is_remote(ref):
+        return ref
+    _, key = _split(ref)
+    return os.path.join(storage.media_root(), *key.split('/'))
+
+
+def output_path(ref):
+    """Caminho local onde gerar o arquivo da referência (a máquina pode nunca ter tido o diretório)"""
+    path = cache_path(ref)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def publish(path):
+    """Envia o arquivo local ao backend e devolve a referência a gravar no banco.
+
+    A cópia local continua em disco como entrada do cache (quente para o encode
+    que costuma vir logo depois do upload).
+    """
+    if not backend().remote:
+        return path
+    ref = ref_for(path)
+    bucket, key = _split(ref)
+    backend().put_file(bucket, key, path)
+    _remember(path, verified=True)
+    return ref
+
+
+def upload(path, key):
+    """Envia um arquivo fora de MEDIA_ROOT (ex.: estado do waker) para `key` no bucket"""
+    bucket = backend().bucket
+    backend().put_file(bucket, key, path)
+    return backend().ref_for(key)
+
+
+def _fetch_lock(path):
+    with _cache_lock:
+        return _fetch_locks.setdefault(path, threading.Lock())
+
+
+def _pin(path, delta):
+    with _cache_lock:
+        count = _pinned.get(path, 0) + delta
+        if count > 0:
+            _pinned[path] = count
+        else:
+            _pinned.pop(path, None)
+
+
+def _fetch(ref, path):
+    if os.path.exists(path):
+        return
+    with _fetch_lock(path):
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            backend().get_file(*_split(ref), path)
+
+
+@contextmanager
+def local(ref):
+    """Caminho local do arquivo enquanto o bloco roda: baixa se não estiver no cache e o protege do despejo"""
+    if not is_remote(ref):
+        yield ref
+        return
+    path = cache_path(ref)
+    _pin(path, 1)
+    try:
+        _fetch(ref, path)
+        _remember(path, verified=True)
+        yield path
+    finally:
+        _pin(path, -1)
+
+
+def fetch(ref):
+    """Caminho local de um arquivo pequeno (ex.: legenda), sem proteção contra despejo"""
+    with local(ref) as path:
+        return path
+
+
+def exists(ref):
+    if not is_remote(ref):
+        return os.path.exists(ref)
+    if os.path.exists(cache_path(ref)):
+        return True
+    return backend().head(*_split(ref)) is not None
+
+
+def stat(ref):
+    """Tamanho e último uso do arquivo (cópia local ou objeto remoto), ou None se não existir"""
+    path = cache_path(ref)
+    try:
+        info = os.stat(path)
+        return {'size': info.st_size, 'last_access': max(info.st_atime, info.st_mtime), 'mtime': info.st_mtime}
+    except OSError:
+        pass
+    if not is_remote(ref):
+        return None
+    remote = backend().head(*_split(ref))
+    if remote is None:
+        return None
+    return {'size': remote['size'], 'last_access': remote['mtime'], 'mtime': remote['mtime']}
+
+
+def delete(ref):
+    """Remove o arquivo (objeto remoto e cópia local); FileNotFoundError só para caminhos locais"""
+    if not is_remote(ref):
+        os.remove(ref)
+        return
+    backend().delete(*_split(ref))
+    path = cache_path(ref)
+    with _cache_lock:
+        _cache.pop(path, None)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def presigned_url(ref):
+    """URL temporária para quem está fora desta máquina (serviço de postagem), ou None se local"""
+    if not is_remote(ref):
+        return None
+    return backend().presigned_url(*_split(ref), _settings['url_expires'])
+
+
+def _remember(path, verified):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    with _cache_lock:
+        entry = _cache.pop(path, None)
+        _cache[path] = [size, verified or bool(entry and entry[1])]
+    _evict()
+
+
+def _scan_cache():
+    """Cópias já em disco (de antes do restart) entram no LRU pela data de modificação"""
+    found = []
+    for directory in CACHED_DIRS:
+        for root, _, names in os.walk(os.path.join(storage.media_root(), directory)):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                found.append((info.st_mtime, path, info.st_size))
+    with _cache_lock:
+        for _, path, size in sorted(found):
+            _cache[path] = [size, False]
+    _evict()
+
+
+def cache_usage():
+    with _cache_lock:
+        return {'bytes': sum(size for size, _ in _cache.values()), 'files': len(_cache),
+                'limit_bytes': _settings['cache_bytes'], 'pinned': len(_pinned)}
+
+
+def _evict():
+    """Despeja as cópias menos usadas até o cache caber no limite (as em uso ficam)"""
+    limit = _settings['cache_bytes']
+    if not limit:
+        return
+    with _cache_lock:
+        total = sum(size for size, _ in _cache.values())
+        victims = []
+        for path, (size, verified) in _cache.items():
+            if total <= limit:
+                break
+            if path in _pinned:
+                continue
+            victims.append((path, verified))
+            total -= size
+
+    for path, verified in victims:
+        # Cópia anterior ao restart: só sai se o bucket tiver o objeto (senão não é cache)
+        if not verified:
+            try:
+                present = backend().head(*_split(ref_for(path))) is not None
+            except MediaError as e:
+                logger.warning('Não foi possível confirmar %s no bucket: %s', path, e)
+                continue
+            if not present:
+                with _cache_lock:
+                    _cache.pop(path, None)
+                continue
+        with _cache_lock:
+            if path in _pinned or path not in _cache:
+                continue
+            _cache.pop(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning('Erro ao despejar %s do cache: %s', path, e)
+
+
+def register_cli(app):
+    import json
+
+    import click
+
+    @app.cli.command('media-push')
+    @click.option('--dry-run', is_flag=True, help='Só lista o que seria enviado')
+    def media_push(dry_run):
+        """Envia ao bucket a mídia ainda referenciada por caminho local e atualiza o banco"""
+        from src.models.user import db
+        from src.models.video import PostingJob, VariantRender, Video
+
+        if not backend().remote:
+            raise click.ClickException('MEDIA_BACKEND não é remoto')
+
+        pushed = {}
+
+        def push(path):
+            if not path or is_remote(path) or not os.path.exists(path):
+                return path
+            if path not in pushed:
+                if dry_run:
+                    click.echo(path)
+                    pushed[path] = path
+                else:
+                    pushed[path] = publish(path)
+            return pushed[path]
+
+        for video in Video.query.all():
+            video.file_path = push(video.file_path)
+            video.subtitles_path = push(video.subtitles_path)
+            processed_files = json.loads(video.processed_files or '{}')
+            video.processed_files = json.dumps({variant: push(path) for variant, path in processed_files.items()})
+            if not dry_run:
+                db.session.commit()
+
+        if not dry_run:
+            for render in VariantRender.query.filter(VariantRender.output_path.in_(list(pushed))):
+                render.output_path = pushed[render.output_path]
+            for job in PostingJob.query.filter(PostingJob.video_file_path.in_(list(pushed))):
+                job.video_file_path = pushed[job.video_file_path]
+            db.session.commit()
+        else:
+            db.session.rollback()
+        click.echo(f"{len(pushed)} arquivo(s) {'a enviar' if dry_run else 'enviados'}")
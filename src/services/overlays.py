@@ -0,0 +1,210 @@
+import hashlib
+import json
+import logging
+import os
+import textwrap
+import threading
+import uuid
+
+from flask import current_app
+
+from src.services import media, storage
+
+logger = logging.getLogger(__name__)
+
+SUBTITLE_EXTENSIONS = {'srt', 'vtt', 'ass'}
+WATERMARK_POSITIONS = {
+    'top-left': ('{m}', '{m}'),
+    'top-right': ('main_w-overlay_w-{m}', '{m}'),
+    'bottom-left': ('{m}', 'main_h-overlay_h-{m}'),
+    'bottom-right': ('main_w-overlay_w-{m}', 'main_h-overlay_h-{m}'),
+}
+CAPTION_POSITIONS = {
+    'top': '{m}',
+    'center': '(h-text_h)/2',
+    'bottom': 'h-text_h-{m}',
+}
+# Largura média de um caractere em relação ao tamanho da fonte (quebra de linha da legenda)
+CHAR_WIDTH = 0.55
+
+DEFAULTS = {
+    'watermark': None,
+    'watermark_position': 'top-right',
+    'watermark_width': 0.18,
+    'watermark_opacity': 0.8,
+    'caption': False,
+    'caption_position': 'bottom',
+    'font': None,
+    'font_size': 0.04,
+    'font_color': 'white',
+    'box_color': 'black@0.5',
+    'margin': 0.04,
+    'subtitles': True,
+}
+
+# Perfis já lidos, pelo valor bruto de OVERLAY_PROFILES
+_profiles = {}
+_render_lock = threading.Lock()
+
+
+class OverlayError(ValueError):
+    """Perfil de overlay desconhecido ou legenda em formato não suportado"""
+
+
+def load_profiles():
+    """Perfis de OVERLAY_PROFILES: JSON inline ou caminho de um arquivo JSON ({nome: opções})"""
+    raw = current_app.config.get('OVERLAY_PROFILES') or '{}'
+    if raw not in _profiles:
+        if raw.lstrip().startswith('{'):
+            loaded = json.loads(raw)
+        else:
+            with open(raw) as f:
+                loaded = json.load(f)
+        profiles = {name: {**DEFAULTS, **options} for name, options in loaded.items()}
+        for name, profile in profiles.items():
+            if profile['watermark_position'] not in WATERMARK_POSITIONS:
+                raise OverlayError(f"Perfil {name}: watermark_position inválida ({', '.join(WATERMARK_POSITIONS)})")
+            if profile['caption_position'] not in CAPTION_POSITIONS:
+                raise OverlayError(f"Perfil {name}: caption_position inválida ({', '.join(CAPTION_POSITIONS)})")
+        _profiles[raw] = profiles
+    return _profiles[raw]
+
+
+def resolve_profile(name):
+    """Nome do perfil a gravar no vídeo: o pedido, o padrão da config, ou None ('none' desliga)"""
+    if name is None or name == '':
+        name = current_app.config.get('OVERLAY_DEFAULT_PROFILE')
+    if not name or name == 'none':
+        return None
+    if name not in load_profiles():
+        raise OverlayError(f'Perfil de overlay desconhecido: {name}')
+    return name
+
+
+def check_subtitles(filename):
+    if filename.rsplit('.', 1)[-1].lower() not in SUBTITLE_EXTENSIONS:
+        raise OverlayError(f"Legenda deve ser {', '.join(sorted(SUBTITLE_EXTENSIONS))}")
+
+
+def video_overlay(video):
+    """Overlays do vídeo (perfil + legenda/hashtags + arquivo de legendas), ou None se não houver"""
+    profile = load_profiles().get(video.overlay_profile) if video.overlay_profile else None
+    if profile is None:
+        return None
+
+    caption = None
+    if profile['caption']:
+        caption = '\n'.join(part.strip() for part in (video.caption, video.hashtags) if part and part.strip())
+    subtitles = video.subtitles_path if profile['subtitles'] and video.subtitles_path else None
+    if subtitles:
+        # O filtro subtitles lê o arquivo: legenda no bucket vem para o cache local
+        subtitles = media.fetch(subtitles)
+    if not (profile['watermark'] or caption or subtitles):
+        return None
+    return {**profile, 'caption_text': caption or None, 'subtitles_path': subtitles}
+
+
+def _touch(path):
+    """Marca uso: o sweeper só remove do cache o que ficou sem uso por STORAGE_CACHE_RETENTION_HOURS"""
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def _cached(name, render):
+    """Caminho do arquivo `name` no cache de overlays, gerado por `render(tmp)` se não existir"""
+    path = os.path.join(storage.overlay_dir(), name)
+    if _touch(path):
+        return path
+    with _render_lock:
+        if not os.path.exists(path):
+            tmp = f'{path}.{uuid.uuid4().hex[:8]}.tmp{os.path.splitext(path)[1]}'
+            try:
+                render(tmp)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+    return path
+
+
+def watermark_image(source, width, opacity):
+    """PNG da marca d'água já na largura e opacidade finais, gerado uma vez e reaproveitado entre vídeos"""
+    import ffmpeg
+
+    stat = os.stat(source)
+    key = hashlib.sha1(
+        f'{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}:{width}:{opacity}'.encode()
+    ).hexdigest()[:20]
+
+    def render(tmp):
+        (
+            ffmpeg
+            .input(source)
+            .filter('scale', width, -1, flags='lanczos')
+            .filter('format', 'rgba')
+            .filter('colorchannelmixer', aa=opacity)
+            .output(tmp, vframes=1)
+            .overwrite_output()
+            .run(quiet=True)
+        )
+
+    return _cached(f'watermark_{key}.png', render)
+
+
+def caption_file(text, columns):
+    """Texto da legenda com quebras de linha, num arquivo para o drawtext (sem escapes no filtro)"""
+    wrapped = '\n'.join(textwrap.fill(line, columns) for line in text.splitlines() if line.strip())
+    key = hashlib.sha1(wrapped.encode()).hexdigest()[:20]
+
+    def render(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(wrapped)
+
+    return _cached(f'caption_{key}.txt', render)
+
+
+def apply(stream, overlay, width, height, offset=0.0):
+    """Acrescenta legendas, texto e marca d'água ao stream já cortado/escalado (mesmo filter graph).
+
+    `offset` é o instante da fonte em que o stream começa (trim ou segmento):
+    as legendas são posicionadas no tempo original da fonte.
+    """
+    import ffmpeg
+
+    if not overlay:
+        return stream
+    margin = int(min(width, height) * overlay['margin'])
+
+    if overlay['subtitles_path']:
+        if offset:
+            stream = stream.filter('setpts', f'PTS+{offset}/TB')
+        stream = stream.filter('subtitles', overlay['subtitles_path'])
+        if offset:
+            stream = stream.filter('setpts', 'PTS-STARTPTS')
+
+    if overlay['caption_text']:
+        font_size = max(12, int(height * overlay['font_size']))
+        columns = max(10, int(width * 0.9 / (font_size * CHAR_WIDTH)))
+        font = {'fontfile': overlay['font']} if overlay['font'] else {'font': 'Sans'}
+        # Legendas SRT ocupam a parte de baixo: o texto da legenda sobe para não sobrepor
+        position = overlay['caption_position']
+        if position == 'bottom' and overlay['subtitles_path']:
+            position = 'top'
+        stream = stream.filter(
+            'drawtext', textfile=caption_file(overlay['caption_text'], columns), expansion='none',
+            fontsize=font_size, fontcolor=overlay['font_color'], line_spacing=font_size // 4,
+            box=1, boxcolor=overlay['box_color'], boxborderw=font_size // 3,
+            x='(w-text_w)/2', y=CAPTION_POSITIONS[position].format(m=margin),
+            **font
+        )
+
+    if overlay['watermark']:
+        image = watermark_image(overlay['watermark'], max(2, int(width * overlay['watermark_width'])),
+                                overlay['watermark_opacity'])
+        x, y = WATERMARK_POSITIONS[overlay['watermark_position']]
+        stream = ffmpeg.overlay(stream, ffmpeg.input(image).video, x=x.format(m=margin), y=y.format(m=margin))
+
+    return stream
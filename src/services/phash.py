@@ -0,0 +1,248 @@
+import functools
+import itertools
+import logging
+import threading
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+CHUNK_BITS = 16
+CHUNKS = HASH_BITS // CHUNK_BITS
+FRAME_SIZE = 32
+MAX_FRAMES = 64
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _dct_matrix(size):
+    """Matriz da DCT-II ortonormal: coeficientes = D @ bloco @ D.T"""
+    import numpy as np
+
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def _keyframes_gray(file_path):
+    """Decodifica só os keyframes, já reduzidos a 32x32 em tons de cinza"""
+    import ffmpeg
+    import numpy as np
+
+    output, _ = (
+        ffmpeg
+        .input(file_path, skip_frame='nokey')
+        .filter('scale', FRAME_SIZE, FRAME_SIZE, flags='area')
+        .filter('format', 'gray')
+        .output('pipe:', format='rawvideo', fps_mode='passthrough')
+        .run(capture_stdout=True, quiet=True)
+    )
+    frames = np.frombuffer(output, dtype=np.uint8)
+    frames = frames[:len(frames) - len(frames) % (FRAME_SIZE * FRAME_SIZE)]
+    return frames.reshape(-1, FRAME_SIZE, FRAME_SIZE)
+
+
+def compute_phash(file_path):
+    """Hash perceptual (64 bits, hex) do vídeo inteiro.
+
+    DCT 32x32 de até MAX_FRAMES keyframes em lote, média temporal dos 8x8
+    coeficientes de baixa frequência e limiar na mediana. Cópias recodificadas,
+    redimensionadas ou com pontas cortadas ficam a poucos bits do original.
+    """
+    import ffmpeg
+    import numpy as np
+
+    try:
+        frames = _keyframes_gray(file_path)
+    except (OSError, ffmpeg.Error) as e:
+        logger.warning('Não foi possível calcular o phash de %s: %s', file_path, e)
+        return None
+    if not len(frames):
+        return None
+
+    if len(frames) > MAX_FRAMES:
+        frames = frames[np.linspace(0, len(frames) - 1, MAX_FRAMES).astype(int)]
+
+    dct = _dct_matrix(FRAME_SIZE)[:8]
+    coefficients = (dct @ frames.astype(np.float32) @ dct.T).mean(axis=0).ravel()
+    bits = coefficients > np.median(coefficients)
+    return np.packbits(bits).tobytes().hex()
+
+
+@functools.lru_cache(maxsize=None)
+def _flip_masks(radius):
+    """Máscaras com até `radius` bits ligados num bloco (raio 2: 137 chaves por tabela)"""
+    return [
+        sum(1 << bit for bit in bits)
+        for r in range(radius + 1)
+        for bits in itertools.combinations(range(CHUNK_BITS), r)
+    ]
+
+
+class HammingIndex:
+    """Índice multi-index hashing para busca por distância de Hamming.
+
+    O hash é dividido em 4 blocos de 16 bits; se dois hashes estão a até r
+    bits, algum bloco difere em no máximo r // 4 bits (pigeonhole). A busca
+    enumera só essas vizinhanças nas tabelas de cada bloco e confirma os
+    candidatos com popcount vetorizado sobre um array NumPy dos hashes.
+    """
+
+    def __init__(self):
+        import numpy as np
+
+        self.tables = [{} for _ in range(CHUNKS)]
+        self.values = np.zeros(1024, dtype=np.uint64)
+        self.ids = []  # posição no array -> id do vídeo (None quando removido)
+        self.positions = {}
+        self.max_id = 0
+
+    @staticmethod
+    def _chunks(value):
+        mask = (1 << CHUNK_BITS) - 1
+        return [(value >> (i * CHUNK_BITS)) & mask for i in range(CHUNKS)]
+
+    def add(self, item_id, value):
+        import numpy as np
+
+        if item_id in self.positions:
+            self.remove(item_id)
+        position = len(self.ids)
+        if position == len(self.values):
+            self.values = np.concatenate([self.values, np.zeros(len(self.values), dtype=np.uint64)])
+        self.values[position] = value
+        self.ids.append(item_id)
+        self.positions[item_id] = position
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            table.setdefault(chunk, []).append(position)
+
+    def remove(self, item_id):
+        position = self.positions.pop(item_id, None)
+        if position is None:
+            return
+        self.ids[position] = None
+        for table, chunk in zip(self.tables, self._chunks(int(self.values[position]))):
+            bucket = table.get(chunk)
+            if bucket and position in bucket:
+                bucket.remove(position)
+                if not bucket:
+                    del table[chunk]
+
+    def search(self, value, max_distance):
+        """Retorna [(id, distância)] a até max_distance bits, do mais próximo ao mais distante"""
+        import numpy as np
+
+        masks = _flip_masks(max_distance // CHUNKS)
+        candidates = []
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            get = table.get
+            for mask in masks:
+                bucket = get(chunk ^ mask)
+                if bucket:
+                    candidates.extend(bucket)
+        if not candidates:
+            return []
+
+        positions = np.unique(np.array(candidates, dtype=np.int64))
+        distances = np.bitwise_count(self.values[positions] ^ np.uint64(value))
+        close = distances <= max_distance
+        order = np.argsort(distances[close], kind='stable')
+        return [
+            (self.ids[position], int(distance))
+            for position, distance in zip(positions[close][order].tolist(), distances[close][order].tolist())
+        ]
+
+    def __len__(self):
+        return len(self.positions)
+
+
+def _load_index(index):
+    """Carrega no índice os vídeos com id acima do último visto (inclui os de outros processos)"""
+    from src.models.user import db
+    from src.models.video import Video
+
+    rows = db.session.query(Video.id, Video.phash).filter(
+        Video.id > index.max_id, Video.phash.isnot(None)
+    ).all()
+    for video_id, value in rows:
+        index.add(video_id, int(value, 16))
+        index.max_id = max(index.max_id, video_id)
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = HammingIndex()
+        _load_index(_index)
+        return _index
+
+
+def find_duplicates(value, exclude_id=None):
+    """Vídeos existentes a até PHASH_MAX_DISTANCE bits do hash informado"""
+    from src.models.video import Video
+
+    if not value:
+        return []
+    max_distance = current_app.config.get('PHASH_MAX_DISTANCE', 10)
+    matches = [
+        (video_id, distance) for video_id, distance in get_index().search(int(value, 16), max_distance)
+        if video_id != exclude_id
+    ]
+    if not matches:
+        return []
+
+    # Confirma no banco: o vídeo pode ter sido removido por outro processo
+    videos = {video.id: video for video in Video.query.filter(Video.id.in_([m[0] for m in matches]))}
+    duplicates = []
+    for video_id, distance in matches:
+        video = videos.get(video_id)
+        if video is None:
+            forget(video_id)
+            continue
+        duplicates.append({
+            'video_id': video.id,
+            'original_filename': video.original_filename,
+            'distance': distance,
+            'similarity': round(1 - distance / HASH_BITS, 3),
+        })
+    return duplicates
+
+
+def remember(video_id, value):
+    if value:
+        with _index_lock:
+            if _index is not None:
+                _index.add(video_id, int(value, 16))
+
+
+def forget(video_id):
+    with _index_lock:
+        if _index is not None:
+            _index.remove(video_id)
+
+
+def register_cli(app):
+    """Registra o comando `flask phash-backfill`"""
+    import click
+
+    @app.cli.command('phash-backfill')
+    def phash_backfill():
+        """Calcula o phash dos vídeos antigos que ainda têm o original"""
+        from src.models.schema import ensure_schema
+        from src.models.user import db
+        from src.models.video import Video
+        from src.services import media
+
+        ensure_schema()
+        done = 0
+        for video in Video.query.filter(Video.phash.is_(None), Video.original_purged_at.is_(None)):
+            if media.exists(video.file_path):
+                with media.local(video.file_path) as path:
+                    video.phash = compute_phash(path)
+                done += video.phash is not None
+        db.session.commit()
+        click.echo(f'{done} vídeos com phash calculado')
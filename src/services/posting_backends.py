@@ -0,0 +1,176 @@
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+# Classes de erro: as transitórias voltam para a fila com backoff, as demais falham o job
+TRANSIENT_ERRORS = {'network', 'timeout', 'throttled', 'internal'}
+
+ERROR_MESSAGES = {
+    'network': 'Erro de rede durante upload',
+    'timeout': 'Tempo esgotado aguardando a plataforma',
+    'throttled': 'Conta temporariamente limitada',
+    'rejected_format': 'Formato de vídeo não aceito',
+    'internal': 'Erro interno do TikTok',
+    'auth': 'Credenciais inválidas ou conta bloqueada',
+}
+
+
+def _result(outcome, error_class=None, message=None, retry_after=None, post_url=None, latency_ms=None):
+    return {
+        'outcome': outcome,  # completed, failed
+        'error_class': error_class,
+        'error_message': message or ERROR_MESSAGES.get(error_class),
+        'retry_after': retry_after,
+        'post_url': post_url,
+        'latency_ms': latency_ms,
+    }
+
+
+class PostingBackend:
+    """Interface dos backends de postagem; todas as chamadas são assíncronas"""
+
+    async def post_video(self, payload):
+        raise NotImplementedError
+
+    async def check_account(self, payload):
+        raise NotImplementedError
+
+
+class SimulatedBackend(PostingBackend):
+    """Simulação em processo (comportamento antigo: ~75% de sucesso), sem bloquear o worker.
+
+    O resultado é derivado de (seed, job, tentativa), então a mesma execução
+    se repete igual independentemente da ordem em que os jobs terminam.
+    """
+
+    def __init__(self, latency=2.0, success_rate=0.75, seed=None):
+        self.latency = latency
+        self.success_rate = success_rate
+        self.seed = seed
+
+    def _rng(self, *key):
+        return random.Random(f'{self.seed}:{key}') if self.seed is not None else random.Random()
+
+    async def post_video(self, payload):
+        rng = self._rng('post', payload['job_id'], payload.get('attempt', 0))
+        await asyncio.sleep(self.latency)
+        if rng.random() < self.success_rate:
+            return _result('completed', latency_ms=self.latency * 1000)
+        error_class = rng.choice(['network', 'throttled', 'rejected_format', 'internal'])
+        return _result('failed', error_class, latency_ms=self.latency * 1000)
+
+    async def check_account(self, payload):
+        rng = self._rng('check', payload['account_id'], payload.get('checked_at'))
+        await asyncio.sleep(self.latency)
+        if rng.random() < self.success_rate:
+            return _result('completed', latency_ms=self.latency * 1000)
+        return _result('failed', 'auth', latency_ms=self.latency * 1000)
+
+
+class HttpBackend(PostingBackend):
+    """Cliente HTTP/1.1 assíncrono mínimo para um serviço de postagem (ou o stub local)"""
+
+    def __init__(self, base_url, timeout=30.0):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = parts.scheme == 'https'
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+
+    async def _request(self, path, payload):
+        body = json.dumps(payload).encode()
+        idempotency = f"Idempotency-Key: {payload['idempotency_key']}\r\n" if payload.get('idempotency_key') else ''
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        try:
+            writer.write(
+                f'POST {self.prefix}{path} HTTP/1.1\r\n'
+                f'Host: {self.host}:{self.port}\r\n'
+                'Content-Type: application/json\r\n'
+                f'{idempotency}'
+                f'Content-Length: {len(body)}\r\n'
+                'Connection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+
+            # Resposta vazia, conexão fechada ou corpo que não é objeto viram ValueError (erro de rede em _call)
+            status_line = await reader.readline()
+            parts = status_line.split()
+            if len(parts) < 2:
+                raise ValueError('Resposta vazia do serviço de postagem')
+            status = int(parts[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode().partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0))
+            data = await reader.readexactly(length) if length else await reader.read()
+            data = json.loads(data or b'{}')
+            if not isinstance(data, dict):
+                raise ValueError(f'Resposta do serviço de postagem não é um objeto JSON: {type(data).__name__}')
+            return status, headers, data
+        finally:
+            writer.close()
+
+    async def _call(self, path, payload):
+        started = time.perf_counter()
+        try:
+            status, headers, data = await asyncio.wait_for(self._request(path, payload), self.timeout)
+        except asyncio.TimeoutError:
+            return _result('failed', 'timeout', latency_ms=(time.perf_counter() - started) * 1000)
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            return _result('failed', 'network', f'Erro de rede: {e}', latency_ms=(time.perf_counter() - started) * 1000)
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        if status == 200:
+            return _result('completed', post_url=data.get('post_url'), latency_ms=latency_ms)
+        if status == 429:
+            retry_after = float(headers.get('retry-after', 60))
+            return _result('failed', 'throttled', retry_after=retry_after, latency_ms=latency_ms)
+        error_class = data.get('error_class') or ('internal' if status >= 500 else 'rejected_format')
+        return _result('failed', error_class, data.get('message'), latency_ms=latency_ms)
+
+    async def post_video(self, payload):
+        return await self._call('/v1/posts', payload)
+
+    async def check_account(self, payload):
+        return await self._call('/v1/accounts/check', payload)
+
+
+def get_backend(config):
+    """Instancia o backend configurado em POSTING_BACKEND"""
+    name = config.get('POSTING_BACKEND', 'simulated')
+    if name == 'http':
+        return HttpBackend(config['POSTING_BACKEND_URL'], timeout=config.get('POSTING_TIMEOUT', 30.0))
+    if name == 'simulated':
+        return SimulatedBackend(
+            latency=config.get('POSTING_SIMULATED_LATENCY', 2.0),
+            seed=config.get('POSTING_SEED')
+        )
+    raise ValueError(f'Backend de postagem desconhecido: {name}')
+
+
+async def run_bounded(coroutine_factory, items, limit):
+    """Executa coroutine_factory(item) para todos os itens com no máximo `limit` em voo.
+
+    Uma exceção de um item vira o resultado de falha (transitória) só dele; o
+    resto do lote segue e cada job recebe seu próprio desfecho.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(item):
+        started = time.perf_counter()
+        async with semaphore:
+            try:
+                return await coroutine_factory(item)
+            except Exception as e:
+                return _result('failed', 'network', f'Erro no backend de postagem: {e}',
+                               latency_ms=(time.perf_counter() - started) * 1000)
+
+    return await asyncio.gather(*(run(item) for item in items))
@@ -0,0 +1,175 @@
+"""Serviço local que imita a plataforma de postagem, para testes de carga do dispatcher.
+
+Latência, classes de erro e throttling são configuráveis e determinísticos
+para uma mesma seed (o sorteio depende de seed + job + tentativa). Uso:
+
+    python -m src.services.posting_stub --port 8089 --seed 42 \\
+        --latency lognormal:800,0.5 --errors network=0.02,internal=0.03,rejected_format=0.01 \\
+        --throttle-rate 0.05 --account-limit 10/3600
+
+e no app: POSTING_BACKEND=http POSTING_BACKEND_URL=http://127.0.0.1:8089
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict, deque
+
+STATUS_BY_ERROR = {
+    'network': 502,
+    'internal': 500,
+    'rejected_format': 422,
+    'auth': 401,
+}
+
+
+def parse_latency(spec):
+    """fixed:ms | uniform:min_ms,max_ms | lognormal:median_ms,sigma | exp:mean_ms"""
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',')] if args else []
+
+    def sample(rng):
+        if kind == 'fixed':
+            return values[0] / 1000
+        if kind == 'uniform':
+            return rng.uniform(values[0], values[1]) / 1000
+        if kind == 'lognormal':
+            import math
+            return rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+        if kind == 'exp':
+            return rng.expovariate(1000 / values[0])
+        raise ValueError(f'Distribuição de latência desconhecida: {spec}')
+
+    sample(random.Random(0))  # valida a especificação na inicialização
+    return sample
+
+
+def parse_errors(spec):
+    errors = []
+    for item in filter(None, (spec or '').split(',')):
+        name, _, rate = item.partition('=')
+        errors.append((name.strip(), float(rate)))
+    return errors
+
+
+class PostingStub:
+    def __init__(self, args):
+        self.seed = args.seed
+        self.latency = parse_latency(args.latency)
+        self.errors = parse_errors(args.errors)
+        self.throttle_rate = args.throttle_rate
+        self.retry_after = args.retry_after
+        self.check_failure_rate = args.check_failure_rate
+        limit, _, window = (args.account_limit or '').partition('/')
+        self.account_limit = int(limit) if limit else None
+        self.account_window = float(window or 3600)
+        self.account_posts = defaultdict(deque)
+        self.stats = defaultdict(int)
+        # Postagens concluídas por idempotency_key: a repetição recebe o mesmo post, sem postar de novo
+        self.posted = {}
+
+    def _rng(self, *key):
+        return random.Random(f'{self.seed}:{key}')
+
+    def _throttled_by_account(self, account_id):
+        if not self.account_limit:
+            return False
+        now = time.monotonic()
+        posts = self.account_posts[account_id]
+        while posts and now - posts[0] > self.account_window:
+            posts.popleft()
+        if len(posts) >= self.account_limit:
+            return True
+        posts.append(now)
+        return False
+
+    async def post(self, payload):
+        key = payload.get('idempotency_key')
+        if key in self.posted:
+            self.stats['duplicates'] += 1
+            return 200, {}, self.posted[key]
+
+        rng = self._rng('post', payload.get('job_id'), payload.get('attempt', 0))
+        await asyncio.sleep(self.latency(rng))
+
+        if rng.random() < self.throttle_rate or self._throttled_by_account(payload.get('account_id')):
+            return 429, {'Retry-After': str(self.retry_after)}, {'error_class': 'throttled'}
+
+        roll = rng.random()
+        for error_class, rate in self.errors:
+            if roll < rate:
+                return STATUS_BY_ERROR.get(error_class, 500), {}, {'error_class': error_class}
+            roll -= rate
+
+        body = {'post_url': f"https://www.tiktok.com/@{payload.get('username', 'stub')}/video/{rng.getrandbits(62)}"}
+        if key:
+            self.posted[key] = body
+        return 200, {}, body
+
+    async def check(self, payload):
+        rng = self._rng('check', payload.get('account_id'), payload.get('checked_at'))
+        await asyncio.sleep(self.latency(rng))
+        if rng.random() < self.check_failure_rate:
+            return 401, {}, {'error_class': 'auth'}
+        return 200, {}, {'status': 'active'}
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, path, _ = request_line.decode().split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode().partition(':')
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            payload = json.loads(await reader.readexactly(length)) if length else {}
+
+            if method == 'POST' and path == '/v1/posts':
+                status, extra_headers, body = await self.post(payload)
+            elif method == 'POST' and path == '/v1/accounts/check':
+                status, extra_headers, body = await self.check(payload)
+            elif method == 'GET' and path == '/stats':
+                status, extra_headers, body = 200, {}, dict(self.stats)
+            else:
+                status, extra_headers, body = 404, {}, {'error_class': 'not_found'}
+
+            self.stats[f'{path}:{status}'] += 1
+            data = json.dumps(body).encode()
+            head = [f'HTTP/1.1 {status} X', 'Content-Type: application/json', f'Content-Length: {len(data)}', 'Connection: close']
+            head.extend(f'{name}: {value}' for name, value in extra_headers.items())
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + data)
+            await writer.drain()
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    stub = PostingStub(args)
+    server = await asyncio.start_server(stub.handle, args.host, args.port, backlog=4096)
+    print(f'Stub de postagem em http://{args.host}:{args.port} (seed={args.seed})')
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency', default='lognormal:800,0.5')
+    parser.add_argument('--errors', default='network=0.02,internal=0.03,rejected_format=0.01')
+    parser.add_argument('--throttle-rate', type=float, default=0.05)
+    parser.add_argument('--retry-after', type=float, default=30)
+    parser.add_argument('--account-limit', help='Limite de posts por conta, ex.: 10/3600')
+    parser.add_argument('--check-failure-rate', type=float, default=0.1)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from src.services import governor, leases, lifecycle, media, overlays, storage
+from src.services.encoding import encode_variant, variant_filter
+from src.services.tracing import record_span, span
+
+logger = logging.getLogger(__name__)
+
+# Prioridade usada na escolha da variante de um job
+VARIANT_PRIORITY = ('vertical', 'square', 'horizontal')
+
+_wake_event = threading.Event()
+_worker_thread = None
+# Um lock por proxy: previews simultâneos da mesma variante geram o arquivo uma vez só
+_proxy_locks = {}
+_proxy_locks_lock = threading.Lock()
+
+
+def init_render_queue(app):
+    """Inicia o worker que renderiza as variantes sob demanda"""
+    if app.config.get('JIT_RENDERING_ENABLED', True) and app.config.get('RENDER_WORKER_ENABLED', True):
+        _start_worker(app)
+
+
+def jit_enabled():
+    return current_app.config.get('JIT_RENDERING_ENABLED', True)
+
+
+def select_variant(video):
+    """Escolhe a variante de postagem (vertical > square > horizontal) e o caminho do arquivo.
+
+    Prefere uma variante já renderizada; no modo sob demanda, cai para a
+    primeira variante habilitada, que será renderizada antes do post.
+    """
+    processed_files = json.loads(video.processed_files or '{}')
+    for variant in VARIANT_PRIORITY:
+        if variant in processed_files:
+            return variant, processed_files[variant]
+
+    if jit_enabled():
+        enabled = {
+            'vertical': video.cut_vertical,
+            'square': video.cut_square,
+            'horizontal': video.cut_horizontal,
+        }
+        for variant in VARIANT_PRIORITY:
+            if enabled[variant]:
+                return variant, media.ref_for(storage.processed_path(video.id, video.original_filename, variant))
+
+    return None, None
+
+
+def request_render(video, variant, scheduled_time):
+    """Enfileira (ou antecipa) a renderização de uma variante usada por um job.
+
+    A deadline é o horário agendado do job menos RENDER_LEAD_MINUTES. Não faz
+    commit: a renderização entra na mesma transação dos jobs que a exigem, e o
+    chamador avisa o worker com wake_render_worker() depois do commit.
+    """
+    from src.models.user import db
+    from src.models.video import VariantRender
+
+    lead = timedelta(minutes=current_app.config.get('RENDER_LEAD_MINUTES', 10))
+    deadline = (scheduled_time or datetime.utcnow()) - lead
+
+    render = VariantRender.query.filter_by(video_id=video.id, variant=variant).first()
+    if render is None:
+        render = VariantRender(
+            video_id=video.id,
+            variant=variant,
+            output_path=media.ref_for(storage.processed_path(video.id, video.original_filename, variant)),
+            deadline=deadline
+        )
+        db.session.add(render)
+    elif render.status == 'completed' and media.exists(render.output_path):
+        return render
+    elif render.status in ('completed', 'failed'):
+        # Arquivo removido pela retenção ou falha anterior: renderiza de novo
+        render.update_status('pending')
+        render.deadline = deadline
+    elif render.deadline is None or deadline < render.deadline:
+        render.deadline = deadline
+
+    return render
+
+
+def wake_render_worker():
+    _wake_event.set()
+
+
+def _claim_next_render():
+    from src.models.user import db
+    from src.models.video import VariantRender
+
+    # No drain, as renderizações pendentes ficam para o próximo boot (next_due acorda a máquina na deadline)
+    if governor.draining():
+        return None
+
+    render = VariantRender.query.filter_by(status='pending').order_by(
+        VariantRender.deadline.asc()
+    ).first()
+    if render is None:
+        return None
+
+    # UPDATE condicional: outro worker pode ter pego a mesma renderização
+    claimed = leases.claim(VariantRender, render.id, ('pending',), 'rendering', started_at=datetime.utcnow())
+    return VariantRender.query.get(render.id) if claimed else None
+
+
+def render_variant(render):
+    """Executa uma renderização da fila e atualiza vídeo e jobs"""
+    from src.models.user import db
+    from src.models.video import PostingJob, Video
+    from src.routes.videos import get_video_info
+
+    video = Video.query.get(render.video_id)
+    record_span('render_wait', video.trace_id, render.created_at, render.started_at, variant=render.variant)
+
+    try:
+        with media.local(video.file_path) as input_path:
+            video_info = get_video_info(input_path)
+            if not video_info:
+                raise RuntimeError('Não foi possível ler o vídeo original')
+
+            video_filter = variant_filter(render.variant, video_info['width'], video_info['height'])
+            trim = video.trim_range()
+            with governor.encode_slot(input_path, video_info, video_filter, governor.queue_wait(), trim), \
+                    span('encode', video.trace_id, variant=render.variant, mode='jit'):
+                encode_variant(
+                    input_path, media.output_path(render.output_path), video_filter, video_info['duration'],
+                    video.trace_id, trim, overlays.video_overlay(video)
+                )
+        media.publish(media.cache_path(render.output_path))
+
+        # Se os heartbeats falharam, o reaper pode ter devolvido a renderização à fila
+        db.session.refresh(render)
+        if not leases.owns(render):
+            return False
+
+        processed_files = json.loads(video.processed_files or '{}')
+        processed_files[render.variant] = render.output_path
+        video.processed_files = json.dumps(processed_files)
+        video.updated_at = datetime.utcnow()
+        render.update_status('completed')
+        db.session.commit()
+        return True
+
+    except governor.OverBudget as e:
+        # Esperou a fila inteira sem vaga: volta para pending e será pega de novo
+        db.session.rollback()
+        logger.info('Renderização %s do vídeo %s adiada: %s', render.variant, render.video_id, e)
+        render.update_status('pending')
+        leases.release(render)
+        db.session.commit()
+        return False
+
+    except Exception as e:
+        db.session.rollback()
+        logger.warning('Erro ao renderizar variante %s do vídeo %s: %s', render.variant, render.video_id, e)
+        render.update_status('failed', str(e))
+
+        # Jobs que dependiam da variante não têm o que postar
+        for job in PostingJob.query.filter_by(
+            video_id=render.video_id, video_variant=render.variant, status='pending'
+        ):
+            job.update_status('failed', 'Falha ao renderizar a variante do vídeo', 'render')
+        db.session.commit()
+        return False
+
+
+def _worker_loop(app):
+    while True:
+        try:
+            with app.app_context():
+                from src.models.schema import ensure_schema
+                from src.models.video import VariantRender
+                ensure_schema()
+                render = _claim_next_render()
+                if render is not None:
+                    with lifecycle.busy(), leases.heartbeat(VariantRender, [render.id]):
+                        render_variant(render)
+                    continue
+        except Exception as e:
+            logger.warning('Erro no worker de renderização: %s', e)
+
+        _wake_event.wait(60)
+        _wake_event.clear()
+
+
+def _start_worker(app):
+    global _worker_thread
+    if _worker_thread is None or not _worker_thread.is_alive():
+        _worker_thread = threading.Thread(target=_worker_loop, args=(app,), name='render-worker', daemon=True)
+        _worker_thread.start()
+
+
+def render_proxy(video, variant):
+    """Gera (ou reaproveita) um preview leve da variante enquanto ela não é renderizada"""
+    proxy_path = os.path.join(storage.processed_dir(video.id), f'{variant}_proxy.mp4')
+    if os.path.exists(proxy_path):
+        return proxy_path
+
+    with _proxy_locks_lock:
+        lock = _proxy_locks.setdefault(proxy_path, threading.Lock())
+    with lock:
+        if os.path.exists(proxy_path):
+            return proxy_path
+        # Encode num temporário: o nome final só existe completo (falha ou kill não deixam proxy pela metade)
+        tmp = f'{proxy_path[:-len(".mp4")]}.{uuid.uuid4().hex[:8]}.tmp.mp4'
+        try:
+            if not _render_proxy_file(video, variant, tmp):
+                return None
+            os.replace(tmp, proxy_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return proxy_path
+
+
+def _render_proxy_file(video, variant, output_path):
+    import ffmpeg
+    from src.routes.videos import get_video_info
+
+    # O proxy é só desta máquina: não vai para o bucket
+    with media.local(video.file_path) as input_path:
+        video_info = get_video_info(input_path)
+        if not video_info:
+            return False
+
+        filter_name, filter_args = variant_filter(variant, video_info['width'], video_info['height'])
+        seconds = current_app.config.get('PREVIEW_PROXY_SECONDS', 15)
+        # O preview começa onde a variante vai começar
+        start = video.trim_start or 0
+        source = ffmpeg.input(input_path, ss=start, t=seconds)
+        # Preview não espera vaga: sem recursos, a requisição recebe 503 com Retry-After
+        proxy_filter = ('scale', (max(2, filter_args[0] * 360 // filter_args[1]), 360))
+        # Overlays aplicados já em 360p (a marca d'água renderizada nessa largura também fica em cache)
+        preview = overlays.apply(
+            source.video.filter(filter_name, *filter_args).filter('scale', -2, 360),
+            overlays.video_overlay(video), *proxy_filter[1], start
+        )
+        with governor.encode_slot(input_path, dict(video_info, duration=seconds), proxy_filter):
+            (
+                ffmpeg
+                .output(
+                    preview, source['a?'], output_path,
+                    vcodec='libx264', preset='ultrafast', crf=32, acodec='aac', audio_bitrate='64k'
+                )
+                .overwrite_output()
+                .run(quiet=True)
+            )
+    return True
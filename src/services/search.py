@@ -0,0 +1,146 @@
+import base64
+import binascii
+import json
+import re
+
+from sqlalchemy import Integer, column, text
+
+from src.models.video_search import FTS_TABLE
+
+# Pesos do bm25 na ordem das colunas do índice: nome do arquivo, legenda, hashtags
+BM25_WEIGHTS = (2.0, 1.0, 3.0)
+MAX_TERMS = 16
+MAX_LIMIT = 100
+# Acima disso o bm25 (calculado para cada resultado) passa de dezenas de ms;
+# buscas tão amplas voltam por ordem de criação, que nem precisa ordenar
+RANK_MAX_MATCHES = 5000
+
+# Mesmo critério do tokenizer unicode61: letras e números formam tokens, o resto separa
+TOKEN = re.compile(r'[^\W_]+')
+
+# Engines onde o índice existe (url -> bool); checado uma vez por processo
+_available = {}
+
+
+class SearchError(ValueError):
+    """Busca inválida (termo vazio, cursor corrompido)"""
+
+
+class SearchUnavailable(RuntimeError):
+    """Banco sem o índice FTS5 (outro dialeto ou SQLite sem o módulo)"""
+
+
+def match_query(q):
+    """Converte a busca do usuário numa expressão MATCH do FTS5.
+
+    Palavras viram prefixo em todas as colunas ("danc" acha "dança.mp4");
+    termos com '#' buscam a hashtag exata na legenda e nas hashtags.
+    Os termos são combinados com AND. Aspas e operadores do FTS5 são descartados.
+    """
+    terms = []
+    for raw in (q or '').split()[:MAX_TERMS]:
+        tokens = TOKEN.findall(raw)
+        if not tokens:
+            continue
+        phrase = '"' + ' '.join(tokens) + '"'
+        if raw.startswith('#'):
+            terms.append('{caption hashtags} : ' + phrase)
+        else:
+            terms.append(phrase + ' *')
+    if not terms:
+        raise SearchError('Informe ao menos uma palavra ou hashtag para buscar')
+    return ' AND '.join(terms)
+
+
+def hashtag_query(tag):
+    """Expressão MATCH para uma única hashtag (com ou sem '#')"""
+    return match_query('#' + (tag or '').lstrip('#'))
+
+
+def is_available(session):
+    bind = session.get_bind()
+    key = str(bind.url)
+    if key not in _available:
+        if bind.dialect.name != 'sqlite':
+            _available[key] = False
+        else:
+            with bind.connect() as conn:
+                _available[key] = conn.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+                ).first() is not None
+    return _available[key]
+
+
+def _require_index(session):
+    if not is_available(session):
+        raise SearchUnavailable('Busca textual disponível apenas com SQLite + FTS5')
+
+
+def encode_cursor(score, video_id):
+    return base64.urlsafe_b64encode(json.dumps([score, video_id]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, video_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (None if score is None else float(score)), int(video_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise SearchError('Cursor inválido')
+
+
+def _too_broad(session, query):
+    """Conta os resultados só até o limite: o LIMIT interno para a varredura cedo"""
+    return session.execute(text(
+        f"SELECT count(*) FROM (SELECT 1 FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query LIMIT :cap)"
+    ), {'query': query, 'cap': RANK_MAX_MATCHES + 1}).scalar() > RANK_MAX_MATCHES
+
+
+def search_videos(session, q, limit=20, cursor=None):
+    """Ids dos vídeos que casam com a busca, do mais relevante ao menos.
+
+    Paginação por cursor (score, id): cada página continua depois do último
+    resultado da anterior, sem OFFSET. Buscas com mais de RANK_MAX_MATCHES
+    resultados vêm dos mais novos aos mais antigos, com score None.
+    Devolve ([(video_id, score), ...], next_cursor).
+    """
+    _require_index(session)
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    query = match_query(q)
+    if cursor:
+        after_score, after_id = decode_cursor(cursor)
+        ranked = after_score is not None
+    else:
+        after_score, after_id = None, None
+        ranked = not _too_broad(session, query)
+
+    if ranked:
+        weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+        # bm25 é negativo: quanto menor, mais relevante
+        rows = session.execute(text(
+            f"SELECT rowid, score FROM ("
+            f"SELECT rowid, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query"
+            f") WHERE :after_score IS NULL OR score > :after_score OR (score = :after_score AND rowid > :after_id) "
+            f"ORDER BY score, rowid LIMIT :limit"
+        ), {'query': query, 'after_score': after_score, 'after_id': after_id, 'limit': limit + 1}).all()
+    else:
+        # O FTS5 percorre a lista de documentos já em ordem de rowid (sem OR: o rowid < vira busca direta)
+        after = 'AND rowid < :after_id ' if after_id is not None else ''
+        rows = session.execute(text(
+            f"SELECT rowid, NULL AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query "
+            f"{after}ORDER BY rowid DESC LIMIT :limit"
+        ), {'query': query, 'after_id': after_id, 'limit': limit + 1}).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].score, rows[-1].rowid)
+    return [(row.rowid, row.score) for row in rows], next_cursor
+
+
+def matching_video_ids(session, query):
+    """Subquery com os ids dos vídeos que casam com a expressão MATCH (para filtrar com IN)"""
+    _require_index(session)
+    return text(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query"
+    ).bindparams(query=query).columns(column('rowid', Integer))
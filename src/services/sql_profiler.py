@@ -0,0 +1,125 @@
+import logging
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-SQL-Profile'
+PROFILE_QUERY_PARAM = '_profile'
+
+
+def _profiling_requested():
+    """Verifica se a requisição atual pediu profiling (header ou query string)"""
+    if current_app.config.get('SQL_PROFILER_ALWAYS_ON'):
+        return True
+
+    value = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_PARAM)
+    if not value:
+        return False
+
+    # Fora dos testes o profiling exige o token, para não ficar aberto a qualquer cliente
+    token = current_app.config.get('SQL_PROFILER_TOKEN')
+    if token:
+        return value == token
+    return current_app.testing and value.lower() in ('1', 'true', 'yes')
+
+
+def _explain(conn, statement, parameters):
+    """Retorna o plano de execução de uma query lenta (somente SELECT)"""
+    if not statement.lstrip().upper().startswith('SELECT'):
+        return None
+
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    try:
+        # Cursor DBAPI direto para não disparar os próprios eventos do profiler
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [' '.join(str(col) for col in row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except Exception as e:
+        return [f'EXPLAIN indisponível: {e}']
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or g.get('sql_profile') is None:
+        return
+    conn.info.setdefault('sql_profiler_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    profile = g.get('sql_profile')
+    starts = conn.info.get('sql_profiler_start')
+    if profile is None or not starts:
+        return
+
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    profile['count'] += 1
+    profile['total_ms'] += elapsed_ms
+
+    threshold_ms = current_app.config.get('SQL_SLOW_QUERY_MS', 100)
+    if elapsed_ms >= threshold_ms:
+        plan = None if executemany else _explain(conn, statement, parameters)
+        profile['slow'].append({'statement': statement, 'duration_ms': elapsed_ms})
+        logger.warning(
+            'Query lenta (%.1f ms) em %s %s: %s | params=%r | plano=%s',
+            elapsed_ms, request.method, request.path, statement, parameters, plan
+        )
+
+
+def _handle_error(exception_context):
+    # Statement com erro não chega ao after_cursor_execute; descarta o início pendente
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('sql_profiler_start'):
+        conn.info['sql_profiler_start'].pop()
+
+
+def _start_request_profile():
+    g.sql_profile = None
+    if _profiling_requested():
+        g.sql_profile = {'count': 0, 'total_ms': 0.0, 'slow': [], 'started': time.perf_counter()}
+
+
+def _finish_request_profile(response):
+    profile = g.get('sql_profile')
+    if profile is None:
+        return response
+
+    request_ms = (time.perf_counter() - profile['started']) * 1000
+    logger.info(
+        'SQL profile %s %s: %d queries, %.1f ms em SQL, %.1f ms total, %d lentas',
+        request.method, request.path, profile['count'], profile['total_ms'],
+        request_ms, len(profile['slow'])
+    )
+
+    response.headers['X-SQL-Query-Count'] = str(profile['count'])
+    if current_app.config.get('SQL_PROFILER_SERVER_TIMING', True):
+        timing = [
+            f'db;dur={profile["total_ms"]:.2f};desc="{profile["count"]} queries"',
+            f'app;dur={request_ms - profile["total_ms"]:.2f}',
+        ]
+        if profile['slow']:
+            timing.append(f'db-slow;dur={max(q["duration_ms"] for q in profile["slow"]):.2f}')
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = ', '.join(([existing] if existing else []) + timing)
+
+    return response
+
+
+def init_sql_profiler(app, db):
+    """Registra os hooks de profiling de SQL no engine e nas requisições do app"""
+    with app.app_context():
+        engine = db.engine
+
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_request_profile)
+    app.after_request(_finish_request_profile)
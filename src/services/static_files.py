@@ -0,0 +1,196 @@
+import gzip
+import mimetypes
+import os
+import re
+from collections import namedtuple
+
+from flask import current_app, request, send_file
+
+# Bundles do Vite: assets/index-BYlR_qZD.js (o nome muda quando o conteúdo muda)
+HASHED_ASSET = re.compile(r'^assets/.+[.-][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+COMPRESSIBLE_EXTENSIONS = ('.html', '.js', '.mjs', '.css', '.json', '.svg', '.txt', '.map', '.webmanifest')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+Entry = namedtuple('Entry', 'path mimetype size mtime etag cache_control compressible siblings data')
+
+_settings = {}
+# Trocados inteiros (nunca esvaziados no lugar): uma requisição concorrente vê o manifesto antigo ou o novo
+_manifest = {}
+# Versões comprimidas em memória dos arquivos sem irmão .br/.gz: (caminho, encoding) -> bytes
+_encoded = {}
+
+
+def init_static_files(app):
+    """Varre a pasta estática uma vez e monta o manifesto servido pela rota catch-all"""
+    _settings['folder'] = app.static_folder
+    _settings['memory_max_bytes'] = app.config.get('STATIC_MEMORY_MAX_BYTES', 1024 * 1024)
+    _settings['auto_reload'] = app.config.get('STATIC_AUTO_RELOAD', False)
+    build_manifest()
+
+
+def _entry(folder, relative, memory_max_bytes, encoded):
+    full_path = os.path.join(folder, relative)
+    stat = os.stat(full_path)
+    compressible = relative.endswith(COMPRESSIBLE_EXTENSIONS)
+
+    # Irmãos .br/.gz gerados no build (flask precompress-static), se não estiverem velhos
+    siblings = {}
+    if compressible:
+        for encoding, suffix in ENCODINGS:
+            try:
+                sibling = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            if sibling.st_mtime >= stat.st_mtime:
+                siblings[encoding] = full_path + suffix
+
+    data = None
+    if stat.st_size <= memory_max_bytes:
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        for encoding, sibling_path in siblings.items():
+            with open(sibling_path, 'rb') as f:
+                encoded[(full_path, encoding)] = f.read()
+
+    return Entry(
+        path=full_path,
+        mimetype=mimetypes.guess_type(relative)[0] or 'application/octet-stream',
+        size=stat.st_size,
+        mtime=int(stat.st_mtime),
+        etag=f'{stat.st_mtime_ns:x}-{stat.st_size:x}',
+        cache_control=IMMUTABLE if HASHED_ASSET.match(relative) else REVALIDATE,
+        compressible=compressible,
+        siblings=siblings,
+        data=data,
+    )
+
+
+def build_manifest():
+    """(Re)constrói o manifesto: caminho relativo -> Entry, com os arquivos pequenos em memória"""
+    global _manifest, _encoded
+    folder = _settings.get('folder')
+    manifest = {}
+    encoded = {}
+    if folder and os.path.isdir(folder):
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if name.endswith(('.br', '.gz')):
+                    continue
+                relative = os.path.relpath(os.path.join(root, name), folder).replace(os.sep, '/')
+                manifest[relative] = _entry(folder, relative, _settings['memory_max_bytes'], encoded)
+    _manifest, _encoded = manifest, encoded
+    return manifest
+
+
+def _choose_encoding(entry):
+    if not entry.compressible:
+        return None
+    accept = request.accept_encodings
+    for encoding, _ in ENCODINGS:
+        if not accept[encoding]:
+            continue
+        if encoding in entry.siblings:
+            return encoding
+        # Sem irmão pré-comprimido: só comprime (uma vez) o que está em memória
+        if entry.data is not None and (encoding != 'br' or _brotli() is not None):
+            return encoding
+    return None
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _encoded_body(entry, encoding):
+    key = (entry.path, encoding)
+    body = _encoded.get(key)
+    if body is None:
+        # Qualidade 9: ~50 ms uma vez por arquivo; a 11 (usada no build) leva ~1 s
+        if encoding == 'br':
+            body = _brotli().compress(entry.data, quality=9)
+        else:
+            body = gzip.compress(entry.data, compresslevel=9, mtime=0)
+        _encoded[key] = body
+    return body
+
+
+def _respond(entry):
+    encoding = _choose_encoding(entry)
+
+    if entry.data is not None:
+        body = _encoded_body(entry, encoding) if encoding else entry.data
+        response = current_app.response_class(body, mimetype=entry.mimetype)
+    else:
+        response = send_file(
+            entry.siblings.get(encoding, entry.path), mimetype=entry.mimetype,
+            conditional=False, etag=False, max_age=None
+        )
+
+    # ETag forte por representação: a versão br e a gzip são corpos diferentes
+    response.set_etag(f'{entry.etag}-{encoding}' if encoding else entry.etag)
+    response.last_modified = entry.mtime
+    response.headers['Cache-Control'] = entry.cache_control
+    if entry.compressible:
+        response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response.make_conditional(request)
+
+
+def serve_static(path):
+    """Arquivo do frontend pelo manifesto; rotas do SPA recebem o index.html da memória"""
+    if _settings.get('folder') is None:
+        return "Static folder not configured", 404
+    if _settings.get('auto_reload'):
+        # STATIC_AUTO_RELOAD (desenvolvimento do frontend): o build pode mudar a qualquer momento
+        build_manifest()
+
+    entry = _manifest.get(path) if path else None
+    if entry is None:
+        entry = _manifest.get('index.html')
+        if entry is None:
+            return "index.html not found", 404
+    return _respond(entry)
+
+
+def precompress(folder, min_size=256):
+    """Gera os irmãos .br/.gz dos arquivos de texto da pasta (passo de build)"""
+    brotli = _brotli()
+    written = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) < min_size:
+                continue
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            written += 1
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(data, quality=11))
+                written += 1
+    return written
+
+
+def register_cli(app):
+    """Registra o comando `flask precompress-static`"""
+    import click
+
+    @app.cli.command('precompress-static')
+    def precompress_static():
+        """Gera .br/.gz ao lado dos arquivos do frontend (rodar após copiar o build)"""
+        written = precompress(app.static_folder)
+        if _brotli() is None:
+            click.echo('Pacote Brotli não instalado: apenas .gz gerados')
+        click.echo(f'{written} arquivos comprimidos gerados')
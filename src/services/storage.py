@@ -0,0 +1,363 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_JOB_STATUSES = ('pending', 'processing', 'retrying')
+
+_settings = {
+    'media_root': os.path.join(os.path.dirname(__file__), '..', 'uploads'),
+    'delete_originals': False,
+    'variant_retention_hours': 24,
+    'quota_mb': 0,
+    'orphan_grace_minutes': 60,
+    'cache_retention_hours': 168,
+    'temp_retention_hours': 24,
+    'sweep_interval': 600,
+}
+_deletion_queue = []
+_deletion_lock = threading.Lock()
+_sweep_lock = threading.Lock()
+_wake_event = threading.Event()
+_sweeper_thread = None
+
+
+def init_storage(app):
+    """Carrega a configuração de armazenamento e inicia o sweeper em background"""
+    _settings['media_root'] = app.config.get('MEDIA_ROOT') or os.path.join(app.root_path, 'uploads')
+    _settings['delete_originals'] = app.config.get('STORAGE_DELETE_ORIGINALS', False)
+    _settings['variant_retention_hours'] = app.config.get('STORAGE_VARIANT_RETENTION_HOURS', 24)
+    _settings['quota_mb'] = app.config.get('STORAGE_QUOTA_MB', 0)
+    _settings['orphan_grace_minutes'] = app.config.get('STORAGE_ORPHAN_GRACE_MINUTES', 60)
+    _settings['cache_retention_hours'] = app.config.get('STORAGE_CACHE_RETENTION_HOURS', 168)
+    _settings['temp_retention_hours'] = app.config.get('STORAGE_TEMP_RETENTION_HOURS', 24)
+    _settings['sweep_interval'] = app.config.get('STORAGE_SWEEP_INTERVAL', 600)
+
+    if app.config.get('STORAGE_SWEEPER_ENABLED', True):
+        _start_sweeper(app)
+
+
+def _shard(key):
+    """Dois níveis de diretório (256 x 256) derivados do hash da chave"""
+    digest = hashlib.sha1(str(key).encode()).hexdigest()
+    return digest[:2], digest[2:4]
+
+
+def media_root():
+    return _settings['media_root']
+
+
+def original_path(filename):
+    """Caminho do arquivo original, distribuído em shards pelo nome"""
+    directory = os.path.join(_settings['media_root'], 'originals', *_shard(filename))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def temp_dir():
+    """Temporários grandes (ex.: zip recebido na ingestão) no mesmo volume da mídia"""
+    directory = os.path.join(_settings['media_root'], 'tmp')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def overlay_dir():
+    """Cache de overlays renderizados (marca d'água, textos), compartilhado entre vídeos"""
+    directory = os.path.join(_settings['media_root'], 'overlays')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _video_dir(video_id):
+    return os.path.join(_settings['media_root'], 'processed', *_shard(video_id), str(video_id))
+
+
+def processed_dir(video_id):
+    """Diretório dos cortes de um vídeo, distribuído em shards pelo ID"""
+    directory = _video_dir(video_id)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def processed_path(video_id, original_filename, variant):
+    base_name = secure_filename(os.path.splitext(original_filename)[0]) or 'video'
+    return os.path.join(processed_dir(video_id), f"{base_name}_{variant}.mp4")
+
+
+def schedule_deletion(paths):
+    """Enfileira arquivos para remoção pelo sweeper (fora da requisição)"""
+    paths = [p for p in paths if p]
+    if not paths:
+        return
+    with _deletion_lock:
+        _deletion_queue.extend(paths)
+    _wake_event.set()
+
+
+def wake_sweeper():
+    """Antecipa a próxima passada do sweeper (ex.: disco perto do limite)"""
+    _wake_event.set()
+
+
+def _file_info(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    # Volumes costumam ser montados com noatime; usa o mais recente entre atime e mtime
+    return {'size': stat.st_size, 'last_access': max(stat.st_atime, stat.st_mtime), 'mtime': stat.st_mtime}
+
+
+def disk_usage():
+    """Soma o espaço ocupado pelos arquivos de mídia"""
+    total = 0
+    files = 0
+    for root, _, names in os.walk(_settings['media_root']):
+        for name in names:
+            info = _file_info(os.path.join(root, name))
+            if info:
+                total += info['size']
+                files += 1
+    return {'bytes': total, 'files': files}
+
+
+def _action(path, reason, video_id=None, variant=None):
+    from src.services import media
+
+    # Referências do bucket: tamanho da cópia local ou do objeto remoto
+    info = media.stat(path) if media.is_remote(path) else _file_info(path)
+    if not info:
+        return None
+    return {
+        'path': path,
+        'bytes': info['size'],
+        'last_access': info['last_access'],
+        'reason': reason,
+        'video_id': video_id,
+        'variant': variant,
+    }
+
+
+def plan_sweep():
+    """Calcula o que o sweeper removeria agora, sem remover nada"""
+    from sqlalchemy import and_, case, func, or_
+    from src.models.user import db
+    from src.models.video import Video, PostingJob, VariantRender
+    from src.services import media
+    from src.services.render_queue import jit_enabled
+
+    actions = []
+    planned = set()
+
+    def add(action):
+        if action and action['path'] not in planned:
+            planned.add(action['path'])
+            actions.append(action)
+
+    with _deletion_lock:
+        queued = list(_deletion_queue)
+    for path in queued:
+        add(_action(path, 'deleted_video'))
+
+    videos = Video.query.all()
+
+    # Situação dos jobs agregada por arquivo, sem carregar o histórico inteiro
+    finished = or_(
+        PostingJob.status == 'completed',
+        and_(PostingJob.status == 'failed', PostingJob.retry_count >= PostingJob.max_retries)
+    )
+    jobs_by_path = {
+        row.path: row for row in db.session.query(
+            PostingJob.video_file_path.label('path'),
+            func.count().label('total'),
+            func.sum(case((PostingJob.status.in_(ACTIVE_JOB_STATUSES), 1), else_=0)).label('active'),
+            func.sum(case((finished, 1), else_=0)).label('finished'),
+            func.max(func.coalesce(PostingJob.completed_at, PostingJob.updated_at)).label('last_finished'),
+        ).group_by(PostingJob.video_file_path)
+    }
+
+    # Vídeos com variantes na fila ainda precisam do original
+    rendering = {
+        video_id for (video_id,) in db.session.query(VariantRender.video_id).filter(
+            VariantRender.status.in_(('pending', 'rendering'))
+        ).distinct()
+    }
+
+    referenced = set()
+    # Diretórios de vídeos em processamento: saídas e segmentos em andamento ainda sem referência
+    busy_dirs = []
+    evictable = []
+    # Sob demanda, o original é a fonte de toda renderização: das variantes que faltam, das que a
+    # retenção removeu (request_render renderiza de novo) e dos previews
+    jit = jit_enabled()
+    retention_cutoff = datetime.utcnow() - timedelta(hours=_settings['variant_retention_hours'])
+
+    for video in videos:
+        processed_files = json.loads(video.processed_files or '{}')
+        # Cópias locais de objetos do bucket são cache (despejo por LRU), não órfãos
+        referenced.add(os.path.abspath(media.cache_path(video.file_path)))
+        if video.subtitles_path:
+            referenced.add(os.path.abspath(media.cache_path(video.subtitles_path)))
+        referenced.update(os.path.abspath(media.cache_path(p)) for p in processed_files.values())
+        busy = video.processing_status in ('uploaded', 'processing') or video.id in rendering
+        if busy:
+            busy_dirs.append(os.path.abspath(_video_dir(video.id)) + os.sep)
+        needs_original = jit and (video.cut_vertical or video.cut_square or video.cut_horizontal)
+
+        # Original: pode sair depois do processamento concluído (sem JIT)
+        if not busy and not needs_original and processed_files:
+            if _settings['delete_originals']:
+                add(_action(video.file_path, 'original_processed', video.id))
+            else:
+                evictable.append((video.file_path, video.id, None))
+
+        for variant, path in processed_files.items():
+            jobs = jobs_by_path.get(path)
+            if jobs and jobs.active:
+                continue
+            if jobs and jobs.finished == jobs.total and jobs.last_finished <= retention_cutoff:
+                add(_action(path, 'jobs_completed', video.id, variant))
+            else:
+                evictable.append((path, video.id, variant))
+
+    # Arquivos sem nenhuma referência no banco (ex.: upload interrompido). Temporários e caches
+    # (overlays compartilhados, proxies de preview) não são órfãos: têm retenção própria
+    now = time.time()
+    grace = now - _settings['orphan_grace_minutes'] * 60
+    temp_cutoff = now - _settings['temp_retention_hours'] * 3600
+    cache_cutoff = now - _settings['cache_retention_hours'] * 3600
+    temp_root = os.path.abspath(os.path.join(_settings['media_root'], 'tmp')) + os.sep
+    overlay_root = os.path.abspath(os.path.join(_settings['media_root'], 'overlays')) + os.sep
+    for root, _, names in os.walk(_settings['media_root']):
+        for name in names:
+            path = os.path.join(root, name)
+            absolute = os.path.abspath(path)
+            if absolute in referenced or absolute.startswith(tuple(busy_dirs)):
+                continue
+            info = _file_info(path)
+            if not info:
+                continue
+            if absolute.startswith(temp_root):
+                expired, reason = info['mtime'] < temp_cutoff, 'temp_expired'
+            elif absolute.startswith(overlay_root) or name.endswith('_proxy.mp4'):
+                expired, reason = info['last_access'] < cache_cutoff, 'cache_expired'
+            else:
+                expired, reason = info['mtime'] < grace, 'orphan'
+            if expired:
+                add(_action(path, reason))
+
+    # Cota total: despeja por LRU o que não está em uso (objetos do bucket não ocupam este disco)
+    quota_bytes = _settings['quota_mb'] * 1024 * 1024
+    if quota_bytes:
+        usage = disk_usage()['bytes'] - sum(a['bytes'] for a in actions)
+        candidates = [
+            _action(path, 'quota_lru', video_id, variant)
+            for path, video_id, variant in evictable if not media.is_remote(path)
+        ]
+        for candidate in sorted(filter(None, candidates), key=lambda a: a['last_access']):
+            if usage <= quota_bytes:
+                break
+            if candidate['path'] not in planned:
+                add(candidate)
+                usage -= candidate['bytes']
+
+    return actions
+
+
+def _apply(actions):
+    """Remove os arquivos planejados e atualiza os registros dos vídeos"""
+    from src.models.user import db
+    from src.models.video import Video
+    from src.services import media
+
+    removed = []
+    for action in actions:
+        try:
+            media.delete(action['path'])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning('Erro ao remover %s: %s', action['path'], e)
+            continue
+        removed.append(action)
+
+        video = Video.query.get(action['video_id']) if action['video_id'] else None
+        if video and action['variant']:
+            processed_files = json.loads(video.processed_files or '{}')
+            processed_files.pop(action['variant'], None)
+            video.processed_files = json.dumps(processed_files)
+        elif video:
+            video.original_purged_at = datetime.utcnow()
+
+    db.session.commit()
+
+    removed_paths = {a['path'] for a in removed}
+    with _deletion_lock:
+        _deletion_queue[:] = [p for p in _deletion_queue if p not in removed_paths]
+
+    for action in removed:
+        _remove_empty_dirs(os.path.dirname(media.cache_path(action['path'])))
+    return removed
+
+
+def _remove_empty_dirs(directory):
+    root = os.path.abspath(_settings['media_root'])
+    directory = os.path.abspath(directory)
+    while directory.startswith(root) and directory != root:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def sweep(dry_run=False):
+    """Executa (ou simula) uma passada de limpeza e retorna o relatório"""
+    with _sweep_lock:
+        actions = plan_sweep()
+        if not dry_run:
+            actions = _apply(actions)
+
+    by_reason = {}
+    for action in actions:
+        summary = by_reason.setdefault(action['reason'], {'files': 0, 'bytes': 0})
+        summary['files'] += 1
+        summary['bytes'] += action['bytes']
+
+    return {
+        'dry_run': dry_run,
+        'usage': disk_usage(),
+        'quota_bytes': _settings['quota_mb'] * 1024 * 1024,
+        'freed_bytes': sum(a['bytes'] for a in actions),
+        'by_reason': by_reason,
+        'actions': actions,
+    }
+
+
+def _sweeper_loop(app):
+    while True:
+        _wake_event.wait(_settings['sweep_interval'])
+        _wake_event.clear()
+        try:
+            with app.app_context():
+                from src.models.schema import ensure_schema
+                ensure_schema()
+                report = sweep()
+            if report['actions']:
+                logger.info('Sweeper liberou %d bytes em %d arquivos', report['freed_bytes'], len(report['actions']))
+        except Exception as e:
+            logger.warning('Erro no sweeper de armazenamento: %s', e)
+
+
+def _start_sweeper(app):
+    global _sweeper_thread
+    if _sweeper_thread is None or not _sweeper_thread.is_alive():
+        _sweeper_thread = threading.Thread(target=_sweeper_loop, args=(app,), name='storage-sweeper', daemon=True)
+        _sweeper_thread.start()
@@ -0,0 +1,364 @@
+import argparse
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_FILE = os.path.join(os.path.dirname(__file__), '..', 'database', 'traces.jsonl')
+
+_settings = {
+    'exporter': os.environ.get('TRACE_EXPORTER', 'file'),  # file, otlp, none
+    'file_path': os.environ.get('TRACE_FILE', DEFAULT_TRACE_FILE),
+    # Rotação do arquivo: traces.jsonl passa a traces.jsonl.1 (até TRACE_BACKUPS cópias)
+    'max_bytes': int(os.environ.get('TRACE_MAX_BYTES', 50 * 1024 * 1024)),
+    'backups': int(os.environ.get('TRACE_BACKUPS', 2)),
+    'otlp_endpoint': os.environ.get('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces'),
+    'service_name': os.environ.get('TRACE_SERVICE_NAME', 'tiktok-automation'),
+}
+_file_lock = threading.Lock()
+_otlp_queue = queue.Queue(maxsize=10000)
+_otlp_thread = None
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def init_tracing(app):
+    """Carrega a configuração de exportação de traces do app"""
+    for key in _settings:
+        config_key = f'TRACE_{key.upper()}'
+        if app.config.get(config_key):
+            _settings[key] = app.config[config_key]
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def _new_span_id():
+    return uuid.uuid4().hex[:16]
+
+
+def _to_ns(value):
+    """Converte datetime (UTC ingênuo, como no banco) ou epoch em segundos para nanossegundos"""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1e9)
+    return int(value * 1e9)
+
+
+def record_span(name, trace_id, start, end, parent_id=None, **attributes):
+    """Registra um span com início e fim já conhecidos (ex.: tempo em fila)"""
+    if not trace_id or start is None or end is None or _settings['exporter'] == 'none':
+        return None
+
+    span = {
+        'trace_id': trace_id,
+        'span_id': _new_span_id(),
+        'parent_id': parent_id,
+        'name': name,
+        'start_ns': _to_ns(start),
+        'end_ns': _to_ns(end),
+        'status': attributes.pop('status', 'ok'),
+        'attributes': attributes,
+    }
+    _export(span)
+    return span
+
+
+@contextmanager
+def span(name, trace_id, **attributes):
+    """Mede um trecho do pipeline como span filho do span corrente do mesmo trace"""
+    if not trace_id or _settings['exporter'] == 'none':
+        yield None
+        return
+
+    parent = _current_span.get()
+    current = {
+        'trace_id': trace_id,
+        'span_id': _new_span_id(),
+        'parent_id': parent['span_id'] if parent and parent['trace_id'] == trace_id else None,
+        'name': name,
+        'start_ns': time.time_ns(),
+        'status': 'ok',
+        'attributes': dict(attributes),
+    }
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current['status'] = 'error'
+        current['attributes']['error'] = str(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current['end_ns'] = time.time_ns()
+        _export(current)
+
+
+def _rotate(path):
+    """traces.jsonl -> .1 -> .2 ...; a cópia mais antiga além de TRACE_BACKUPS é descartada"""
+    backups = _settings['backups']
+    if backups <= 0:
+        os.remove(path)
+        return
+    for n in range(backups - 1, 0, -1):
+        if os.path.exists(f'{path}.{n}'):
+            os.replace(f'{path}.{n}', f'{path}.{n + 1}')
+    os.replace(path, f'{path}.1')
+
+
+def _export(span_data):
+    try:
+        if _settings['exporter'] == 'file':
+            line = json.dumps(span_data)
+            path = _settings['file_path']
+            with _file_lock:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'a') as f:
+                    f.write(line + '\n')
+                    full = f.tell() >= _settings['max_bytes']
+                if full:
+                    _rotate(path)
+        elif _settings['exporter'] == 'otlp':
+            _start_otlp_thread()
+            _otlp_queue.put_nowait(span_data)
+    except queue.Full:
+        logger.warning('Fila de exportação de traces cheia; span descartado')
+    except Exception as e:
+        logger.warning('Erro ao exportar span: %s', e)
+
+
+def _to_otlp(spans):
+    """Monta o payload OTLP/HTTP JSON para um lote de spans"""
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {'key': key, 'value': {'boolValue': value}}
+        if isinstance(value, int):
+            return {'key': key, 'value': {'intValue': str(value)}}
+        if isinstance(value, float):
+            return {'key': key, 'value': {'doubleValue': value}}
+        return {'key': key, 'value': {'stringValue': str(value)}}
+
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [attribute('service.name', _settings['service_name'])]},
+            'scopeSpans': [{
+                'scope': {'name': 'src.services.tracing'},
+                'spans': [{
+                    'traceId': s['trace_id'],
+                    'spanId': s['span_id'],
+                    'parentSpanId': s['parent_id'] or '',
+                    'name': s['name'],
+                    'startTimeUnixNano': str(s['start_ns']),
+                    'endTimeUnixNano': str(s['end_ns']),
+                    'status': {'code': 2 if s['status'] == 'error' else 1},
+                    'attributes': [attribute(k, v) for k, v in s['attributes'].items()],
+                } for s in spans],
+            }],
+        }]
+    }
+
+
+def _from_otlp(payload):
+    """Converte um payload OTLP/HTTP JSON de volta para o formato de span local"""
+    spans = []
+    for resource_spans in payload.get('resourceSpans', []):
+        for scope_spans in resource_spans.get('scopeSpans', []):
+            for s in scope_spans.get('spans', []):
+                attributes = {}
+                for attr in s.get('attributes', []):
+                    value = attr.get('value', {})
+                    attributes[attr['key']] = next(iter(value.values()), None)
+                spans.append({
+                    'trace_id': s['traceId'],
+                    'span_id': s['spanId'],
+                    'parent_id': s.get('parentSpanId') or None,
+                    'name': s['name'],
+                    'start_ns': int(s['startTimeUnixNano']),
+                    'end_ns': int(s['endTimeUnixNano']),
+                    'status': 'error' if s.get('status', {}).get('code') == 2 else 'ok',
+                    'attributes': attributes,
+                })
+    return spans
+
+
+def _otlp_worker():
+    import urllib.request
+
+    while True:
+        batch = [_otlp_queue.get()]
+        # Agrupa o que chegar em seguida para reduzir o número de POSTs
+        deadline = time.monotonic() + 1.0
+        while len(batch) < 512 and time.monotonic() < deadline:
+            try:
+                batch.append(_otlp_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        try:
+            body = json.dumps(_to_otlp(batch)).encode()
+            req = urllib.request.Request(
+                _settings['otlp_endpoint'], data=body,
+                headers={'Content-Type': 'application/json'}, method='POST'
+            )
+            urllib.request.urlopen(req, timeout=5).close()
+        except Exception as e:
+            logger.warning('Erro ao enviar %d spans para o coletor OTLP: %s', len(batch), e)
+
+
+def _start_otlp_thread():
+    global _otlp_thread
+    if _otlp_thread is None or not _otlp_thread.is_alive():
+        _otlp_thread = threading.Thread(target=_otlp_worker, name='otlp-exporter', daemon=True)
+        _otlp_thread.start()
+
+
+def load_spans(trace_id, file_path=None):
+    """Lê do arquivo exportado (e das cópias rotacionadas) todos os spans de um trace"""
+    spans = []
+    path = file_path or _settings['file_path']
+    paths = [f'{path}.{n}' for n in range(_settings['backups'], 0, -1)] + [path]
+    for candidate in paths:
+        if not os.path.exists(candidate):
+            continue
+        with open(candidate) as f:
+            for line in f:
+                if trace_id in line:
+                    data = json.loads(line)
+                    if data['trace_id'] == trace_id:
+                        spans.append(data)
+    return spans
+
+
+def critical_path(spans):
+    """Calcula o caminho crítico de um trace.
+
+    Começa pelo span que termina por último e volta no tempo escolhendo, em
+    cada nível, o filho que terminou por último antes do ponto atual. O tempo
+    que nenhum filho cobre fica como tempo próprio do span (ou "idle" no topo).
+    Retorna uma lista de (nome, duração em ns).
+    """
+    if not spans:
+        return []
+
+    children = defaultdict(list)
+    ids = {s['span_id'] for s in spans}
+    for s in spans:
+        parent = s['parent_id'] if s['parent_id'] in ids else None
+        children[parent].append(s)
+
+    def walk(name, start_ns, end_ns, kids):
+        segments = []
+        cursor = end_ns
+        for child in sorted(kids, key=lambda s: s['end_ns'], reverse=True):
+            if child['end_ns'] > cursor or child['start_ns'] < start_ns:
+                continue
+            if cursor > child['end_ns']:
+                segments.append((name, cursor - child['end_ns']))
+            segments.extend(walk(
+                f"{child['name']}[{child['attributes']['variant']}]" if 'variant' in child['attributes'] else child['name'],
+                child['start_ns'], child['end_ns'], children[child['span_id']]
+            ))
+            cursor = child['start_ns']
+        if cursor > start_ns:
+            segments.append((name, cursor - start_ns))
+        return segments
+
+    roots = children[None]
+    trace_start = min(s['start_ns'] for s in roots)
+    trace_end = max(s['end_ns'] for s in roots)
+    return list(reversed(walk('idle', trace_start, trace_end, roots)))
+
+
+def format_critical_path(spans):
+    """Monta o relatório textual do caminho crítico, agregado por etapa"""
+    path = critical_path(spans)
+    total = sum(duration for _, duration in path)
+    if not total:
+        return 'Nenhum span encontrado'
+
+    totals = defaultdict(int)
+    for name, duration in path:
+        totals[name] += duration
+
+    lines = [f'Tempo total: {total / 1e9:.3f}s', f'{"etapa":<30} {"tempo (s)":>12} {"%":>7}']
+    for name, duration in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+        lines.append(f'{name:<30} {duration / 1e9:>12.3f} {100 * duration / total:>6.1f}%')
+    return '\n'.join(lines)
+
+
+def register_cli(app):
+    """Registra o comando `flask trace-report`"""
+    import click
+
+    @app.cli.command('trace-report')
+    @click.argument('video_id', type=int)
+    @click.option('--file', 'file_path', default=None, help='Arquivo de spans exportados')
+    def trace_report(video_id, file_path):
+        """Mostra o caminho crítico (upload → post) de um vídeo"""
+        from src.models.schema import ensure_schema
+        from src.models.video import Video
+
+        ensure_schema()
+        video = Video.query.get(video_id)
+        if not video or not video.trace_id:
+            click.echo(f'Vídeo {video_id} não encontrado ou sem trace')
+            return
+        click.echo(f'Vídeo {video_id} - trace {video.trace_id}')
+        click.echo(format_critical_path(load_spans(video.trace_id, file_path)))
+
+
+def _collector_handler(output_path):
+    """Handler HTTP do coletor local; importado só quando o coletor é executado"""
+    from http.server import BaseHTTPRequestHandler
+
+    class CollectorHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                spans = _from_otlp(json.loads(body))
+            except Exception as e:
+                self.send_response(400)
+                self.end_headers()
+                self.wfile.write(str(e).encode())
+                return
+
+            with open(output_path, 'a') as f:
+                for s in spans:
+                    f.write(json.dumps(s) + '\n')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, format, *args):
+            pass
+
+    return CollectorHandler
+
+
+def main():
+    """Coletor OTLP/HTTP JSON local, que grava os spans no formato lido pelo trace-report"""
+    parser = argparse.ArgumentParser(description='Coletor OTLP local para desenvolvimento')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4318)
+    parser.add_argument('--output', default=DEFAULT_TRACE_FILE)
+    args = parser.parse_args()
+
+    from http.server import HTTPServer
+
+    server = HTTPServer((args.host, args.port), _collector_handler(args.output))
+    print(f'Coletor OTLP em http://{args.host}:{args.port}/v1/traces -> {args.output}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
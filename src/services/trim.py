@@ -0,0 +1,160 @@
+import logging
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Cada janela de análise vira um nível de áudio (RMS) e um frame de movimento
+WINDOW_SECONDS = 0.2
+SAMPLE_RATE = 8000
+FRAME_WIDTH = 64
+FRAME_HEIGHT = 36
+# Janelas lidas do pipe por vez: a memória não cresce com a duração do vídeo
+READ_WINDOWS = 512
+# Atividade precisa durar ao menos isso (um clique ou um corte de cena isolado não conta)
+MIN_ACTIVE_WINDOWS = 2
+
+
+def _read_windows(process, window_bytes):
+    """Blocos do stdout do ffmpeg com um número inteiro de janelas (a sobra final é descartada)"""
+    try:
+        while True:
+            data = process.stdout.read(window_bytes * READ_WINDOWS)
+            usable = len(data) - len(data) % window_bytes
+            if usable:
+                yield data[:usable]
+            if len(data) < window_bytes * READ_WINDOWS:
+                break
+    finally:
+        process.stdout.close()
+        process.wait()
+
+
+def audio_levels(file_path):
+    """Nível RMS (dBFS) de cada janela, do PCM mono de 8 kHz lido em stream"""
+    import ffmpeg
+    import numpy as np
+
+    window = int(SAMPLE_RATE * WINDOW_SECONDS)
+    process = (
+        ffmpeg
+        .input(file_path)
+        .output('pipe:', format='s16le', acodec='pcm_s16le', ac=1, ar=SAMPLE_RATE, vn=None)
+        .global_args('-nostdin', '-loglevel', 'error')
+        .run_async(pipe_stdout=True)
+    )
+    levels = []
+    for data in _read_windows(process, window * 2):
+        samples = np.frombuffer(data, dtype='<i2').reshape(-1, window).astype(np.float32)
+        rms = np.sqrt(np.mean(samples * samples, axis=1))
+        levels.append(20 * np.log10(np.maximum(rms, 1.0) / 32768))
+    return np.concatenate(levels) if levels else np.empty(0, dtype=np.float32)
+
+
+def motion_energy(file_path, start, length):
+    """Diferença média de luma entre janelas consecutivas em [start, start + length].
+
+    O ffmpeg entrega um frame 64x36 em tons de cinza por janela; a diferença
+    é calculada em lote por bloco, levando o último frame para o bloco seguinte.
+    """
+    import ffmpeg
+    import numpy as np
+
+    frame_bytes = FRAME_WIDTH * FRAME_HEIGHT
+    process = (
+        ffmpeg
+        .input(file_path, ss=start, t=length)
+        .filter('fps', 1 / WINDOW_SECONDS)
+        .filter('scale', FRAME_WIDTH, FRAME_HEIGHT, flags='area')
+        .filter('format', 'gray')
+        .output('pipe:', format='rawvideo')
+        .global_args('-nostdin', '-loglevel', 'error')
+        .run_async(pipe_stdout=True)
+    )
+    energy = []
+    previous = None
+    for data in _read_windows(process, frame_bytes):
+        frames = np.frombuffer(data, dtype=np.uint8).reshape(-1, frame_bytes).astype(np.int16)
+        if previous is None:
+            # O primeiro frame não tem anterior: compara consigo mesmo (energia zero)
+            previous = frames[:1]
+        stacked = np.concatenate((previous, frames))
+        energy.append(np.abs(np.diff(stacked, axis=0)).mean(axis=1))
+        previous = frames[-1:]
+    return np.concatenate(energy) if energy else np.empty(0, dtype=np.float32)
+
+
+def _sustained(active):
+    """Mantém só as janelas em sequências de ao menos MIN_ACTIVE_WINDOWS ativas"""
+    import numpy as np
+
+    if len(active) < MIN_ACTIVE_WINDOWS:
+        return np.zeros(len(active), dtype=bool)
+    kernel = np.ones(MIN_ACTIVE_WINDOWS, dtype=int)
+    runs = np.convolve(active.astype(int), kernel, 'valid') == MIN_ACTIVE_WINDOWS
+    return np.convolve(runs.astype(int), kernel, 'full') > 0
+
+
+def _bounds(active, offset):
+    """(início, fim) em segundos das janelas ativas, ou None se nenhuma"""
+    import numpy as np
+
+    indexes = np.flatnonzero(active)
+    if not len(indexes):
+        return None
+    return offset + indexes[0] * WINDOW_SECONDS, offset + (indexes[-1] + 1) * WINDOW_SECONDS
+
+
+def _has_audio(file_path):
+    import ffmpeg
+
+    return bool(ffmpeg.probe(file_path, select_streams='a').get('streams'))
+
+
+def detect_active_range(file_path, duration):
+    """Trecho com som ou movimento, sem as pontas mudas e paradas: (início, fim) ou None.
+
+    O áudio é analisado inteiro (decodificar PCM é barato); o vídeo só nas
+    pontas em silêncio, que são as únicas onde o movimento muda o resultado.
+    None quando não há o que cortar (ou o corte é menor que TRIM_MIN_SECONDS).
+    """
+    import ffmpeg
+
+    config = current_app.config
+    silence_db = config.get('TRIM_SILENCE_DB', -45)
+    motion_threshold = config.get('TRIM_MOTION_THRESHOLD', 2.0)
+    padding = config.get('TRIM_PADDING_SECONDS', 0.3)
+    min_trim = config.get('TRIM_MIN_SECONDS', 1.0)
+    if not duration:
+        return None
+
+    try:
+        levels = audio_levels(file_path) if _has_audio(file_path) else None
+        audible = _bounds(_sustained(levels > silence_db), 0.0) if levels is not None else None
+
+        if audible is None:
+            # Sem som: só o movimento define o trecho
+            moving = motion_energy(file_path, 0.0, duration)
+            active = _bounds(_sustained(moving > motion_threshold), 0.0)
+            if active is None:
+                return None
+            start, end = active
+        else:
+            start, end = audible
+            if start > 0:
+                head = _bounds(_sustained(motion_energy(file_path, 0.0, start) > motion_threshold), 0.0)
+                if head is not None:
+                    start = head[0]
+            if end < duration:
+                tail = _bounds(_sustained(motion_energy(file_path, end, duration - end) > motion_threshold), end)
+                if tail is not None:
+                    end = tail[1]
+    except (OSError, ffmpeg.Error) as e:
+        logger.warning('Não foi possível analisar as pontas de %s: %s', file_path, e)
+        return None
+
+    start = max(0.0, start - padding)
+    end = min(duration, end + padding)
+    if start + (duration - end) < min_trim or end <= start:
+        return None
+    return round(float(start), 3), round(float(end), 3)
@@ -0,0 +1,156 @@
+"""Waker para scale-to-zero: acorda o app pouco antes do próximo trabalho vencer.
+
+Roda fora da máquina do app (processo `waker` no fly.toml, cron ou container
+à parte) e lê o estado que o app grava no drain e a cada WAKE_REFRESH_SECONDS
+(lifecycle.refresh_next_due): um arquivo local, uma URL http(s) ou
+s3://bucket/chave. Quando o vencimento chega, chama POST /api/jobs/process,
+o que religa a máquina pelo proxy e despacha os jobs; enquanto houver
+trabalho vencido, repete a cada --interval para a máquina não ser parada
+antes de terminar.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+# DON'T CHANGE THIS !!!
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+logger = logging.getLogger('waker')
+
+
+def _s3_backend():
+    from src.services.media import get_backend
+
+    env = os.environ.get
+    return get_backend({
+        'MEDIA_BACKEND': 's3',
+        'MEDIA_S3_ENDPOINT': env('MEDIA_S3_ENDPOINT') or env('AWS_ENDPOINT_URL_S3'),
+        'MEDIA_S3_BUCKET': env('MEDIA_S3_BUCKET') or env('BUCKET_NAME'),
+        'MEDIA_S3_REGION': env('MEDIA_S3_REGION') or env('AWS_REGION', 'us-east-1'),
+        'MEDIA_S3_ACCESS_KEY': env('MEDIA_S3_ACCESS_KEY') or env('AWS_ACCESS_KEY_ID'),
+        'MEDIA_S3_SECRET_KEY': env('MEDIA_S3_SECRET_KEY') or env('AWS_SECRET_ACCESS_KEY'),
+    })
+
+
+def default_source():
+    """WAKE_STATE_SOURCE; sem ele, o estado no bucket (MEDIA_BACKEND=s3) ou o arquivo local do app"""
+    if os.environ.get('WAKE_STATE_SOURCE'):
+        return os.environ['WAKE_STATE_SOURCE']
+    bucket = os.environ.get('MEDIA_S3_BUCKET') or os.environ.get('BUCKET_NAME')
+    if os.environ.get('MEDIA_BACKEND', 'local').lower() == 's3' and bucket:
+        from src.services.lifecycle import STATE_KEY
+        return f's3://{bucket}/{STATE_KEY}'
+    return os.environ.get('WAKE_STATE_FILE') or os.path.join(os.path.dirname(__file__), 'database', 'next_due.json')
+
+
+def read_state(source):
+    """Estado gravado pelo app ({'next_due': ISO UTC ou None, ...}), ou None se ainda não existe"""
+    if source.startswith('s3://'):
+        bucket, key = source[len('s3://'):].split('/', 1)
+        backend = _s3_backend()
+        if backend.head(bucket, key) is None:
+            return None
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state.json')
+            backend.get_file(bucket, key, path)
+            with open(path) as f:
+                return json.load(f)
+    if source.startswith(('http://', 'https://')):
+        try:
+            with urllib.request.urlopen(source, timeout=30) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+    if not os.path.exists(source):
+        return None
+    with open(source) as f:
+        return json.load(f)
+
+
+def next_due(state):
+    if not state or not state.get('next_due'):
+        return None
+    return datetime.fromisoformat(state['next_due'].rstrip('Z'))
+
+
+def wake(app_url):
+    """Chama o despacho (religa a máquina pelo proxy); 503 no drain é só 'tente de novo'"""
+    request = urllib.request.Request(
+        f"{app_url.rstrip('/')}/api/jobs/process", data=b'{}', method='POST',
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def run(args):
+    """Loop do waker; com --once, retorna o estado lido (None se não existe)"""
+    while True:
+        state = None
+        try:
+            state = read_state(args.state)
+            due = next_due(state)
+        except Exception as e:
+            logger.warning('Não foi possível ler o estado em %s: %s', args.state, e)
+            due = None
+            delay = args.interval
+        else:
+            now = datetime.utcnow()
+            if state is None:
+                # Sem estado não há como saber o próximo vencimento: avisa em vez de esperar calado
+                logger.warning('Estado não encontrado em %s; o app já gravou o próximo vencimento? '
+                               '(sem volume, use WAKE_STATE_SOURCE ou MEDIA_BACKEND=s3)', args.state)
+            if due is not None and due - timedelta(seconds=args.lead) <= now:
+                try:
+                    status, body = wake(args.app_url)
+                    logger.info('Acordou o app (vencimento %s): HTTP %s %s', due.isoformat(), status, body or '')
+                except Exception as e:
+                    logger.warning('Erro ao acordar o app: %s', e)
+                delay = args.interval
+            elif due is None:
+                delay = args.poll
+            else:
+                # O app pode agendar algo mais cedo: relê o estado a cada --poll
+                delay = min(args.poll, (due - now).total_seconds() - args.lead)
+        if args.once:
+            return state
+        time.sleep(max(1.0, delay))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Acorda o app quando o próximo trabalho vence')
+    parser.add_argument('--state', default=default_source(),
+                        help='arquivo, URL http(s) ou s3://bucket/chave com o estado gravado pelo app')
+    parser.add_argument('--app-url', default=os.environ.get('WAKE_APP_URL', 'http://localhost:5000'))
+    parser.add_argument('--lead', type=float, default=float(os.environ.get('WAKE_LEAD_SECONDS', 60)),
+                        help='segundos de antecedência (tempo de boot da máquina)')
+    parser.add_argument('--poll', type=float, default=float(os.environ.get('WAKE_POLL_SECONDS', 300)),
+                        help='intervalo máximo entre leituras do estado')
+    parser.add_argument('--interval', type=float, default=float(os.environ.get('WAKE_INTERVAL_SECONDS', 60)),
+                        help='intervalo entre chamadas enquanto houver trabalho vencido')
+    parser.add_argument('--once', action='store_true', help='uma verificação só (para cron)')
+    args = parser.parse_args(argv)
+    if not args.state.startswith(('s3://', 'http://', 'https://')) and \
+            not os.path.isdir(os.path.dirname(os.path.abspath(args.state))):
+        parser.error(f'diretório de {args.state} não existe: o waker precisa do volume do app, '
+                     f'de WAKE_STATE_SOURCE ou de MEDIA_BACKEND=s3')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if run(args) is None and args.once:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()